@@ -1,16 +1,35 @@
 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session, flash
+from flask import Flask, render_template, request, redirect, url_for, jsonify, session, flash, make_response, send_from_directory, Response
 from datetime import timedelta, datetime, time
 import psycopg2
 import psycopg2.extras
-from psycopg2.extras import RealDictCursor
 from functools import wraps
 from flask_socketio import SocketIO, join_room, leave_room, emit
 import os
+import time as time_module
 from werkzeug.utils import secure_filename
 import json
 import logging
+import threading
 from urllib.parse import urlparse
+from credentials import hash_password, verify_password, needs_rehash, upgrade_password
+import rate_limit
+import metrics
+import query_log
+import partitions
+import chat_protocol
+import signaling
+import call_quality
+import sync
+import records
+import search
+import i18n
+import template_cache
+import replicas
+import health
+import audit
+import prescription_pdf
+import presence
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -29,11 +48,33 @@ UPLOAD_FOLDER = 'static/uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'mp4', 'webm', 'ogg', 'mp3', 'wav', 'pdf', 'doc', 'docx', 'txt', 'zip', 'rar'}
 # Initialize SocketIO
-socketio = SocketIO(app, cors_allowed_origins="*")
+socketio = SocketIO(app, cors_allowed_origins="*",
+                    compression_threshold=chat_protocol.COMPRESSION_THRESHOLD)
+chat_protocol.init_app(socketio)
+signaling.init_app(socketio)
+call_quality.init_app(socketio)
+presence.init_app(socketio)
 
-# Create upload folder if it doesn't exist
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+# Per-route latency, DB time and SocketIO event metrics
+metrics.init_app(app)
+
+# Server-side translations in the user's preferred language
+i18n.init_app(app)
+
+# Template bytecode on disk, fragment/page caches and render-time metrics
+template_cache.init_app(app)
+
+# Read-only pages read from replicas when DATABASE_REPLICA_URLS is set
+replicas.init_app(app)
+
+@app.template_filter('filesize')
+def filesize_filter(value):
+    size = float(value or 0)
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
 
 @app.template_filter('fromjson')
 def fromjson_filter(value):
@@ -57,23 +98,43 @@ def login_required(f):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def rate_limited_response(template, retry_after):
+    """Render a form page with HTTP 429 when a rate limit is exceeded"""
+    flash(f'⚠️ Too many attempts. Please try again in {int(retry_after) + 1} seconds.', 'error')
+    response = make_response(render_template(template), 429)
+    response.headers['Retry-After'] = str(int(retry_after) + 1)
+    return response
+
+def open_connection(database_url):
+    # Connect with SSL requirement for Render (DATABASE_SSLMODE=disable for a local Postgres)
+    start = time_module.perf_counter()
+    conn = psycopg2.connect(
+        database_url,
+        cursor_factory=metrics.InstrumentedCursor,
+        sslmode=os.environ.get("DATABASE_SSLMODE", "require"),
+        connect_timeout=10
+    )
+    conn.autocommit = True
+    metrics.record_connect(time_module.perf_counter() - start)
+    return conn
+
+
 def get_db_connection():
     """Get PostgreSQL database connection for Render with proper error handling"""
     try:
+        # Read-only handlers go to a replica unless it lags or the user just wrote something
+        if replicas.wants_replica():
+            conn = replicas.connect(open_connection)
+            if conn:
+                return conn
+
         database_url = os.environ.get("DATABASE_URL")
         if not database_url:
             logger.error("❌ DATABASE_URL environment variable not set")
             return None
 
-        # Connect with SSL requirement for Render
-        conn = psycopg2.connect(
-            database_url,
-            cursor_factory=RealDictCursor,
-            sslmode="require",
-            connect_timeout=10
-        )
-        conn.autocommit = True
-        logger.info("✅ Database connection successful")
+        conn = open_connection(database_url)
+        logger.debug("✅ Database connection successful")
         return conn
     except psycopg2.OperationalError as e:
         logger.error(f"❌ PostgreSQL connection error: {e}")
@@ -82,6 +143,9 @@ def get_db_connection():
         logger.error(f"❌ Database connection error: {e}")
         return None
 
+# Access to patient data is queued in memory and written to audit_log in batches
+audit.init_app(get_db_connection)
+
 
 def init_database():
     """Initialize PostgreSQL database tables for Render"""
@@ -118,17 +182,8 @@ def init_database():
             )
         """)
         
-        # Create chat_messages table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS chat_messages (
-                id SERIAL PRIMARY KEY,
-                room VARCHAR(100) NOT NULL,
-                username VARCHAR(50) NOT NULL,
-                message TEXT NOT NULL,
-                media_url VARCHAR(255),
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
+        # Create chat_messages table (partitioned by month)
+        partitions.create_table(cursor, 'chat_messages')
         
         # Create health_records table
         cursor.execute("""
@@ -145,6 +200,9 @@ def init_database():
             )
         """)
         
+        # File metadata and the (patient_id, date DESC) listing index
+        records.ensure_schema(cursor)
+        
         # Create symptom_checker_history table
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS symptom_checker_history (
@@ -196,19 +254,8 @@ def init_database():
             )
         """)
         
-        # Create notifications table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS notifications (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                message TEXT NOT NULL,
-                type VARCHAR(30) DEFAULT 'general' CHECK (type IN ('appointment_approved', 'appointment_declined', 'appointment_reminder', 'prescription_ready', 'general', 'sos_alert')),
-                is_read BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
+        # Create notifications table (partitioned by month)
+        partitions.create_table(cursor, 'notifications')
         
         # Create sos_alerts table
         cursor.execute("""
@@ -250,14 +297,25 @@ def init_database():
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_doctor ON appointments(doctor_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_appointments_date ON appointments(appointment_date)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_room ON chat_messages(room)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_health_records_patient ON health_records(patient_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_prescriptions_patient ON prescriptions(patient_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_prescriptions_doctor ON prescriptions(doctor_id)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id)")
+
+        # Prescription updated_at (the PDF cache key), its trigger and the date index
+        prescription_pdf.ensure_schema(cursor)
+
+        # Change log behind the offline app's /api/sync
+        sync.create_schema(cursor)
+
+        # Full-text search columns and indexes for doctors
+        search.ensure_schema(cursor)
+
+        # Append-only log of access to patient data
+        audit.create_schema(cursor)
         
         # Insert sample data if no users exist
-        cursor.execute("SELECT COUNT(*) FROM users")
-        user_count = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) AS count FROM users")
+        user_count = cursor.fetchone()['count']
         
         if user_count == 0:
             # Insert sample doctors
@@ -305,20 +363,30 @@ def init_database():
             conn.close()
         return False
 
-# Initialize database on startup (only in development)
-# For production (Render), database should be initialized manually
-if os.environ.get('FLASK_ENV') == 'development':
-    try:
-        init_database()
-    except Exception as e:
-        logger.warning(f"Database initialization failed: {e}")
+# Importing the app opens no connections and starts no threads, so gunicorn can
+# preload it once and fork workers; each worker starts its own loops on first use
+_background_pid = None
+_background_lock = threading.Lock()
 
+@app.before_request
+def start_background_tasks():
+    """Keep next months' chat_messages/notifications partitions created and prune the sync log"""
+    global _background_pid
+    if _background_pid == os.getpid():
+        return
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+        if partitions.MAINTENANCE_INTERVAL > 0 and os.environ.get('DATABASE_URL'):
+            socketio.start_background_task(partitions.maintenance_loop, get_db_connection)
+            socketio.start_background_task(sync.prune_loop, get_db_connection)
 
 
 # Routes
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return template_cache.render_page('index.html')
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -326,6 +394,12 @@ def login():
         password = request.form.get('password')
         role = request.form.get('role')
 
+        ip = rate_limit.client_ip(request)
+        retry_after = max(rate_limit.check('login', ip=ip, username_ip=f"{username}@{ip}" if username else None),
+                          rate_limit.check('login_failure', cost=0, username=username))
+        if retry_after:
+            return rate_limited_response('login.html', retry_after)
+
         if not username or not password or not role:
             flash('⚠️ Please fill in all fields', 'error')
             return render_template('login.html')
@@ -340,10 +414,15 @@ def login():
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT * FROM users 
-                WHERE username = %s AND password = %s AND role = %s
-            """, (username, password, role))
+                WHERE username = %s AND role = %s
+            """, (username, role))
             
             user = cursor.fetchone()
+            # Unknown usernames are checked against a dummy hash so they take as long as real ones
+            if not verify_password(user['password'] if user else None, password):
+                user = None
+            if user and needs_rehash(user['password']):
+                upgrade_password(cursor, user['id'], password)
             cursor.close()
 
             if user:
@@ -352,6 +431,8 @@ def login():
                 session['username'] = user['username']
                 session['role'] = user['role']
                 session['name'] = user['name']
+                session['region'] = call_quality.region_for(user.get('pin_code'))
+                session['language'] = i18n.normalize(user.get('preferred_language')) or i18n.get_language()
 
                 # Redirect based on role
                 if role == 'patient':
@@ -364,6 +445,7 @@ def login():
                     flash('Unknown role selected', 'error')
                     return render_template('login.html')
             else:
+                rate_limit.check('login_failure', username=username)
                 flash('❌ Invalid credentials', 'error')
 
         except Exception as e:
@@ -374,7 +456,7 @@ def login():
             if conn:
                 conn.close()
 
-    return render_template('login.html')
+    return template_cache.render_page('login.html')
 
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -386,6 +468,13 @@ def register():
         name = request.form.get('name')
         email = request.form.get('email')
         mobile = request.form.get('mobile', '')
+        preferred_language = request.form.get('preferred_language')
+        if preferred_language not in i18n.PREFERENCE_CODES:
+            preferred_language = i18n.PREFERENCE_NAMES[i18n.get_language()]
+        
+        retry_after = rate_limit.check('register', ip=rate_limit.client_ip(request))
+        if retry_after:
+            return rate_limited_response('register.html', retry_after)
         
         if not all([username, password, role, name, email]):
             flash('Please fill in all required fields', 'error')
@@ -409,9 +498,9 @@ def register():
             
             # Insert new user
             cursor.execute("""
-                INSERT INTO users (username, password, role, name, email, mobile)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (username, password, role, name, email, mobile))
+                INSERT INTO users (username, password, role, name, email, mobile, preferred_language)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """, (username, hash_password(password), role, name, email, mobile, preferred_language))
             
             cursor.close()
             conn.close()
@@ -429,12 +518,42 @@ def register():
 
 @app.route('/logout')
 def logout():
+    language = session.get('language')
     session.clear()
+    if language:
+        session['language'] = language
     flash('You have been logged out', 'success')
-    return redirect(url_for('index'))
+    response = redirect(url_for('index'))
+    # Drop the offline copies of this patient's pages and records (shared phones)
+    response.headers['Clear-Site-Data'] = '"cache", "storage"'
+    return response
+
+@app.route('/set_language', methods=['POST'])
+def set_language():
+    language = i18n.normalize(request.form.get('language'))
+    if language:
+        session['language'] = language
+        if 'user_id' in session:
+            conn = get_db_connection()
+            if conn:
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute("UPDATE users SET preferred_language = %s WHERE id = %s",
+                                   (i18n.PREFERENCE_NAMES[language], session['user_id']))
+                    cursor.close()
+                except Exception as e:
+                    logger.error(f"Error saving preferred language: {e}")
+                finally:
+                    conn.close()
+    # Back to the page the switcher was on, but never off-site
+    target = urlparse(request.referrer or '')
+    if target.netloc != request.host or not target.path.startswith('/') or target.path.startswith('//'):
+        return redirect(url_for('index'))
+    return redirect(target.path + (f"?{target.query}" if target.query else ''))
 
 @app.route('/patient_dashboard')
 @login_required
+@replicas.read_only
 def patient_dashboard():
     if session.get('role') != 'patient':
         flash('Access denied', 'error')
@@ -516,6 +635,7 @@ def patient_dashboard():
 
 @app.route('/doctor_dashboard')
 @login_required
+@replicas.read_only
 def doctor_dashboard():
     if session.get('role') != 'doctor':
         flash('Access denied', 'error')
@@ -564,6 +684,8 @@ def doctor_dashboard():
         cursor.close()
         conn.close()
         
+        audit.record_many('view', 'appointments', [a['patient_id'] for a in pending_appointments + today_appointments])
+        audit.record_many('view', 'prescriptions', [p['patient_id'] for p in prescriptions])
         return render_template('doctor_dashboard.html',
                              pending_appointments=pending_appointments,
                              today_appointments=today_appointments,
@@ -578,6 +700,7 @@ def doctor_dashboard():
 
 @app.route('/pharmacy_dashboard')
 @login_required
+@replicas.read_only
 def pharmacy_dashboard():
     if session.get('role') != 'pharmacy':
         flash('Access denied', 'error')
@@ -614,6 +737,7 @@ def pharmacy_dashboard():
         cursor.close()
         conn.close()
         
+        audit.record_many('view', 'prescriptions', [p['patient_id'] for p in prescriptions])
         return render_template('pharmacy_dashboard.html',
                              medicines=medicines,
                              prescriptions=prescriptions)
@@ -627,6 +751,7 @@ def pharmacy_dashboard():
 
 @app.route('/book_appointment', methods=['GET', 'POST'])
 @login_required
+@replicas.read_only
 def book_appointment():
     if session.get('role') != 'patient':
         flash('Access denied', 'error')
@@ -657,6 +782,7 @@ def book_appointment():
             
             cursor.close()
             conn.close()
+            presence.queue_add(session['user_id'], int(doctor_id))
             
             flash('Appointment booked successfully!', 'success')
             return redirect(url_for('patient_appointments'))
@@ -691,6 +817,7 @@ def book_appointment():
 
 @app.route('/patient_appointments')
 @login_required
+@replicas.read_only
 def patient_appointments():
     if session.get('role') != 'patient':
         flash('Access denied', 'error')
@@ -720,6 +847,7 @@ def patient_appointments():
 
 @app.route('/doctor_appointments')
 @login_required
+@replicas.read_only
 def doctor_appointments():
     if session.get('role') != 'doctor':
         flash('Access denied', 'error')
@@ -740,6 +868,7 @@ def doctor_appointments():
             appointments = cursor.fetchall()
             cursor.close()
             conn.close()
+            audit.record_many('view', 'appointments', [a['patient_id'] for a in appointments])
         except Exception as e:
             logger.error(f"Error fetching appointments: {e}")
             if conn:
@@ -749,29 +878,41 @@ def doctor_appointments():
 
 @app.route('/about')
 def about():
-    return render_template('about.html')
+    return template_cache.render_page('about.html')
+
+@app.route('/healthz')
+def liveness_check():
+    """Liveness probe: the worker is up (no database or template work)"""
+    return 'ok', 200, {'Content-Type': 'text/plain', 'Cache-Control': 'no-store'}
 
 @app.route('/health')
+@app.route('/readyz')
 def health_check():
-    """Health check endpoint for Render"""
-    try:
-        conn = get_db_connection()
-        if not conn:
-            return jsonify({'status': 'error', 'message': 'Database connection failed'}), 500
-        
-        cursor = conn.cursor()
-        cursor.execute("SELECT 1")
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-        
-        if result:
-            return jsonify({'status': 'healthy', 'database': 'connected'})
-        else:
-            return jsonify({'status': 'error', 'message': 'Database query failed'}), 500
-    except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    """Readiness probe: database reachable, over a kept-open connection with a cached result"""
+    ready, message = health.readiness(open_connection)
+    if ready:
+        return jsonify({'status': 'healthy', 'database': message})
+    return jsonify({'status': 'error', 'message': message}), 503
+
+def metrics_authorized():
+    """Metrics endpoints require a bearer token when METRICS_TOKEN is set"""
+    token = os.environ.get('METRICS_TOKEN')
+    return not token or request.headers.get('Authorization') == f'Bearer {token}'
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint; set METRICS_TOKEN to require a bearer token"""
+    if not metrics_authorized():
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/metrics/queries')
+def query_stats_endpoint():
+    """Per-shape SQL statistics, most expensive first"""
+    if not metrics_authorized():
+        return jsonify({'status': 'error', 'message': 'Unauthorized'}), 401
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'queries': query_log.snapshot(limit)})
 
 @app.route('/init_db')
 def init_db():
@@ -842,18 +983,10 @@ def init_db():
             )
         """)
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS notifications (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                message TEXT NOT NULL,
-                type VARCHAR(30) DEFAULT 'general',
-                is_read BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        """)
+        prescription_pdf.ensure_schema(cursor)
+        partitions.create_table(cursor, 'notifications')
+        sync.create_schema(cursor)
+        audit.create_schema(cursor)
 
         # Insert test users if they don't exist
         cursor.execute("""
@@ -885,6 +1018,7 @@ def init_db():
 
 @app.route('/profile')
 @login_required
+@replicas.read_only
 def profile():
     conn = get_db_connection()
     user_data = {}
@@ -912,23 +1046,65 @@ def internal_error(error):
     return render_template('500.html'), 500
 
 # SocketIO events for chat functionality
+@socketio.on('connect')
+@metrics.track_event('connect')
+def on_connect(auth=None):
+    user_id = session.get('user_id')
+    if not user_id:
+        return
+    doctors = []
+    if session.get('role') == 'patient':
+        conn = get_db_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                doctors = presence.queue_doctors(cursor, user_id)
+                cursor.close()
+            except Exception as e:
+                logger.warning(f"Could not load queue for patient {user_id}: {e}")
+            finally:
+                conn.close()
+    join_room(presence.user_room(user_id))
+    presence.connect(request.sid, user_id, session.get('username'), session.get('name'), session.get('role'), doctors)
+
+@socketio.on('disconnect')
+def on_disconnect():
+    signaling.disconnected(request.sid)
+    presence.disconnect(request.sid)
+    chat_protocol.forget(request.sid)
+
 @socketio.on('join')
+@metrics.track_event('join')
 def on_join(data):
     username = session.get('username')
     room = data['room']
     if username:
-        join_room(room)
-        emit('status', {'msg': f'{username} has entered the room.'}, room=room)
+        # Clients opt into the compact protocol with {"protocol": {"compact": true}}
+        if 'protocol' in data:
+            chat_protocol.set_mode(request.sid, data['protocol'])
+        join_room(chat_protocol.join(request.sid, room))
+        presence.join(request.sid, room)
+        emit('presence', {'room': room, 'online': presence.room_online(room), 'joined': [], 'left': []})
+        audit.record('join', 'chat', resource_id=room)
 
 @socketio.on('leave')
+@metrics.track_event('leave')
 def on_leave(data):
     username = session.get('username')
     room = data['room']
     if username:
-        leave_room(room)
-        emit('status', {'msg': f'{username} has left the room.'}, room=room)
+        leave_room(chat_protocol.leave(request.sid, room))
+        presence.leave(request.sid, room)
+
+@socketio.on('typing')
+@metrics.track_event('typing')
+def on_typing(data):
+    """Typing indicator; clients send it while typing and once with false when they stop"""
+    if isinstance(data, dict) and data.get('room'):
+        presence.typing(request.sid, data['room'], bool(data.get('typing')))
 
 @socketio.on('message')
+@metrics.track_event('message')
 def handle_message(data):
     username = session.get('username')
     room = data['room']
@@ -951,14 +1127,405 @@ def handle_message(data):
                 if conn:
                     conn.close()
         
-        # Emit message to room
-        emit('message', {
-            'username': username,
-            'message': message,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }, room=room)
+        # Emit message to room (batched for compact-protocol clients)
+        presence.typing(request.sid, room, False)
+        chat_protocol.publish('message', room, username, message)
+
+# WebRTC signaling, relayed only to the other participant of the call
+def signaling_sender(data):
+    """Username of a client allowed to signal in data['room'], or None"""
+    username = session.get('username')
+    room = data.get('room') if isinstance(data, dict) else None
+    if username and room and request.sid in chat_protocol.participants(room):
+        return username
+    return None
+
+@socketio.on('video_call_offer')
+@metrics.track_event('video_call_offer')
+def on_video_call_offer(data):
+    username = signaling_sender(data)
+    if username:
+        signaling.offer(data['room'], username, request.sid, data)
+
+@socketio.on('video_call_answer')
+@metrics.track_event('video_call_answer')
+def on_video_call_answer(data):
+    username = signaling_sender(data)
+    if username:
+        signaling.answer(data['room'], username, request.sid, data)
+
+@socketio.on('ice_candidate')
+@metrics.track_event('ice_candidate')
+def on_ice_candidate(data):
+    username = signaling_sender(data)
+    if username:
+        signaling.candidate(data['room'], username, request.sid, data)
+
+@socketio.on('end_call')
+@metrics.track_event('end_call')
+def on_end_call(data):
+    username = signaling_sender(data)
+    if username:
+        signaling.hang_up(data['room'], username, request.sid, data)
+
+@socketio.on('decline_call')
+@metrics.track_event('decline_call')
+def on_decline_call(data):
+    username = signaling_sender(data)
+    if username:
+        signaling.hang_up(data['room'], username, request.sid, data, declined=True)
+
+@socketio.on('call_stats')
+@metrics.track_event('call_stats')
+def on_call_stats(data):
+    username = signaling_sender(data)
+    if username:
+        call_quality.report(data['room'], request.sid, session.get('region', 'unknown'), data)
+
+@app.route('/patient/records')
+@login_required
+@replicas.read_only
+def patient_records():
+    if session.get('role') != 'patient':
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+
+    conn = get_db_connection()
+    health_records = []
+    if conn:
+        try:
+            cursor = conn.cursor()
+            health_records = records.list_records(cursor, session['user_id'])
+            cursor.close()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error fetching health records: {e}")
+            if conn:
+                conn.close()
+
+    return render_template('patient_records.html', records=health_records)
+
+@app.route('/upload_record', methods=['POST'])
+@login_required
+def upload_record():
+    if session.get('role') != 'patient':
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+
+    upload = request.files.get('file')
+    record_type = request.form.get('record_type', '').strip()
+    if not upload or not upload.filename or not record_type:
+        flash('⚠️ Please choose a file and a record type', 'error')
+        return redirect(url_for('patient_records'))
+    if not records.allowed(upload.filename):
+        flash('⚠️ Only PDF, PNG and JPG files are allowed', 'error')
+        return redirect(url_for('patient_records'))
+
+    conn = get_db_connection()
+    if not conn:
+        flash('❌ Database connection error', 'error')
+        return redirect(url_for('patient_records'))
+    try:
+        cursor = conn.cursor()
+        records.save_upload(cursor, session['user_id'], None, record_type,
+                            request.form.get('description', '').strip() or None, upload)
+        cursor.close()
+        flash('✅ Record uploaded', 'success')
+    except Exception as e:
+        logger.error(f"Error saving health record: {e}")
+        flash('❌ Could not save the record', 'error')
+    finally:
+        conn.close()
+    return redirect(url_for('patient_records'))
+
+@app.route('/doctor/records/<int:patient_id>')
+@login_required
+@replicas.read_only
+def doctor_patient_records(patient_id):
+    if session.get('role') != 'doctor':
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+
+    conn = get_db_connection()
+    if not conn:
+        flash('❌ Database connection error', 'error')
+        return redirect(url_for('doctor_dashboard'))
+    try:
+        cursor = conn.cursor()
+        if not records.can_access(cursor, session['user_id'], 'doctor', patient_id):
+            flash('Access denied', 'error')
+            return redirect(url_for('doctor_dashboard'))
+        cursor.execute("SELECT id, name, username FROM users WHERE id = %s", (patient_id,))
+        patient = cursor.fetchone()
+        health_records = records.list_records(cursor, patient_id)
+        cursor.close()
+    except Exception as e:
+        logger.error(f"Error fetching patient records: {e}")
+        flash('⚠️ Could not load patient records', 'error')
+        return redirect(url_for('doctor_dashboard'))
+    finally:
+        conn.close()
+
+    audit.record('view', 'health_records', patient_id)
+    return render_template('doctor_records.html', patient=patient, records=health_records)
+
+@app.route('/records/<int:record_id>/file')
+@login_required
+def health_record_file(record_id):
+    """Stream one health record file (Range requests supported)"""
+    conn = get_db_connection()
+    if not conn:
+        return "Database connection error", 503
+    try:
+        cursor = conn.cursor()
+        record = records.get_record(cursor, record_id)
+        allowed = record and records.can_access(cursor, session['user_id'], session.get('role'), record['patient_id'])
+        cursor.close()
+    finally:
+        conn.close()
+    if not allowed:
+        return "Record not found", 404
+
+    response = records.send_record(record, as_attachment=request.args.get('download') == '1')
+    if response is None:
+        logger.warning(f"Health record {record_id} file missing: {record['file_path']}")
+        return "Record file not found", 404
+    audit.record('download' if request.args.get('download') == '1' else 'view', 'health_record',
+                 record['patient_id'], record_id)
+    return response
+
+@app.route('/patients/<int:patient_id>/records.zip')
+@login_required
+def health_records_zip(patient_id):
+    """A patient's complete record as a ZIP streamed on the fly"""
+    conn = get_db_connection()
+    if not conn:
+        return "Database connection error", 503
+    try:
+        cursor = conn.cursor()
+        if not records.can_access(cursor, session['user_id'], session.get('role'), patient_id):
+            return "Records not found", 404
+        health_records = records.list_records(cursor, patient_id)
+        cursor.close()
+    finally:
+        conn.close()
+
+    audit.record('export', 'health_records', patient_id)
+    # The connection is released before streaming; only file handles stay open
+    response = Response(records.zip_stream(health_records), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="health_records_{patient_id}.zip"'
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+@app.route('/prescriptions/<int:prescription_id>.pdf')
+@login_required
+@replicas.read_only
+def prescription_pdf_file(prescription_id):
+    """A printable prescription, rendered on the PDF worker pool and cached until it changes"""
+    conn = get_db_connection()
+    if not conn:
+        return "Database connection error", 503
+    try:
+        cursor = conn.cursor()
+        prescription = prescription_pdf.get_prescription(cursor, prescription_id)
+        cursor.close()
+    finally:
+        conn.close()
+    if not prescription or not prescription_pdf.can_access(session['user_id'], session.get('role'), prescription):
+        return "Prescription not found", 404
+
+    audit.record('download', 'prescription', prescription['patient_id'], prescription_id)
+    etag = prescription_pdf.etag(prescription)
+    headers = {'Cache-Control': 'private, no-cache',
+               'Content-Disposition': f'inline; filename="{prescription_pdf.filename(prescription)}"'}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    future = prescription_pdf.submit(prescription)
+    try:
+        pdf = future.result(timeout=prescription_pdf.RENDER_TIMEOUT) if future else None
+    except Exception as e:
+        logger.error(f"Prescription {prescription_id} PDF error: {e}")
+        return "Could not render prescription", 500
+    if pdf is None:
+        return "Prescription printing is busy, please retry", 503, {'Retry-After': '2'}
+    response = Response(pdf, mimetype='application/pdf', headers=headers)
+    response.set_etag(etag)
+    return response
+
+@app.route('/pharmacy/prescriptions.zip')
+@login_required
+@replicas.read_only
+def pharmacy_prescriptions_zip():
+    """One day's prescriptions (?date=YYYY-MM-DD, default today) as a ZIP of PDFs, streamed as they render"""
+    if session.get('role') != 'pharmacy':
+        return "Access denied", 403
+    try:
+        day = datetime.strptime(request.args.get('date') or datetime.now().strftime('%Y-%m-%d'), '%Y-%m-%d').date()
+    except ValueError:
+        return "date must be YYYY-MM-DD", 400
+    conn = get_db_connection()
+    if not conn:
+        return "Database connection error", 503
+    try:
+        cursor = conn.cursor()
+        prescriptions = prescription_pdf.list_for_day(cursor, day)
+        cursor.close()
+    finally:
+        conn.close()
+
+    audit.record_many('export', 'prescriptions', [p['patient_id'] for p in prescriptions])
+    # The connection is released before streaming; rendering happens on the PDF pool
+    response = Response(prescription_pdf.zip_stream(prescriptions), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="prescriptions_{day.isoformat()}.zip"'
+    response.headers['Cache-Control'] = 'private, no-store'
+    return response
+
+@app.route('/api/patients')
+@login_required
+@replicas.read_only
+def api_patients():
+    """The doctor's patients, filtered by name or username as they type"""
+    if session.get('role') != 'doctor':
+        return jsonify({'error': 'Access denied'}), 403
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection error'}), 503
+    try:
+        cursor = conn.cursor()
+        result = search.search_patients(cursor, session['user_id'], request.args.get('q', ''),
+                                        request.args.get('page', 1, type=int))
+        cursor.close()
+        return jsonify(result['results'])
+    except Exception as e:
+        logger.error(f"Patient search error: {e}")
+        return jsonify({'error': 'Search failed'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/queue/online')
+@login_required
+def api_queue_online():
+    """Patients waiting for the logged-in doctor who are connected right now"""
+    if session.get('role') != 'doctor':
+        return jsonify({'error': 'Access denied'}), 403
+    patients = presence.queue_online(session['user_id'])
+    return jsonify({'count': len(patients), 'patients': patients})
+
+@app.route('/api/search')
+@login_required
+@replicas.read_only
+def api_search():
+    """Ranked, paginated search over the doctor's prescriptions and chat history"""
+    if session.get('role') != 'doctor':
+        return jsonify({'error': 'Access denied'}), 403
+    text = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'messages')
+    if not text or scope not in ('messages', 'prescriptions', 'patients'):
+        return jsonify({'error': 'Provide q and a scope of messages, prescriptions or patients'}), 400
+    page = request.args.get('page', 1, type=int)
+    page_size = request.args.get('page_size', search.PAGE_SIZE, type=int)
+    patient_id = request.args.get('patient_id', type=int)
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection error'}), 503
+    try:
+        cursor = conn.cursor()
+        if scope == 'patients':
+            result = search.search_patients(cursor, session['user_id'], text, page, page_size)
+        elif scope == 'prescriptions':
+            result = search.search_prescriptions(cursor, session['user_id'], text, patient_id, page, page_size)
+            audit.record_many('search', 'prescriptions', [r['patient_id'] for r in result['results']])
+        else:
+            patient_username = None
+            if patient_id:
+                cursor.execute("SELECT username FROM users WHERE id = %s", (patient_id,))
+                row = cursor.fetchone()
+                if not row:
+                    return jsonify({'results': [], 'page': page, 'has_more': False})
+                patient_username = row['username']
+            result = search.search_messages(cursor, session['username'], text, patient_username, page, page_size)
+            for room in dict.fromkeys(r['room'] for r in result['results']):
+                audit.record('search', 'chat', patient_id, room)
+        cursor.close()
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Search error: {e}")
+        return jsonify({'error': 'Search failed'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/sync')
+@login_required
+def api_sync():
+    """Records changed since the client's version token, for the offline patient app"""
+    if session.get('role') != 'patient':
+        return jsonify({'error': 'Access denied'}), 403
+    entities = request.args.get('tables')
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection error'}), 503
+    try:
+        cursor = conn.cursor()
+        result = sync.changes(cursor, session['user_id'], request.args.get('since'),
+                              entities.split(',') if entities else None)
+        cursor.close()
+        response = jsonify(result)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    except Exception as e:
+        logger.error(f"Sync error: {e}")
+        return jsonify({'error': 'Sync failed'}), 500
+    finally:
+        conn.close()
+
+@app.route('/api/audit')
+@login_required
+def api_audit():
+    """Who accessed the logged-in patient's data, newest first (?since=&until= ISO dates)"""
+    if session.get('role') != 'patient':
+        return jsonify({'error': 'Access denied'}), 403
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({'error': 'Database connection error'}), 503
+    try:
+        cursor = conn.cursor()
+        events = audit.query(cursor, session['user_id'], request.args.get('since') or None,
+                             request.args.get('until') or None, min(request.args.get('limit', 200, type=int), 1000))
+        cursor.close()
+        return jsonify([dict(e, at=e['at'].isoformat()) for e in events])
+    except psycopg2.DataError:
+        return jsonify({'error': 'since and until must be ISO dates'}), 400
+    except Exception as e:
+        logger.error(f"Audit query error: {e}")
+        return jsonify({'error': 'Could not load access history'}), 500
+    finally:
+        conn.close()
+
+@app.route('/sw.js')
+def service_worker():
+    """Offline service worker, served from the root so it can control every page"""
+    response = send_from_directory(app.static_folder, 'sw.js', max_age=0)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/ice_servers')
+@login_required
+def api_ice_servers():
+    """ICE server configuration for RTCPeerConnection, with short-lived TURN credentials"""
+    return jsonify({'iceServers': signaling.ice_servers(session['username'])})
 
 if __name__ == '__main__':
+    # Create the tables when running the development server (production uses scripts/init_db.py)
+    if os.environ.get('FLASK_ENV') == 'development':
+        try:
+            init_database()
+        except Exception as e:
+            logger.warning(f"Database initialization failed: {e}")
+
     port = int(os.environ.get('PORT', 5000))
     if os.environ.get('FLASK_ENV') == 'production':
         # Production mode - use socketio for production
@@ -0,0 +1,239 @@
+"""
+Append-only audit log of access to patient health data.
+
+Route and socket handlers call record() when a doctor or pharmacy reads a
+patient's appointments, prescriptions, health records or chat. Events go
+into an in-memory ring buffer. A background thread writes them to
+audit_log in batches with COPY every AUDIT_FLUSH_INTERVAL seconds, or as
+soon as AUDIT_BATCH_SIZE events are waiting. Requests never wait for the
+database. If the database is down the buffer keeps up to
+AUDIT_BUFFER_SIZE events; past that the oldest are dropped and counted
+in the log.
+
+audit_log rejects UPDATE, DELETE and TRUNCATE. It is indexed by patient,
+actor and resource together with time, so a patient's access history
+over a date range is one index scan (query(), /api/audit and
+scripts/audit_log.py).
+"""
+
+import atexit
+import csv
+import io
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from flask import has_request_context, request, session
+
+import metrics
+import rate_limit
+
+logger = logging.getLogger(__name__)
+
+BUFFER_SIZE = int(os.environ.get('AUDIT_BUFFER_SIZE', 100000))
+BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 500))
+FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1.0))
+MAX_RETRY_DELAY = 30.0
+
+COLUMNS = ('at', 'actor_id', 'actor_role', 'action', 'resource', 'resource_id', 'patient_id', 'ip')
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS audit_log (
+        id BIGSERIAL PRIMARY KEY,
+        at TIMESTAMPTZ NOT NULL,
+        actor_id INTEGER,
+        actor_role VARCHAR(20),
+        action VARCHAR(20) NOT NULL,
+        resource VARCHAR(30) NOT NULL,
+        resource_id VARCHAR(100),
+        patient_id INTEGER,
+        ip VARCHAR(64)
+    );
+    CREATE INDEX IF NOT EXISTS idx_audit_log_patient_at ON audit_log (patient_id, at);
+    CREATE INDEX IF NOT EXISTS idx_audit_log_actor_at ON audit_log (actor_id, at);
+    CREATE INDEX IF NOT EXISTS idx_audit_log_resource_at ON audit_log (resource, resource_id, at);
+
+    CREATE OR REPLACE FUNCTION audit_log_append_only() RETURNS trigger AS $$
+    BEGIN
+        RAISE EXCEPTION 'audit_log is append-only';
+    END;
+    $$ LANGUAGE plpgsql;
+    DROP TRIGGER IF EXISTS audit_log_no_change ON audit_log;
+    CREATE TRIGGER audit_log_no_change BEFORE UPDATE OR DELETE ON audit_log
+    FOR EACH ROW EXECUTE PROCEDURE audit_log_append_only();
+    DROP TRIGGER IF EXISTS audit_log_no_truncate ON audit_log;
+    CREATE TRIGGER audit_log_no_truncate BEFORE TRUNCATE ON audit_log
+    FOR EACH STATEMENT EXECUTE PROCEDURE audit_log_append_only();
+"""
+
+_buffer = deque(maxlen=BUFFER_SIZE)
+_lock = threading.Lock()
+_wake = threading.Event()
+_dropped = 0
+_get_connection = None
+_thread_pid = None
+
+
+def create_schema(cursor):
+    cursor.execute(SCHEMA)
+
+
+def record(action, resource, patient_id=None, resource_id=None):
+    """Queue one access event by the current user; a patient reading their own data is not recorded"""
+    if not has_request_context():
+        return
+    actor_id, role = session.get('user_id'), session.get('role')
+    if role == 'patient' and (patient_id is None or patient_id == actor_id):
+        return
+    event = (datetime.now(timezone.utc), actor_id, role, action, resource,
+             None if resource_id is None else str(resource_id), patient_id, rate_limit.client_ip(request))
+    _append([event])
+
+
+def record_many(action, resource, patient_ids):
+    """One event per distinct patient shown by a list view"""
+    for patient_id in dict.fromkeys(p for p in patient_ids if p is not None):
+        record(action, resource, patient_id)
+
+
+def _append(events):
+    global _dropped
+    _ensure_thread()
+    with _lock:
+        overflow = len(_buffer) + len(events) - BUFFER_SIZE
+        if overflow > 0:
+            _dropped += overflow
+        _buffer.extend(events)
+        waiting = len(_buffer)
+    if overflow > 0:
+        logger.warning(f"⚠️ Audit buffer full, dropped {overflow} oldest events ({_dropped} in total)")
+    if waiting >= BATCH_SIZE:
+        _wake.set()
+
+
+def _take(limit):
+    with _lock:
+        return [_buffer.popleft() for _ in range(min(limit, len(_buffer)))]
+
+
+def _requeue(events):
+    # Put a failed batch back in front, in order, without overflowing the buffer
+    with _lock:
+        room = BUFFER_SIZE - len(_buffer)
+        _buffer.extendleft(reversed(events[:max(room, 0)]))
+
+
+def _copy(conn, events):
+    data = io.StringIO()
+    writer = csv.writer(data)
+    for event in events:
+        writer.writerow(['' if value is None else value.isoformat() if isinstance(value, datetime) else value
+                         for value in event])
+    data.seek(0)
+    cursor = conn.cursor()
+    try:
+        cursor.copy_expert(f"COPY audit_log ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)", data)
+    finally:
+        cursor.close()
+
+
+def flush(conn=None):
+    """Write everything buffered so far; returns the number of events written"""
+    written = 0
+    own = conn is None
+    if own:
+        conn = _get_connection() if _get_connection else None
+        if not conn:
+            return 0
+    try:
+        while True:
+            events = _take(BATCH_SIZE)
+            if not events:
+                break
+            start = time.perf_counter()
+            try:
+                _copy(conn, events)
+            except Exception:
+                _requeue(events)
+                raise
+            metrics.AUDIT_FLUSH_TIME.observe((), time.perf_counter() - start)
+            metrics.AUDIT_FLUSH_ROWS.observe((), len(events))
+            written += len(events)
+    finally:
+        if own:
+            conn.close()
+    return written
+
+
+def _flush_loop():
+    conn = None
+    delay = FLUSH_INTERVAL
+    while True:
+        _wake.wait(delay)
+        _wake.clear()
+        if not _buffer:
+            continue
+        try:
+            if conn is None or conn.closed:
+                conn = _get_connection()
+                if not conn:
+                    raise RuntimeError('no database connection')
+            flush(conn)
+            delay = FLUSH_INTERVAL
+        except Exception as e:
+            logger.warning(f"⚠️ Audit flush failed, {len(_buffer)} events kept for retry: {e}")
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+
+def _ensure_thread():
+    global _thread_pid
+    # Started lazily in each process, after any preload fork
+    if _thread_pid == os.getpid() or _get_connection is None:
+        return
+    with _lock:
+        if _thread_pid == os.getpid():
+            return
+        _thread_pid = os.getpid()
+    threading.Thread(target=_flush_loop, name='audit-flush', daemon=True).start()
+
+
+def _flush_at_exit():
+    if _buffer and _thread_pid == os.getpid():
+        try:
+            flush()
+        except Exception as e:
+            logger.error(f"❌ {len(_buffer)} audit events lost at shutdown: {e}")
+
+
+def query(cursor, patient_id, since=None, until=None, limit=200):
+    """Access events for a patient's data (including their chat rooms), newest first"""
+    cursor.execute("""
+        SELECT l.at, l.actor_id, u.name AS actor_name, l.actor_role, l.action, l.resource, l.resource_id, l.ip
+        FROM audit_log l
+        LEFT JOIN users u ON u.id = l.actor_id
+        WHERE (l.patient_id = %s
+               OR (l.resource = 'chat' AND l.resource_id IN (
+                   SELECT m.room FROM chat_room_members m JOIN users p ON p.username = m.username
+                   WHERE p.id = %s)))
+          AND (%s::TIMESTAMPTZ IS NULL OR l.at >= %s::TIMESTAMPTZ)
+          AND (%s::TIMESTAMPTZ IS NULL OR l.at < %s::TIMESTAMPTZ)
+        ORDER BY l.at DESC
+        LIMIT %s
+    """, (patient_id, patient_id, since, since, until, until, limit))
+    return cursor.fetchall()
+
+
+def init_app(get_connection):
+    """Use get_connection() (primary database) for the flush thread"""
+    global _get_connection
+    _get_connection = get_connection
+    atexit.register(_flush_at_exit)
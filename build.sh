@@ -6,11 +6,15 @@ set -o errexit  # exit on error
 # Install Python dependencies
 pip install -r requirements.txt
 
+# Compile the UI translation catalogs and precompile the templates
+python scripts/compile_translations.py
+python scripts/compile_templates.py
+
 # Run database initialization (for first deploy only)
 python -c "
 import os
 os.environ['FLASK_ENV'] = 'production'
-from app_fixed_render import init_database
+from app import init_database
 init_database()
 print('Database initialization completed')
 "
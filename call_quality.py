@@ -0,0 +1,194 @@
+"""
+Server-assisted bandwidth adaptation for video calls.
+
+Both peers report getStats()-derived figures ('call_stats': available send
+bandwidth in kbps, packet loss fraction, round-trip time in seconds) every
+few seconds, plus the kbps actually sent; browsers without a bandwidth
+estimate climb on the sent rate instead (a rung that is sent in full, with
+low loss, earns the next one). The server smooths them per peer, judges the call by the
+worse of the two ends and pushes a 'bandwidth_profile' to both peers when
+the recommended rung of PROFILES changes. Downgrades happen after two bad
+reports in a row; upgrades go one rung at a time and only after the link
+has stayed healthy for CALL_UPGRADE_HOLD seconds, so a flaky 2G/3G link does
+not oscillate.
+
+Every report is also recorded in per-region histograms (region = leading
+digits of the reporting user's PIN code) for capacity planning.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Rungs from best to worst; capture is 640x360 so the top rung never upscales
+PROFILES = [
+    {'name': 'high', 'width': 640, 'height': 360, 'frameRate': 30, 'videoKbps': 800, 'audioKbps': 32},
+    {'name': 'medium', 'width': 480, 'height': 270, 'frameRate': 20, 'videoKbps': 400, 'audioKbps': 32},
+    {'name': 'low', 'width': 320, 'height': 180, 'frameRate': 15, 'videoKbps': 200, 'audioKbps': 24},
+    {'name': 'minimal', 'width': 160, 'height': 90, 'frameRate': 8, 'videoKbps': 80, 'audioKbps': 16},
+    {'name': 'audio', 'width': 0, 'height': 0, 'frameRate': 0, 'videoKbps': 0, 'audioKbps': 16},
+]
+PROFILE_INDEX = {p['name']: i for i, p in enumerate(PROFILES)}
+
+START_PROFILE = PROFILE_INDEX.get(os.environ.get('CALL_START_PROFILE', 'medium'), 1)
+UPGRADE_HOLD = float(os.environ.get('CALL_UPGRADE_HOLD', 15))
+REGION_PIN_DIGITS = int(os.environ.get('CALL_REGION_PIN_DIGITS', 2))
+
+# Fraction of the estimated bandwidth a rung may use
+HEADROOM = 0.85
+LOSS_DOWNGRADE = 0.08
+LOSS_UPGRADE = 0.02
+RTT_DOWNGRADE = 1.0
+SMOOTHING = 0.5
+
+
+class CallQuality:
+    __slots__ = ('room', 'sids', 'level', 'peers', 'bad_reports', 'healthy_since')
+
+    def __init__(self, room, sids):
+        self.room = room
+        self.sids = tuple(sids)
+        self.level = START_PROFILE
+        # sid -> smoothed [available_kbps, loss, rtt, sent_kbps]
+        self.peers = {}
+        self.bad_reports = 0
+        self.healthy_since = None
+
+
+_socketio = None
+_calls = {}
+_lock = threading.Lock()
+
+
+def init_app(socketio):
+    global _socketio
+    _socketio = socketio
+
+
+def region_for(pin_code):
+    """Region label for a PIN code: its leading digits (postal circle/region in India)"""
+    digits = ''.join(ch for ch in str(pin_code or '') if ch.isdigit())
+    return digits[:REGION_PIN_DIGITS] if len(digits) >= REGION_PIN_DIGITS else 'unknown'
+
+
+def profile_payload(room, level, reason):
+    profile = PROFILES[level]
+    return {'room': room, 'profile': profile['name'], 'width': profile['width'], 'height': profile['height'],
+            'frameRate': profile['frameRate'], 'maxVideoBitrate': profile['videoKbps'] * 1000,
+            'maxAudioBitrate': profile['audioKbps'] * 1000, 'audioOnly': profile['videoKbps'] == 0,
+            'reason': reason}
+
+
+def start(room, caller_sid, callee_sid):
+    """Begin tracking an answered call and tell both peers the starting profile"""
+    with _lock:
+        _calls[room] = CallQuality(room, (caller_sid, callee_sid))
+    payload = profile_payload(room, START_PROFILE, 'start')
+    for sid in (caller_sid, callee_sid):
+        _socketio.emit('bandwidth_profile', payload, to=sid)
+
+
+def end(room):
+    with _lock:
+        _calls.pop(room, None)
+
+
+def _number(data, key, low, high):
+    try:
+        value = float(data.get(key))
+    except (TypeError, ValueError):
+        return None
+    return min(max(value, low), high)
+
+
+def _smooth(old, new):
+    if new is None:
+        return old
+    return new if old is None else old + SMOOTHING * (new - old)
+
+
+def target_level(available):
+    """Best rung a link with this much bandwidth (kbps) can carry"""
+    budget = available * HEADROOM
+    return next((i for i, p in enumerate(PROFILES) if p['videoKbps'] + p['audioKbps'] <= budget),
+                len(PROFILES) - 1)
+
+
+def _peer_level(peer, level):
+    """Best rung one peer's figures support while the call is on this rung"""
+    available, _, _, sent = peer
+    if available is not None:
+        return target_level(available)
+    # What is sent is capped by the current rung, so sending it in full only vouches for the next one up
+    if sent is not None and level > 0:
+        rung = PROFILES[level]
+        if sent >= (rung['videoKbps'] + rung['audioKbps']) * HEADROOM:
+            return level - 1
+    return level
+
+
+def report(room, sid, region, data):
+    """Record one peer's stats and push a new profile to both peers if the recommendation changed"""
+    available = _number(data, 'available_kbps', 0, 100_000)
+    sent = _number(data, 'sent_kbps', 0, 100_000)
+    loss = _number(data, 'loss', 0, 1)
+    rtt = _number(data, 'rtt', 0, 30)
+
+    with _lock:
+        call = _calls.get(room)
+        if not call or sid not in call.sids:
+            return
+        # Only peers of a tracked call reach the histograms
+        if available is not None:
+            metrics.CALL_BITRATE.observe((region,), available)
+        if loss is not None:
+            metrics.CALL_PACKET_LOSS.observe((region,), loss)
+        if rtt is not None:
+            metrics.CALL_RTT.observe((region,), rtt)
+        peer = call.peers.setdefault(sid, [None, None, None, None])
+        peer[0] = _smooth(peer[0], available)
+        peer[1] = _smooth(peer[1], loss)
+        peer[2] = _smooth(peer[2], rtt)
+        peer[3] = _smooth(peer[3], sent)
+        metrics.CALL_PROFILE_LEVEL.observe((region,), call.level)
+
+        # The link is only as good as its worse end
+        worst_loss = max((p[1] for p in call.peers.values() if p[1] is not None), default=0.0)
+        worst_rtt = max((p[2] for p in call.peers.values() if p[2] is not None), default=0.0)
+        target = max((_peer_level(p, call.level) for p in call.peers.values()), default=call.level)
+        if worst_loss > LOSS_DOWNGRADE or worst_rtt > RTT_DOWNGRADE:
+            target = min(max(target, call.level + 1), len(PROFILES) - 1)
+
+        now = time.monotonic()
+        new_level, reason = call.level, None
+        if target > call.level:
+            call.healthy_since = None
+            call.bad_reports += 1
+            if call.bad_reports >= 2:
+                new_level, reason = target, 'downgrade'
+        else:
+            call.bad_reports = 0
+            if target < call.level and worst_loss <= LOSS_UPGRADE:
+                if call.healthy_since is None:
+                    call.healthy_since = now
+                elif now - call.healthy_since >= UPGRADE_HOLD:
+                    new_level, reason = call.level - 1, 'upgrade'
+            else:
+                call.healthy_since = None
+
+        if reason is None:
+            return
+        call.level = new_level
+        call.bad_reports = 0
+        call.healthy_since = None
+        sids = call.sids
+
+    logger.info(f"📶 Call in {room}: {reason} to {PROFILES[new_level]['name']}")
+    payload = profile_payload(room, new_level, reason)
+    for peer_sid in sids:
+        _socketio.emit('bandwidth_profile', payload, to=peer_sid)
@@ -0,0 +1,183 @@
+"""
+Compact chat protocol for low-bandwidth clients.
+
+Legacy clients keep receiving one 'message' event per chat line; joins and
+leaves reach every client as coalesced 'presence' events (presence.py),
+which compact clients also get as join/leave entries. A client can instead join
+with {"room": ..., "protocol": {"compact": true}}. It is then put in a
+shadow room and receives 'batch' events: every
+event for the room within CHAT_COALESCE_WINDOW_MS is coalesced into one
+frame with usernames interned, positional fields and millisecond timestamp
+deltas:
+
+    {"t": 1760860800000,                 # base timestamp (ms)
+     "u": ["dr_smith", "patient_demo"],  # usernames referenced below
+     "e": [["j", 1, 0],                  # join:    [type, user, dt]
+           ["m", 1, 15, "Hello"],        # message: [type, user, dt, text]
+           ["l", 0, 980]]}               # leave:   [type, user, dt]
+
+Batches are not compressed by the app: deflating each batch on its own
+saves almost nothing over compact batching (scripts/bench_chat_protocol.py
+shows the numbers), while per-frame compression with a shared context is far
+better, so prefer a WebSocket server that negotiates permessage-deflate.
+Long-polling responses are gzip-compressed by Engine.IO above
+SOCKETIO_COMPRESSION_THRESHOLD bytes.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+COALESCE_WINDOW = float(os.environ.get('CHAT_COALESCE_WINDOW_MS', 50)) / 1000.0
+COMPRESSION_THRESHOLD = int(os.environ.get('SOCKETIO_COMPRESSION_THRESHOLD', 256))
+
+LEGACY = 'legacy'
+COMPACT = 'compact'
+
+EVENT_CODES = {'message': 'm', 'join': 'j', 'leave': 'l'}
+
+_socketio = None
+_modes = {}
+_memberships = {}
+_room_members = {}
+_compact_members = {}
+_pending = {}
+_lock = threading.Lock()
+
+
+def init_app(socketio):
+    global _socketio
+    _socketio = socketio
+
+
+def set_mode(sid, options):
+    """Record the protocol a client asked for and return the mode it got"""
+    if _memberships.get(sid):
+        # A client keeps the mode of its first room; switching would desync the shadow rooms
+        return _modes.get(sid, LEGACY)
+    # Older clients may still ask for "deflate"; they get plain compact batches
+    mode = COMPACT if (options or {}).get('compact') else LEGACY
+    _modes[sid] = mode
+    return mode
+
+
+def join(sid, room):
+    """Track a client joining a chat room; returns the Socket.IO room it should actually join"""
+    mode = _modes.get(sid, LEGACY)
+    with _lock:
+        rooms = _memberships.setdefault(sid, set())
+        if room not in rooms:
+            rooms.add(room)
+            _room_members.setdefault(room, set()).add(sid)
+            if mode != LEGACY:
+                _compact_members[room] = _compact_members.get(room, 0) + 1
+    return room if mode == LEGACY else f"{room}#{mode}"
+
+
+def leave(sid, room):
+    """Track a client leaving a chat room; returns the Socket.IO room it should leave"""
+    mode = _modes.get(sid, LEGACY)
+    with _lock:
+        rooms = _memberships.get(sid, set())
+        if room in rooms:
+            rooms.discard(room)
+            _drop_room_member(room, sid)
+            if mode != LEGACY:
+                _drop_compact_member(room)
+    return room if mode == LEGACY else f"{room}#{mode}"
+
+
+def forget(sid):
+    """Drop all state for a disconnected client"""
+    with _lock:
+        mode = _modes.pop(sid, LEGACY)
+        for room in _memberships.pop(sid, ()):
+            _drop_room_member(room, sid)
+            if mode != LEGACY:
+                _drop_compact_member(room)
+
+
+def participants(room):
+    """Session ids currently joined to a chat room, in any protocol mode"""
+    with _lock:
+        return set(_room_members.get(room, ()))
+
+
+def _drop_room_member(room, sid):
+    members = _room_members.get(room)
+    if members is not None:
+        members.discard(sid)
+        if not members:
+            del _room_members[room]
+
+
+def _drop_compact_member(room):
+    remaining = _compact_members.get(room, 0) - 1
+    if remaining > 0:
+        _compact_members[room] = remaining
+    else:
+        _compact_members.pop(room, None)
+
+
+def legacy_payload(kind, username, text=None, now=None):
+    if kind == 'message':
+        now = now or datetime.now()
+        return 'message', {'username': username, 'message': text, 'timestamp': now.strftime('%Y-%m-%d %H:%M:%S')}
+    verb = 'entered' if kind == 'join' else 'left'
+    return 'status', {'msg': f'{username} has {verb} the room.'}
+
+
+def encode_batch(events):
+    """Encode [(kind, username, text, timestamp_ms), ...] as a compact batch dict"""
+    base = events[0][3]
+    users, index, encoded = [], {}, []
+    for kind, username, text, ts in events:
+        if username not in index:
+            index[username] = len(users)
+            users.append(username)
+        entry = [EVENT_CODES[kind], index[username], ts - base]
+        if kind == 'message':
+            entry.append(text)
+        encoded.append(entry)
+    return {'t': base, 'u': users, 'e': encoded}
+
+
+def all_rooms(room):
+    """The chat room and its shadow rooms, for events every protocol mode receives as is"""
+    return room, f"{room}#{COMPACT}"
+
+
+def publish(kind, room, username, text=None, legacy=True):
+    """Send a chat event to legacy clients now (unless legacy=False) and queue it for the room's compact clients"""
+    if legacy:
+        event, payload = legacy_payload(kind, username, text)
+        _socketio.emit(event, payload, to=room)
+
+    with _lock:
+        if room not in _compact_members:
+            return
+        queue = _pending.get(room)
+        first = queue is None
+        if first:
+            queue = _pending[room] = []
+        queue.append((kind, username, text, int(time.time() * 1000)))
+    if first:
+        _socketio.start_background_task(_flush_later, room)
+
+
+def _flush_later(room):
+    _socketio.sleep(COALESCE_WINDOW)
+    flush(room)
+
+
+def flush(room):
+    with _lock:
+        events = _pending.pop(room, None)
+    if not events:
+        return
+    batch = encode_batch(events)
+    _socketio.emit('batch', batch, to=f"{room}#{COMPACT}")
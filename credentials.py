@@ -0,0 +1,94 @@
+"""
+Password hashing for the telemedicine application.
+
+Hashing and verification run on a small bounded thread pool, which caps how
+many slow key derivations run at once so a burst of logins cannot starve
+the CPU. The caller still waits for the result: under the sync gunicorn
+worker the request thread is blocked for the full derivation time, so the
+pool is a concurrency bound, not a way to free the worker. hashlib releases
+the GIL while deriving keys, so threads give real parallelism here without
+the pickling overhead of a process pool.
+"""
+
+import hmac
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+# pbkdf2 is supported by every Werkzeug release we deploy against
+HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+KNOWN_PREFIXES = ('pbkdf2:', 'scrypt:')
+
+_executor = None
+_dummy_hash = None
+_dummy_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared hashing pool, creating it on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='pwhash')
+    return _executor
+
+
+def is_hashed(stored):
+    """True if the stored value is a Werkzeug hash rather than a legacy plaintext password"""
+    return bool(stored) and stored.startswith(KNOWN_PREFIXES) and stored.count('$') == 2
+
+
+def needs_rehash(stored):
+    """True if the stored value is plaintext or was hashed with an older method"""
+    return not is_hashed(stored) or stored.split('$', 1)[0] != HASH_METHOD
+
+
+def _verify(stored, password):
+    if is_hashed(stored):
+        return check_password_hash(stored, password)
+    # Legacy rows hold the plaintext password
+    return hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+
+
+def hash_password(password):
+    """Hash a password on the worker pool and return the storable string"""
+    future = get_executor().submit(generate_password_hash, password, HASH_METHOD)
+    return future.result(timeout=HASH_TIMEOUT)
+
+
+def _get_dummy_hash():
+    global _dummy_hash
+    with _dummy_lock:
+        if _dummy_hash is None:
+            _dummy_hash = generate_password_hash(os.urandom(16).hex(), HASH_METHOD)
+        return _dummy_hash
+
+
+def verify_password(stored, password):
+    """Check a password against its stored value on the worker pool
+
+    With no stored value (unknown user) the password is checked against a
+    throwaway hash and rejected, so a missing account costs the same time
+    as a wrong password and logins do not reveal which usernames exist.
+    """
+    if password is None:
+        return False
+    future = get_executor().submit(_verify, stored or _get_dummy_hash(), password)
+    return future.result(timeout=HASH_TIMEOUT) and bool(stored)
+
+
+def upgrade_password(cursor, user_id, password):
+    """Replace a legacy or outdated password with a fresh hash after a successful login"""
+    try:
+        cursor.execute("UPDATE users SET password = %s WHERE id = %s", (hash_password(password), user_id))
+        logger.info(f"🔐 Upgraded password hash for user {user_id}")
+    except Exception as e:
+        # Login must not fail because the migration did; it will be retried next time
+        logger.warning(f"Could not upgrade password hash for user {user_id}: {e}")
@@ -0,0 +1,13 @@
+"""
+Gunicorn settings (read automatically from the working directory)
+
+The app is imported once in the master and forked into the workers, which
+share its memory and start serving without importing it again. app.py
+opens no database connections and starts no threads at import time; each
+worker starts its own on first use.
+"""
+
+import os
+
+preload_app = True
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
@@ -0,0 +1,63 @@
+"""
+Liveness and readiness probes.
+
+/healthz only proves the worker answers HTTP: no database, session or
+template work, so load balancers and autoscalers can probe it as often as
+they like. /readyz (and the older /health) checks the database over one
+connection per worker process that is kept open between probes, and
+reuses the result for HEALTH_CACHE_SECONDS, so frequent probes cost
+neither a new SSL handshake nor a query each time.
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CACHE_SECONDS = float(os.environ.get('HEALTH_CACHE_SECONDS', 5))
+
+_lock = threading.Lock()
+_conn = None
+_conn_pid = None
+_result = None
+_checked = 0.0
+
+
+def _query(open_connection):
+    global _conn, _conn_pid
+    # A connection inherited from a preloading parent process is not ours to use
+    if _conn is None or _conn.closed or _conn_pid != os.getpid():
+        database_url = os.environ.get('DATABASE_URL')
+        if not database_url:
+            raise RuntimeError('DATABASE_URL environment variable not set')
+        _conn, _conn_pid = open_connection(database_url), os.getpid()
+    cursor = _conn.cursor()
+    try:
+        cursor.execute("SELECT 1 AS ok")
+        return cursor.fetchone() is not None
+    finally:
+        cursor.close()
+
+
+def readiness(open_connection):
+    """(ready, message): database reachability, cached for CACHE_SECONDS"""
+    global _conn, _result, _checked
+    with _lock:
+        now = time.monotonic()
+        if _result is not None and now - _checked < CACHE_SECONDS:
+            return _result
+        try:
+            _result = (True, 'connected') if _query(open_connection) else (False, 'Database query failed')
+        except Exception as e:
+            logger.error(f"❌ Readiness check failed: {e}")
+            if _conn is not None and _conn_pid == os.getpid():
+                try:
+                    _conn.close()
+                except Exception:
+                    pass
+            _conn = None
+            _result = (False, 'Database connection failed')
+        _checked = now
+        return _result
@@ -0,0 +1,161 @@
+"""
+Server-side translations of the UI.
+
+Templates mark text with _() and the page is rendered directly in the
+user's language: the preferred_language saved on their account (copied
+into the session at login), otherwise the browser's Accept-Language.
+Catalogs are gettext .po files in translations/, compiled to .mo at build
+time (python scripts/compile_translations.py) and loaded once at startup.
+"""
+
+import ast
+import gettext as gettext_module
+import io
+import logging
+import os
+import struct
+
+from flask import g, has_request_context, request, session
+
+logger = logging.getLogger(__name__)
+
+TRANSLATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translations')
+DEFAULT_LANGUAGE = 'en'
+# Language code -> name shown in the switcher (in that language)
+LANGUAGES = {'en': 'English', 'hi': 'हिन्दी', 'pa': 'ਪੰਜਾਬੀ', 'ta': 'தமிழ்', 'ur': 'اردو'}
+RTL_LANGUAGES = {'ur'}
+# users.preferred_language stores English names
+PREFERENCE_CODES = {'English': 'en', 'Hindi': 'hi', 'Punjabi': 'pa', 'Tamil': 'ta', 'Urdu': 'ur'}
+PREFERENCE_NAMES = {code: name for name, code in PREFERENCE_CODES.items()}
+
+_catalogs = {DEFAULT_LANGUAGE: gettext_module.NullTranslations()}
+
+
+def parse_po(path):
+    """{msgid: msgstr} for the translated, non-fuzzy entries of a .po file (plus the '' header)"""
+    messages = {}
+    msgid = msgstr = section = None
+    fuzzy = False
+    with open(path, encoding='utf-8') as f:
+        lines = [line.strip() for line in f] + ['']
+    for line in lines:
+        if section == 'msgstr' and not line.startswith('"'):
+            # The previous entry is complete
+            if msgstr and not fuzzy:
+                messages[msgid] = msgstr
+            msgid = msgstr = section = None
+            fuzzy = False
+        if not line:
+            continue
+        if line.startswith('#'):
+            fuzzy = fuzzy or (line.startswith('#,') and 'fuzzy' in line)
+        elif line.startswith('msgid '):
+            msgid, section = ast.literal_eval(line[6:]), 'msgid'
+        elif line.startswith('msgstr '):
+            msgstr, section = ast.literal_eval(line[7:]), 'msgstr'
+        elif line.startswith('"') and section == 'msgid':
+            msgid += ast.literal_eval(line)
+        elif line.startswith('"') and section == 'msgstr':
+            msgstr += ast.literal_eval(line)
+        else:
+            raise ValueError(f"{path}: unsupported line {line!r}")
+    return messages
+
+
+def compile_mo(messages):
+    """GNU .mo file contents for {msgid: msgstr}"""
+    ids = sorted(messages)
+    id_data = b''.join(m.encode('utf-8') + b'\0' for m in ids)
+    str_data = b''.join(messages[m].encode('utf-8') + b'\0' for m in ids)
+    header_size = 7 * 4
+    ids_start = header_size + 16 * len(ids)
+    strs_start = ids_start + len(id_data)
+
+    offsets = []
+    id_offset = str_offset = 0
+    for m in ids:
+        encoded_id, encoded_str = m.encode('utf-8'), messages[m].encode('utf-8')
+        offsets.append((len(encoded_id), ids_start + id_offset, len(encoded_str), strs_start + str_offset))
+        id_offset += len(encoded_id) + 1
+        str_offset += len(encoded_str) + 1
+
+    output = struct.pack('<7I', 0x950412de, 0, len(ids), header_size, header_size + 8 * len(ids), 0, 0)
+    output += b''.join(struct.pack('<2I', length, offset) for length, offset, _, _ in offsets)
+    output += b''.join(struct.pack('<2I', length, offset) for _, _, length, offset in offsets)
+    return output + id_data + str_data
+
+
+def load_catalogs():
+    """Load translations/<lang>.mo for every language, compiling a missing or stale .mo in memory"""
+    for code in LANGUAGES:
+        if code == DEFAULT_LANGUAGE:
+            continue
+        po_path = os.path.join(TRANSLATIONS_DIR, f'{code}.po')
+        mo_path = os.path.join(TRANSLATIONS_DIR, f'{code}.mo')
+        try:
+            if os.path.exists(mo_path) and (not os.path.exists(po_path)
+                                            or os.path.getmtime(mo_path) >= os.path.getmtime(po_path)):
+                with open(mo_path, 'rb') as f:
+                    _catalogs[code] = gettext_module.GNUTranslations(f)
+            else:
+                logger.warning(f"⚠️ {mo_path} missing or stale, compiling {code}.po at startup "
+                               f"(run scripts/compile_translations.py in the build)")
+                _catalogs[code] = gettext_module.GNUTranslations(io.BytesIO(compile_mo(parse_po(po_path))))
+        except (OSError, ValueError, SyntaxError) as e:
+            logger.error(f"❌ Could not load {code} translations, falling back to English: {e}")
+            _catalogs[code] = _catalogs[DEFAULT_LANGUAGE]
+    logger.info(f"🌐 Loaded translations: {', '.join(sorted(_catalogs))}")
+
+
+def normalize(language):
+    """Language code for a code or preferred_language name; None if unsupported"""
+    if not language:
+        return None
+    if language in PREFERENCE_CODES:
+        return PREFERENCE_CODES[language]
+    code = language.split('-')[0].lower()
+    return code if code in LANGUAGES else None
+
+
+def get_language():
+    """The current request's language: session (set from the user's preference), then the browser"""
+    if not has_request_context():
+        return DEFAULT_LANGUAGE
+    if 'language' not in g:
+        language = normalize(session.get('language'))
+        if language is None:
+            language = request.accept_languages.best_match(LANGUAGES.keys()) or DEFAULT_LANGUAGE
+            g.language_negotiated = True
+        g.language = language
+    return g.language
+
+
+def gettext(message, **variables):
+    text = _catalogs.get(get_language(), _catalogs[DEFAULT_LANGUAGE]).gettext(message)
+    return text % variables if variables else text
+
+
+def ngettext(singular, plural, n, **variables):
+    text = _catalogs.get(get_language(), _catalogs[DEFAULT_LANGUAGE]).ngettext(singular, plural, n)
+    return text % dict(variables, num=n)
+
+
+def init_app(app):
+    load_catalogs()
+    app.jinja_env.add_extension('jinja2.ext.i18n')
+    # Templates call the module-level functions, which look up the request's language at render time
+    app.jinja_env.install_gettext_callables(gettext, ngettext, newstyle=True)
+
+    @app.context_processor
+    def inject_language():
+        language = get_language()
+        return {'current_language': language, 'languages': LANGUAGES,
+                'text_direction': 'rtl' if language in RTL_LANGUAGES else 'ltr'}
+
+    @app.after_request
+    def content_language(response):
+        if response.mimetype == 'text/html' and 'language' in g:
+            response.headers['Content-Language'] = g.language
+            if g.get('language_negotiated'):
+                response.vary.add('Accept-Language')
+        return response
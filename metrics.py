@@ -0,0 +1,275 @@
+"""
+Request-level instrumentation for the telemedicine application.
+
+Records per-route latency, SQL query counts and DB time per request,
+connection-acquire time and SocketIO event handling time, and renders them
+in Prometheus text format for the /metrics endpoint. Metrics are kept per
+process; scrape every worker (or run a single worker) to see the full picture.
+
+Setting PROFILE_SLOW_REQUESTS_MS turns on a low-overhead sampling profiler:
+a background thread snapshots the stacks of in-flight requests every
+PROFILE_INTERVAL_MS and logs the hottest stacks of any request slower than
+the threshold.
+"""
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import g, has_app_context, request
+from psycopg2.extras import RealDictCursor
+
+import query_log
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_REQUESTS_MS', 0))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000.0
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 1.0))
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        for labels, (counts, total, count) in series:
+            base = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            sep = ',' if base else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{base}}} {total}')
+            lines.append(f'{self.name}_count{{{base}}} {count}')
+        return '\n'.join(lines)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'HTTP request latency by route.',
+                            ('route', 'method', 'status'))
+REQUEST_DB_QUERIES = Histogram('http_request_db_queries', 'SQL queries executed per HTTP request.',
+                               ('route',), COUNT_BUCKETS)
+REQUEST_DB_TIME = Histogram('http_request_db_seconds', 'Total SQL execution time per HTTP request.',
+                            ('route',))
+DB_CONNECT_TIME = Histogram('db_connection_acquire_seconds', 'Time to obtain a database connection.', ())
+DB_REPLICA_LAG = Histogram('db_replica_lag_seconds', 'Replication lag measured on read replicas.',
+                           ('replica',), (0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0))
+SOCKET_EVENT_TIME = Histogram('socketio_event_duration_seconds', 'SocketIO event handling time.',
+                              ('event',))
+SOCKET_EVENT_DB_QUERIES = Histogram('socketio_event_db_queries', 'SQL queries executed per SocketIO event.',
+                                    ('event',), COUNT_BUCKETS)
+
+CALL_SETUP_TIME = Histogram('video_call_setup_seconds', 'Time from video call offer to answer, decline or timeout.',
+                            ('outcome',), (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0))
+
+CALL_BITRATE = Histogram('video_call_bandwidth_kbps', 'Available send bandwidth reported by call peers, by region.',
+                         ('region',), (50, 100, 150, 250, 400, 600, 900, 1500, 3000))
+CALL_PACKET_LOSS = Histogram('video_call_packet_loss_ratio', 'Packet loss reported by call peers, by region.',
+                             ('region',), (0.0, 0.01, 0.02, 0.05, 0.08, 0.12, 0.2, 0.35))
+CALL_RTT = Histogram('video_call_rtt_seconds', 'Round-trip time reported by call peers, by region.',
+                     ('region',), (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0))
+CALL_PROFILE_LEVEL = Histogram('video_call_profile_level', 'Bandwidth profile in use per stats report '
+                               '(0 = high ... 4 = audio only), by region.', ('region',), (0, 1, 2, 3, 4))
+
+AUDIT_FLUSH_TIME = Histogram('audit_flush_seconds', 'Time to COPY one batch of audit events.', ())
+AUDIT_FLUSH_ROWS = Histogram('audit_flush_rows', 'Audit events written per batch.', (),
+                             (1, 10, 50, 100, 250, 500, 1000))
+
+PDF_RENDER_TIME = Histogram('prescription_pdf_render_seconds', 'Time to render one prescription PDF.', (),
+                            (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+PRESENCE_CHANGES = Histogram('presence_changes_per_broadcast', 'Joins and leaves coalesced into one room '
+                             'presence event.', (), (1, 2, 3, 5, 10, 20, 50))
+
+TEMPLATE_RENDER_TIME = Histogram('template_render_seconds', 'Time to render a page template, by template.',
+                                 ('template',), (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5))
+
+REGISTRY = [REQUEST_LATENCY, REQUEST_DB_QUERIES, REQUEST_DB_TIME, DB_CONNECT_TIME, DB_REPLICA_LAG,
+            SOCKET_EVENT_TIME, SOCKET_EVENT_DB_QUERIES, CALL_SETUP_TIME,
+            CALL_BITRATE, CALL_PACKET_LOSS, CALL_RTT, CALL_PROFILE_LEVEL, TEMPLATE_RENDER_TIME,
+            AUDIT_FLUSH_TIME, AUDIT_FLUSH_ROWS, PDF_RENDER_TIME, PRESENCE_CHANGES]
+
+
+def render():
+    """All metrics in Prometheus text exposition format"""
+    return '\n'.join(metric.render() for metric in REGISTRY) + '\n'
+
+
+def _reset_counters():
+    g.metrics_db_queries = 0
+    g.metrics_db_time = 0.0
+
+
+def record_query(duration):
+    """Attribute one SQL execution to the current request or socket event"""
+    if has_app_context() and 'metrics_db_queries' in g:
+        g.metrics_db_queries += 1
+        g.metrics_db_time += duration
+
+
+def record_connect(duration):
+    DB_CONNECT_TIME.observe((), duration)
+
+
+class InstrumentedCursor(RealDictCursor):
+    """RealDictCursor that reports every statement's execution time and feeds the slow-query log"""
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            duration = time.perf_counter() - start
+            record_query(duration)
+            query_log.record(self, query, vars, duration)
+
+    def executemany(self, query, vars_list):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            duration = time.perf_counter() - start
+            record_query(duration)
+            query_log.record(self, query, None, duration)
+
+
+def track_event(event):
+    """Decorator timing a SocketIO handler; place it below @socketio.on"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            _reset_counters()
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                SOCKET_EVENT_TIME.observe((event,), time.perf_counter() - start)
+                SOCKET_EVENT_DB_QUERIES.observe((event,), g.metrics_db_queries)
+        return wrapper
+    return decorator
+
+
+class SlowRequestProfiler:
+    """Stack-sampling profiler that only reports requests slower than a threshold"""
+
+    def __init__(self, threshold_ms, interval, sample_rate):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for ident, samples in active.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < 12:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                samples[' <- '.join(stack)] += 1
+
+    def start(self):
+        if random.random() >= self.sample_rate:
+            return
+        self._ensure_thread()
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+
+    def finish(self, route, duration):
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if samples is None or duration < self.threshold:
+            return
+        hottest = '\n'.join(f"  {count:>5} x {stack}" for stack, count in samples.most_common(10))
+        logger.warning(f"🐢 Slow request {route} took {duration * 1000:.0f} ms "
+                       f"({sum(samples.values())} samples):\n{hottest}")
+
+    def discard(self):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+
+profiler = SlowRequestProfiler(PROFILE_SLOW_MS, PROFILE_INTERVAL, PROFILE_SAMPLE_RATE) if PROFILE_SLOW_MS else None
+
+
+def init_app(app):
+    """Register the request timing hooks on the Flask app"""
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        _reset_counters()
+        if profiler:
+            profiler.start()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        duration = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        REQUEST_LATENCY.observe((route, request.method, str(response.status_code)), duration)
+        REQUEST_DB_QUERIES.observe((route,), g.metrics_db_queries)
+        REQUEST_DB_TIME.observe((route,), g.metrics_db_time)
+        if profiler:
+            profiler.finish(route, duration)
+        return response
+
+    @app.teardown_request
+    def _discard_profile(exc):
+        # after_request is skipped when a request dies mid-flight
+        if profiler:
+            profiler.discard()
@@ -0,0 +1,182 @@
+"""
+Time-based partitioning for chat_messages and notifications.
+
+Both tables are range-partitioned by month on their timestamp column, so
+live rooms and unread counts only touch the small recent partitions and old
+months can be detached and archived (see scripts/partitions.py) without
+rewriting the hot indexes. A DEFAULT partition catches rows outside the
+created months so inserts never fail; maintenance keeps
+PARTITION_MONTHS_AHEAD future months created so it stays empty.
+"""
+
+import logging
+import os
+import re
+import time
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3))
+MAINTENANCE_INTERVAL = int(os.environ.get('PARTITION_MAINTENANCE_INTERVAL', 24 * 3600))
+
+# Arbitrary constant shared by every worker so only one runs maintenance at a time
+MAINTENANCE_LOCK_ID = 720_301
+
+TABLES = {
+    'chat_messages': {
+        'column': 'timestamp',
+        'ddl': """
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id SERIAL,
+                room VARCHAR(100) NOT NULL,
+                username VARCHAR(50) NOT NULL,
+                message TEXT NOT NULL,
+                media_url VARCHAR(255),
+                timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, timestamp)
+            ) PARTITION BY RANGE (timestamp)
+        """,
+        'indexes': [
+            "CREATE INDEX IF NOT EXISTS idx_chat_messages_room ON chat_messages(room)",
+            "CREATE INDEX IF NOT EXISTS idx_chat_messages_room_time ON chat_messages(room, timestamp DESC)",
+        ],
+    },
+    'notifications': {
+        'column': 'created_at',
+        'ddl': """
+            CREATE TABLE IF NOT EXISTS notifications (
+                id SERIAL,
+                user_id INTEGER NOT NULL,
+                title VARCHAR(255) NOT NULL,
+                message TEXT NOT NULL,
+                type VARCHAR(30) DEFAULT 'general' CHECK (type IN ('appointment_approved', 'appointment_declined', 'appointment_reminder', 'prescription_ready', 'general', 'sos_alert')),
+                is_read BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, created_at),
+                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+            ) PARTITION BY RANGE (created_at)
+        """,
+        'indexes': [
+            "CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id)",
+            "CREATE INDEX IF NOT EXISTS idx_notifications_unread ON notifications(user_id, created_at DESC) WHERE is_read = FALSE",
+        ],
+    },
+}
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def parse_partition_name(table, name):
+    """Month covered by a partition, or None for the default partition and foreign names"""
+    match = re.fullmatch(rf"{re.escape(table)}_y(\d{{4}})m(\d{{2}})", name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", (table,))
+    return cursor.fetchone() is not None
+
+
+def list_partitions(cursor, table):
+    """Monthly partitions of a table as (month, name) pairs, oldest first"""
+    cursor.execute("""
+        SELECT c.relname AS name
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (table,))
+    partitions = []
+    for row in cursor.fetchall():
+        name = row['name'] if isinstance(row, dict) else row[0]
+        month = parse_partition_name(table, name)
+        if month:
+            partitions.append((month, name))
+    return sorted(partitions)
+
+
+def create_partition(cursor, table, month):
+    name = partition_name(table, month)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table}
+        FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')
+    """)
+    return name
+
+
+def ensure_partitions(cursor, table, first_month=None, months_ahead=MONTHS_AHEAD):
+    """Create monthly partitions from first_month (default: this month) through months_ahead months from now"""
+    month = month_start(first_month or date.today())
+    last = add_months(month_start(date.today()), months_ahead)
+    created = []
+    # Inside a transaction a failed CREATE would abort everything after it
+    in_transaction = not cursor.connection.autocommit
+    while month <= last:
+        if in_transaction:
+            cursor.execute("SAVEPOINT create_partition")
+        try:
+            created.append(create_partition(cursor, table, month))
+        except Exception as e:
+            # Usually rows for that month already sit in the default partition
+            logger.warning(f"Could not create partition {partition_name(table, month)}: {e}")
+            if in_transaction:
+                cursor.execute("ROLLBACK TO SAVEPOINT create_partition")
+        month = add_months(month, 1)
+    return created
+
+
+def create_table(cursor, table):
+    """Create a partitioned table with its default and upcoming monthly partitions"""
+    spec = TABLES[table]
+    cursor.execute(spec['ddl'])
+    if not is_partitioned(cursor, table):
+        logger.warning(f"⚠️ {table} is not partitioned yet; run `python scripts/partitions.py migrate`")
+        return
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+    ensure_partitions(cursor, table)
+    for index_sql in spec['indexes']:
+        cursor.execute(index_sql)
+
+
+def run_maintenance(conn):
+    """Create upcoming partitions for every partitioned table; returns False if another worker holds the lock"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_try_advisory_lock(%s) AS locked", (MAINTENANCE_LOCK_ID,))
+        row = cursor.fetchone()
+        if not (row['locked'] if isinstance(row, dict) else row[0]):
+            return False
+        try:
+            for table in TABLES:
+                if is_partitioned(cursor, table):
+                    ensure_partitions(cursor, table)
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MAINTENANCE_LOCK_ID,))
+        return True
+    finally:
+        cursor.close()
+
+
+def maintenance_loop(get_connection, sleep=time.sleep):
+    """Background task: keep future partitions created for as long as the process lives"""
+    while True:
+        conn = get_connection()
+        if conn:
+            try:
+                run_maintenance(conn)
+            except Exception as e:
+                logger.warning(f"Partition maintenance failed: {e}")
+            finally:
+                conn.close()
+        sleep(MAINTENANCE_INTERVAL)
@@ -0,0 +1,399 @@
+"""
+Printable prescriptions.
+
+Prescriptions are rendered to PDF on a small worker pool (PDF_WORKERS
+threads per process) instead of the request thread, with at most
+PDF_QUEUE_SIZE more renders waiting; when the pool is full single
+downloads get 503 with Retry-After instead of piling up. The same
+prescription requested twice while rendering shares one render.
+
+Rendered documents are kept in memory (up to PDF_CACHE_MB) keyed by
+prescription id and updated_at, which a trigger bumps on every UPDATE,
+so an edited or dispensed prescription is rendered again and everything
+else is served from memory. The ETag is derived from the same key, so
+a browser's conditional request is answered with 304 before any
+rendering or cache lookup.
+
+A pharmacy can download one day's prescriptions as a ZIP that is
+streamed while it is rendered: documents go into the archive in order as
+the pool finishes them, a few at a time ahead of the download.
+
+The PDF is written directly (Helvetica, WinAnsi encoding), so no PDF
+library is needed; characters outside Windows-1252 print as '?'.
+"""
+
+import csv
+import io
+import logging
+import os
+import threading
+import time
+import zipfile
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from werkzeug.utils import secure_filename
+
+import metrics
+import records
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('PDF_WORKERS', 2))
+QUEUE_SIZE = int(os.environ.get('PDF_QUEUE_SIZE', 8))
+CACHE_BYTES = int(float(os.environ.get('PDF_CACHE_MB', 32)) * 1024 * 1024)
+RENDER_TIMEOUT = float(os.environ.get('PDF_RENDER_TIMEOUT', 10))
+BATCH_LIMIT = int(os.environ.get('PDF_BATCH_LIMIT', 500))
+
+# Bump when the layout changes so browsers drop their copies
+LAYOUT_VERSION = 1
+
+SELECT = """
+    SELECT p.id, p.patient_id, p.doctor_id, p.medicines, p.instructions, p.diagnosis, p.date, p.status,
+           p.updated_at, u.name AS patient_name, u.date_of_birth, u.gender, d.name AS doctor_name
+    FROM prescriptions p
+    JOIN users u ON p.patient_id = u.id
+    JOIN users d ON p.doctor_id = d.id
+"""
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_inflight = {}
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+
+
+def ensure_schema(cursor):
+    """updated_at, bumped on every change, and the index behind a day's batch"""
+    cursor.execute("ALTER TABLE prescriptions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP")
+    cursor.execute("""
+        CREATE OR REPLACE FUNCTION prescriptions_touch() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at = CURRENT_TIMESTAMP;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    cursor.execute("DROP TRIGGER IF EXISTS prescriptions_touch ON prescriptions")
+    cursor.execute("""
+        CREATE TRIGGER prescriptions_touch BEFORE UPDATE ON prescriptions
+        FOR EACH ROW EXECUTE PROCEDURE prescriptions_touch()
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_prescriptions_date ON prescriptions(date)")
+
+
+def get_prescription(cursor, prescription_id):
+    cursor.execute(SELECT + " WHERE p.id = %s", (prescription_id,))
+    return cursor.fetchone()
+
+
+def list_for_day(cursor, day):
+    """A day's prescriptions that a pharmacy can dispense, oldest first"""
+    cursor.execute(SELECT + """
+        WHERE p.date >= %s AND p.date < %s::DATE + 1 AND p.status <> 'cancelled'
+        ORDER BY p.date, p.id
+        LIMIT %s
+    """, (day, day, BATCH_LIMIT))
+    return cursor.fetchall()
+
+
+def can_access(user_id, role, prescription):
+    """Patients their own, doctors those they wrote, pharmacies any that is not cancelled"""
+    if role == 'patient':
+        return prescription['patient_id'] == user_id
+    if role == 'doctor':
+        return prescription['doctor_id'] == user_id
+    return role == 'pharmacy' and prescription['status'] != 'cancelled'
+
+
+def _modified(prescription):
+    return prescription.get('updated_at') or prescription['date']
+
+
+def cache_key(prescription):
+    return prescription['id'], _modified(prescription)
+
+
+def etag(prescription):
+    return f"rx-{prescription['id']}-{_modified(prescription):%Y%m%d%H%M%S%f}-{LAYOUT_VERSION}"
+
+
+def filename(prescription):
+    day = prescription['date'].strftime('%Y-%m-%d')
+    patient = secure_filename(prescription.get('patient_name') or '') or 'patient'
+    return f"prescription_{prescription['id']}_{day}_{patient}.pdf"
+
+
+# --- Rendering ---------------------------------------------------------------
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 in points
+MARGIN = 56
+FOOTER = 40
+
+# Helvetica advance widths (1/1000 em) for printable ASCII, from the standard AFM
+_HELVETICA = dict(zip(
+    ' !"#$%&\'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~',
+    (278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+     556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+     1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+     667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+     333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+     556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584)))
+
+
+def _width(text, size):
+    return sum(_HELVETICA.get(ch, 556) for ch in text) * size / 1000
+
+
+def _wrap(text, size, width):
+    lines = []
+    for paragraph in text.replace('\r\n', '\n').split('\n'):
+        line = ''
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if line and _width(candidate, size) > width:
+                lines.append(line)
+                candidate = word
+            line = candidate
+        lines.append(line)
+    return lines
+
+
+def _pdf_string(text):
+    data = text.encode('cp1252', 'replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+class _Layout:
+    """Lines of text top to bottom, starting a new page when one is full"""
+
+    def __init__(self):
+        self.pages = []
+        self._new_page()
+
+    def _new_page(self):
+        self.ops = []
+        self.pages.append(self.ops)
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def _room(self, height):
+        if self.y - height < MARGIN + FOOTER:
+            self._new_page()
+
+    def _show(self, text, size, bold, x):
+        font = b'/F2' if bold else b'/F1'
+        self.ops.append(b'BT %s %d Tf %.2f %.2f Td %s Tj ET' % (font, size, x, self.y, _pdf_string(text)))
+
+    def text(self, text, size=11, bold=False, x=MARGIN, leading=1.4):
+        self._room(size * leading)
+        self.y -= size * leading
+        self._show(text, size, bold, x)
+
+    def paragraph(self, text, size=11, indent=0):
+        for line in _wrap(text, size, PAGE_WIDTH - 2 * MARGIN - indent):
+            self.text(line, size, x=MARGIN + indent)
+
+    def field(self, label, value, size=11):
+        self._room(size * 1.4)
+        self.y -= size * 1.4
+        self._show(label, size, True, MARGIN)
+        self._show(value or '-', size, False, MARGIN + 90)
+
+    def rule(self, gap=8):
+        self._room(gap * 2)
+        self.y -= gap
+        self.ops.append(b'0.6 w %d %.2f m %d %.2f l S' % (MARGIN, self.y, PAGE_WIDTH - MARGIN, self.y))
+        self.y -= gap
+
+    def footer(self, text):
+        total = len(self.pages)
+        for number, ops in enumerate(self.pages, 1):
+            ops.append(b'BT /F1 8 Tf %d %d Td %s Tj ET' % (MARGIN, MARGIN - 16,
+                                                           _pdf_string(f"{text} - page {number} of {total}")))
+
+
+def _age(date_of_birth, on):
+    if not date_of_birth:
+        return None
+    return on.year - date_of_birth.year - ((on.month, on.day) < (date_of_birth.month, date_of_birth.day))
+
+
+def render(prescription):
+    """The prescription as PDF bytes; identical input gives identical bytes"""
+    issued = prescription['date']
+    layout = _Layout()
+    layout.text('Telemedicine Rural Nabha', size=18, bold=True)
+    layout.text(f"Prescription #{prescription['id']}", size=12)
+    layout.rule()
+
+    patient = prescription.get('patient_name') or ''
+    details = [part for part in (
+        f"{_age(prescription.get('date_of_birth'), issued)} years" if prescription.get('date_of_birth') else None,
+        prescription.get('gender')) if part]
+    if details:
+        patient = f"{patient} ({', '.join(details)})"
+    layout.field('Patient', patient)
+    layout.field('Doctor', f"Dr. {prescription.get('doctor_name') or ''}")
+    layout.field('Date', issued.strftime('%d %b %Y, %H:%M'))
+    layout.field('Status', (prescription.get('status') or 'active').capitalize())
+    layout.rule()
+
+    for label, value in (('Diagnosis', prescription.get('diagnosis')),
+                         ('Medicines', prescription.get('medicines')),
+                         ('Instructions', prescription.get('instructions'))):
+        layout.text(label, size=12, bold=True, leading=1.8)
+        layout.paragraph(value or 'Not specified', indent=12)
+    layout.rule(16)
+    layout.text("Doctor's signature: ______________________", size=10)
+    layout.footer(f"Prescription #{prescription['id']} issued {issued:%Y-%m-%d}")
+    return _assemble(layout.pages, f"Prescription {prescription['id']}", _modified(prescription))
+
+
+def _assemble(pages, title, modified):
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        None,  # page tree, once the page objects are numbered
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+        b'<< /Title %s /Producer (Telemedicine Rural Nabha) /CreationDate (D:%s) >>'
+        % (_pdf_string(title), modified.strftime('%Y%m%d%H%M%S').encode()),
+    ]
+    kids = []
+    for ops in pages:
+        content = zlib.compress(b'\n'.join(ops))
+        objects.append(b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream' % (len(content), content))
+        objects.append(b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+                       b'/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>'
+                       % (PAGE_WIDTH, PAGE_HEIGHT, len(objects)))
+        kids.append(b'%d 0 R' % len(objects))
+    objects[1] = b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(kids), len(kids))
+
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+    xref = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    out.write(b''.join(b'%010d 00000 n \n' % offset for offset in offsets))
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+              % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+# --- Worker pool and cache ---------------------------------------------------
+
+def _get_pool():
+    global _pool, _pool_pid
+    # Threads do not survive a fork, so each worker process starts its own pool
+    if _pool_pid != os.getpid():
+        with _lock:
+            if _pool_pid != os.getpid():
+                _pool = (ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='pdf'),
+                         threading.BoundedSemaphore(WORKERS + QUEUE_SIZE))
+                _pool_pid = os.getpid()
+                _inflight.clear()
+    return _pool
+
+
+def _cached(key):
+    with _lock:
+        pdf = _cache.get(key)
+        if pdf is not None:
+            _cache.move_to_end(key)
+        return pdf
+
+
+def _store(key, pdf):
+    global _cache_bytes
+    if len(pdf) > CACHE_BYTES:
+        return
+    with _lock:
+        if key in _cache:
+            return
+        _cache[key] = pdf
+        _cache_bytes += len(pdf)
+        while _cache_bytes > CACHE_BYTES:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted)
+
+
+def _render_job(key, prescription):
+    start = time.perf_counter()
+    pdf = render(prescription)
+    metrics.PDF_RENDER_TIME.observe((), time.perf_counter() - start)
+    _store(key, pdf)
+    return pdf
+
+
+def submit(prescription, wait=False):
+    """A Future for the prescription's PDF, or None when the pool is full (unless wait=True)"""
+    key = cache_key(prescription)
+    pdf = _cached(key)
+    if pdf is not None:
+        done = Future()
+        done.set_result(pdf)
+        return done
+
+    executor, slots = _get_pool()
+    with _lock:
+        future = _inflight.get(key)
+    if future is not None:
+        return future
+    if not slots.acquire(blocking=wait):
+        return None
+    with _lock:
+        future = _inflight.get(key)
+        if future is None:
+            future = _inflight[key] = executor.submit(_render_job, key, prescription)
+            owner = True
+        else:
+            owner = False
+    if not owner:
+        slots.release()
+        return future
+
+    def _done(_):
+        with _lock:
+            _inflight.pop(key, None)
+        slots.release()
+    future.add_done_callback(_done)
+    return future
+
+
+def zip_stream(prescriptions):
+    """Yield a ZIP of the prescriptions' PDFs plus an index.csv, rendering a few ahead of the download"""
+    sink = records.ZipSink()
+    index = io.StringIO()
+    writer = csv.writer(index)
+    writer.writerow(['file', 'prescription', 'date', 'patient', 'doctor', 'status'])
+    pending = deque()
+    rows = iter(prescriptions)
+    ahead = WORKERS * 2
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        while True:
+            while len(pending) < ahead:
+                prescription = next(rows, None)
+                if prescription is None:
+                    break
+                pending.append((prescription, submit(prescription, wait=True)))
+            if not pending:
+                break
+            prescription, future = pending.popleft()
+            try:
+                pdf = future.result(timeout=RENDER_TIMEOUT)
+            except Exception as e:
+                logger.error(f"❌ Could not render prescription {prescription['id']}: {e}")
+                continue
+            name = filename(prescription)
+            info = zipfile.ZipInfo(name, date_time=_modified(prescription).timetuple()[:6])
+            archive.writestr(info, pdf)
+            writer.writerow([name, prescription['id'], prescription['date'].isoformat(),
+                             prescription.get('patient_name') or '', prescription.get('doctor_name') or '',
+                             prescription.get('status') or ''])
+            yield sink.take()
+        archive.writestr('index.csv', index.getvalue())
+    yield sink.take()
@@ -0,0 +1,529 @@
+"""
+Who is online: per-room and per-user presence and typing indicators.
+
+Every Socket.IO connection of a logged-in user counts towards that user
+being online, and every chat room it joins towards being present in the
+room. Counts are kept per worker process in flat dicts of user ids, so a
+reconnect or a second tab is one increment, and only the first
+connection and the last disconnect change anything visible.
+
+- Room presence is not announced per join/leave. Rooms that changed are
+  collected and, once per PRESENCE_BROADCAST_MS, each gets one 'presence'
+  event with who is online and who joined or left since the last one.
+  A reload (leave and join within the window) sends nothing. Compact
+  protocol clients get the same net changes as join/leave batch entries.
+- Typing is broadcast when a user starts and when they stop (explicitly,
+  by sending a message, by leaving, or after PRESENCE_TYPING_TIMEOUT
+  seconds without a refresh); refreshes in between are not relayed.
+- Patients with a pending appointment, or one confirmed for today, are
+  in that doctor's queue. queue_online(doctor_id) reads a per-doctor
+  dict of online patients, so the dashboard query costs the same no
+  matter how many users are connected, and doctors are pushed a
+  coalesced 'queue_presence' event when it changes.
+
+With REDIS_URL set, workers exchange presence changes over Redis
+pub/sub (and a full snapshot every PRESENCE_SYNC_SECONDS, so a worker
+that died is forgotten after three missed snapshots); each worker keeps
+the merged view in memory and broadcasts to its own clients. Without
+Redis, presence covers the clients of the current process.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+import chat_protocol
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_WINDOW = float(os.environ.get('PRESENCE_BROADCAST_MS', 500)) / 1000.0
+TYPING_TIMEOUT = float(os.environ.get('PRESENCE_TYPING_TIMEOUT', 6))
+SYNC_INTERVAL = float(os.environ.get('PRESENCE_SYNC_SECONDS', 10))
+CHANNEL = 'telemedicine:presence'
+
+QUEUE_QUERY = """
+    SELECT DISTINCT doctor_id FROM appointments
+    WHERE patient_id = %s
+      AND (status = 'pending' OR (appointment_date = CURRENT_DATE AND status IN ('confirmed', 'scheduled')))
+"""
+
+_socketio = None
+_lock = threading.Lock()
+
+# This process's connections
+_sids = {}            # sid -> (user_id, set of rooms)
+_local_users = {}     # user_id -> open connections
+_local_rooms = {}     # (room, user_id) -> open connections in the room
+_typing = {}          # (room, user_id) -> monotonic time the indicator expires
+
+# Merged view over all workers; counts are numbers of workers
+_workers = {}         # worker id -> {'users': {user_id: (username, name, role, doctors)}, 'rooms': {room: set}, 'seen': t}
+_online = {}          # user_id -> workers where the user is online
+_info = {}            # user_id -> (username, name, role, doctors)
+_room_online = {}     # room -> {user_id: workers}
+_queue_online = {}    # doctor_id -> {patient_id: workers}
+
+# Coalesced broadcasts
+_dirty_rooms = set()
+_dirty_queues = set()
+_sent_rooms = {}      # room -> usernames in the last 'presence' event
+_sent_queues = {}     # doctor_id -> patient ids in the last 'queue_presence' event
+_flush_scheduled = False
+
+_bus = None
+_bus_pid = None
+_worker = None
+
+
+def init_app(socketio):
+    global _socketio
+    _socketio = socketio
+
+
+def user_room(user_id):
+    """Socket.IO room holding every connection of one user"""
+    return f"user:{user_id}"
+
+
+def queue_doctors(cursor, patient_id):
+    """Doctors whose waiting queue the patient is in"""
+    cursor.execute(QUEUE_QUERY, (patient_id,))
+    return [row['doctor_id'] for row in cursor.fetchall()]
+
+
+# --- Merged view (call with _lock held) --------------------------------------
+
+def _worker_state(worker):
+    state = _workers.get(worker)
+    if state is None:
+        state = _workers[worker] = {'users': {}, 'rooms': {}, 'seen': time.monotonic()}
+    return state
+
+
+def _count(counts, key, delta):
+    """Adjust a count, dropping it at zero; True when the key appeared or disappeared"""
+    value = counts.get(key, 0) + delta
+    if value > 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+    return value == (1 if delta > 0 else 0)
+
+
+def _queue_count(doctor_id, user_id, delta):
+    queue = _queue_online.setdefault(doctor_id, {})
+    if _count(queue, user_id, delta):
+        _dirty_queues.add(doctor_id)
+    if not queue:
+        del _queue_online[doctor_id]
+
+
+def _add_user(worker, user_id, info):
+    users = _worker_state(worker)['users']
+    if user_id in users:
+        return
+    users[user_id] = info
+    _info[user_id] = info
+    _count(_online, user_id, 1)
+    for doctor_id in info[3]:
+        _queue_count(doctor_id, user_id, 1)
+
+
+def _remove_user(worker, user_id):
+    info = _workers.get(worker, {}).get('users', {}).pop(user_id, None)
+    if info is None:
+        return
+    if _count(_online, user_id, -1):
+        _info.pop(user_id, None)
+    for doctor_id in info[3]:
+        _queue_count(doctor_id, user_id, -1)
+
+
+def _add_room(worker, room, user_id):
+    members = _worker_state(worker)['rooms'].setdefault(room, set())
+    if user_id in members:
+        return
+    members.add(user_id)
+    if _count(_room_online.setdefault(room, {}), user_id, 1):
+        _dirty_rooms.add(room)
+
+
+def _remove_room(worker, room, user_id):
+    rooms = _workers.get(worker, {}).get('rooms', {})
+    members = rooms.get(room)
+    if not members or user_id not in members:
+        return
+    members.discard(user_id)
+    if not members:
+        del rooms[room]
+    online = _room_online.get(room, {})
+    if _count(online, user_id, -1):
+        _dirty_rooms.add(room)
+    if not online:
+        _room_online.pop(room, None)
+
+
+def _add_queue(worker, user_id, doctor_id):
+    users = _workers.get(worker, {}).get('users', {})
+    info = users.get(user_id)
+    if info is None or doctor_id in info[3]:
+        return
+    users[user_id] = info = info[:3] + (info[3] + (doctor_id,),)
+    _info[user_id] = info
+    _queue_count(doctor_id, user_id, 1)
+
+
+def _drop_worker(worker):
+    state = _workers.get(worker)
+    if state is None:
+        return
+    for room, members in list(state['rooms'].items()):
+        for user_id in list(members):
+            _remove_room(worker, room, user_id)
+    for user_id in list(state['users']):
+        _remove_user(worker, user_id)
+    del _workers[worker]
+
+
+def _apply_snapshot(worker, users, rooms):
+    state = _worker_state(worker)
+    users = {int(user_id): (info[0], info[1], info[2], tuple(info[3])) for user_id, info in users.items()}
+    rooms = {room: set(members) for room, members in rooms.items()}
+    for room, members in list(state['rooms'].items()):
+        for user_id in members - rooms.get(room, set()):
+            _remove_room(worker, room, user_id)
+    for user_id in set(state['users']) - set(users):
+        _remove_user(worker, user_id)
+    for user_id, info in users.items():
+        if user_id in state['users'] and state['users'][user_id][3] != info[3]:
+            _remove_user(worker, user_id)
+        _add_user(worker, user_id, info)
+    for room, members in rooms.items():
+        for user_id in members:
+            _add_room(worker, room, user_id)
+
+
+# --- This process's connections ----------------------------------------------
+
+def connect(sid, user_id, username, name, role, doctors=()):
+    """Track a logged-in user's new Socket.IO connection"""
+    _ensure_bus()
+    info = (username, name or username, role, tuple(doctors))
+    with _lock:
+        _sids[sid] = (user_id, set())
+        first = _count(_local_users, user_id, 1)
+        if first:
+            _add_user(_worker, user_id, info)
+    if first:
+        _publish({'op': '+u', 'u': user_id, 'i': info})
+    _schedule()
+
+
+def join(sid, room):
+    with _lock:
+        entry = _sids.get(sid)
+        if entry is None or room in entry[1]:
+            return
+        entry[1].add(room)
+        user_id = entry[0]
+        first = _count(_local_rooms, (room, user_id), 1)
+        if first:
+            _add_room(_worker, room, user_id)
+    if first:
+        _publish({'op': '+r', 'r': room, 'u': user_id})
+    _schedule()
+
+
+def leave(sid, room):
+    with _lock:
+        entry = _sids.get(sid)
+        if entry is None or room not in entry[1]:
+            return
+        entry[1].discard(room)
+        user_id = entry[0]
+        last = _count(_local_rooms, (room, user_id), -1)
+        if last:
+            _remove_room(_worker, room, user_id)
+    if last:
+        typing(sid, room, False, force=True)
+        _publish({'op': '-r', 'r': room, 'u': user_id})
+    _schedule()
+
+
+def disconnect(sid):
+    with _lock:
+        entry = _sids.get(sid)
+        rooms = list(entry[1]) if entry else ()
+    for room in rooms:
+        leave(sid, room)
+    with _lock:
+        entry = _sids.pop(sid, None)
+        if entry is None:
+            return
+        user_id = entry[0]
+        last = _count(_local_users, user_id, -1)
+        if last:
+            _remove_user(_worker, user_id)
+    if last:
+        _publish({'op': '-u', 'u': user_id})
+    _schedule()
+
+
+def queue_add(patient_id, doctor_id):
+    """A patient just entered a doctor's queue (e.g. booked an appointment)"""
+    with _lock:
+        for worker in list(_workers):
+            _add_queue(worker, patient_id, doctor_id)
+    _publish({'op': 'q', 'u': patient_id, 'd': doctor_id})
+    _schedule()
+
+
+def is_online(user_id):
+    return user_id in _online
+
+
+def room_online(room):
+    """Usernames present in a chat room"""
+    with _lock:
+        return sorted(_info[user_id][0] for user_id in _room_online.get(room, ()) if user_id in _info)
+
+
+def queue_online(doctor_id):
+    """Online patients in the doctor's queue as [{'id', 'name'}]"""
+    with _lock:
+        return [{'id': user_id, 'name': _info[user_id][1]}
+                for user_id in _queue_online.get(doctor_id, ()) if user_id in _info]
+
+
+# --- Typing ------------------------------------------------------------------
+
+def typing(sid, room, active, force=False):
+    """Relay a typing indicator when it starts or stops; refreshes only extend it"""
+    with _lock:
+        entry = _sids.get(sid)
+        if entry is None or (room not in entry[1] and not force):
+            return
+        user_id = entry[0]
+        key = (room, user_id)
+        if active:
+            refresh = key in _typing
+            _typing[key] = time.monotonic() + TYPING_TIMEOUT
+            if refresh:
+                return
+        elif _typing.pop(key, None) is None:
+            return
+        username = _info[user_id][0] if user_id in _info else None
+    if username is None:
+        return
+    _emit_typing(room, username, active)
+    _publish({'op': 't', 'r': room, 'n': username, 'v': bool(active)})
+    if active:
+        _socketio.start_background_task(_expire_typing, key, room, username)
+
+
+def _expire_typing(key, room, username):
+    remaining = TYPING_TIMEOUT
+    while True:
+        _socketio.sleep(remaining)
+        with _lock:
+            expires = _typing.get(key)
+            if expires is None:
+                return
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                del _typing[key]
+                break
+    _emit_typing(room, username, False)
+    _publish({'op': 't', 'r': room, 'n': username, 'v': False})
+
+
+def _emit_typing(room, username, active):
+    for target in chat_protocol.all_rooms(room):
+        _socketio.emit('typing', {'username': username, 'typing': active}, to=target)
+
+
+# --- Coalesced broadcasts ----------------------------------------------------
+
+def _schedule():
+    global _flush_scheduled
+    with _lock:
+        if _flush_scheduled or not (_dirty_rooms or _dirty_queues):
+            return
+        _flush_scheduled = True
+    _socketio.start_background_task(_flush_later)
+
+
+def _flush_later():
+    _socketio.sleep(BROADCAST_WINDOW)
+    flush()
+
+
+def flush():
+    """Send one 'presence' event per changed room and one 'queue_presence' per changed queue"""
+    global _flush_scheduled
+    room_updates, queue_updates = [], []
+    with _lock:
+        _flush_scheduled = False
+        rooms = list(_dirty_rooms)
+        queues = list(_dirty_queues)
+        _dirty_rooms.clear()
+        _dirty_queues.clear()
+        for room in rooms:
+            online = frozenset(_info[user_id][0] for user_id in _room_online.get(room, ()) if user_id in _info)
+            before = _sent_rooms.get(room, frozenset())
+            if online == before:
+                continue
+            if online:
+                _sent_rooms[room] = online
+            else:
+                _sent_rooms.pop(room, None)
+            room_updates.append((room, online, online - before, before - online))
+        for doctor_id in queues:
+            patients = _queue_online.get(doctor_id, {})
+            if frozenset(patients) == _sent_queues.get(doctor_id, frozenset()):
+                continue
+            if patients:
+                _sent_queues[doctor_id] = frozenset(patients)
+            else:
+                _sent_queues.pop(doctor_id, None)
+            queue_updates.append((doctor_id, [{'id': user_id, 'name': _info[user_id][1]}
+                                              for user_id in patients if user_id in _info]))
+
+    for room, online, joined, left in room_updates:
+        metrics.PRESENCE_CHANGES.observe((), len(joined) + len(left))
+        payload = {'room': room, 'online': sorted(online), 'joined': sorted(joined), 'left': sorted(left)}
+        for target in chat_protocol.all_rooms(room):
+            _socketio.emit('presence', payload, to=target)
+        for username in sorted(joined):
+            chat_protocol.publish('join', room, username, legacy=False)
+        for username in sorted(left):
+            chat_protocol.publish('leave', room, username, legacy=False)
+    for doctor_id, patients in queue_updates:
+        _socketio.emit('queue_presence', {'count': len(patients), 'patients': patients}, to=user_room(doctor_id))
+
+
+# --- Sharing between workers -------------------------------------------------
+
+class RedisBus:
+    """Presence changes over Redis pub/sub"""
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def publish(self, message):
+        self._client.publish(CHANNEL, json.dumps(message, separators=(',', ':')))
+
+    def listen(self, handle, subscribed):
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(CHANNEL)
+        subscribed()
+        try:
+            for item in pubsub.listen():
+                handle(json.loads(item['data']))
+        finally:
+            pubsub.close()
+
+
+def _create_bus():
+    redis_url = os.environ.get('REDIS_URL')
+    if not redis_url:
+        return None
+    try:
+        return RedisBus(redis_url)
+    except ImportError:
+        logger.warning("REDIS_URL is set but the redis package is not installed; presence is per process")
+        return None
+
+
+def _ensure_bus():
+    global _bus, _bus_pid, _worker
+    # Started lazily in each process, after any preload fork
+    if _bus_pid == os.getpid():
+        return
+    with _lock:
+        if _bus_pid == os.getpid():
+            return
+        _bus_pid = os.getpid()
+        _worker = f"{socket.gethostname()}:{os.getpid()}"
+        _bus = _create_bus()
+    if _bus is not None:
+        threading.Thread(target=_listen_loop, name='presence-listen', daemon=True).start()
+        threading.Thread(target=_sync_loop, name='presence-sync', daemon=True).start()
+
+
+def _publish(message):
+    if _bus is None:
+        return
+    message['w'] = _worker
+    try:
+        _bus.publish(message)
+    except Exception as e:
+        logger.warning(f"⚠️ Could not publish presence change: {e}")
+
+
+def _snapshot():
+    with _lock:
+        state = _workers.get(_worker, {'users': {}, 'rooms': {}})
+        return {'op': 'snap', 'users': {str(user_id): list(info) for user_id, info in state['users'].items()},
+                'rooms': {room: list(members) for room, members in state['rooms'].items()}}
+
+
+def _handle(message):
+    worker = message.get('w')
+    if not worker or worker == _worker:
+        return
+    op = message.get('op')
+    if op == 'hello':
+        _publish(_snapshot())
+        return
+    if op == 't':
+        _emit_typing(message['r'], message['n'], message['v'])
+        return
+    with _lock:
+        _worker_state(worker)['seen'] = time.monotonic()
+        if op == 'snap':
+            _apply_snapshot(worker, message['users'], message['rooms'])
+        elif op == '+u':
+            info = message['i']
+            _add_user(worker, message['u'], (info[0], info[1], info[2], tuple(info[3])))
+        elif op == '-u':
+            _remove_user(worker, message['u'])
+        elif op == '+r':
+            _add_room(worker, message['r'], message['u'])
+        elif op == '-r':
+            _remove_room(worker, message['r'], message['u'])
+        elif op == 'q':
+            # Every worker holding the patient, our own included, or its next snapshot undoes this
+            for holder in list(_workers):
+                _add_queue(holder, message['u'], message['d'])
+    _schedule()
+
+
+def _listen_loop():
+    delay = 1.0
+    while True:
+        try:
+            # Ask the others for their state whenever we (re)subscribe
+            _bus.listen(_handle, lambda: _publish({'op': 'hello'}))
+            delay = 1.0
+        except Exception as e:
+            logger.warning(f"⚠️ Presence bus disconnected, retrying in {delay:g}s: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+
+def _sync_loop():
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        _publish(_snapshot())
+        cutoff = time.monotonic() - 3 * SYNC_INTERVAL
+        with _lock:
+            for worker in [w for w, state in _workers.items() if w != _worker and state['seen'] < cutoff]:
+                logger.info(f"👋 Forgetting presence from silent worker {worker}")
+                _drop_worker(worker)
+        _schedule()
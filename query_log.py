@@ -0,0 +1,166 @@
+"""
+Slow-query logging and per-shape SQL statistics.
+
+Every statement run through the instrumented cursor is normalized into a
+query shape (literals and whitespace stripped) and aggregated here. Queries
+slower than SLOW_QUERY_MS are logged with a fingerprint of their parameters,
+never the values, since they routinely contain patient data. With
+SLOW_QUERY_EXPLAIN=1 the plan of a slow read-only query is captured with
+EXPLAIN (ANALYZE, BUFFERS), at most once per shape per SLOW_QUERY_EXPLAIN_INTERVAL
+seconds because ANALYZE runs the query a second time.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 200))
+EXPLAIN_SLOW = os.environ.get('SLOW_QUERY_EXPLAIN', '').lower() in ('1', 'true', 'yes')
+EXPLAIN_INTERVAL = float(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL', 300))
+MAX_SHAPES = int(os.environ.get('QUERY_STATS_MAX_SHAPES', 500))
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%\(\w+\)s|%s")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+_READ_ONLY_RE = re.compile(r"^\s*(select|with)\b", re.IGNORECASE)
+# WITH ... INSERT/UPDATE/DELETE, SELECT ... INTO and row locks also start like a read
+_WRITE_RE = re.compile(r"\b(insert|update|delete|merge|into)\b|\bfor\s+(key\s+)?share\b", re.IGNORECASE)
+
+_stats = {}
+_lock = threading.Lock()
+
+
+def is_read_only(shape):
+    """True if running the statement again (EXPLAIN ANALYZE) cannot write or lock anything"""
+    return bool(_READ_ONLY_RE.match(shape)) and not _WRITE_RE.search(shape)
+
+
+def normalize(query):
+    """Reduce a statement to its shape so identical queries with different values group together"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    elif not isinstance(query, str):
+        query = str(query)
+    shape = _STRING_RE.sub('?', query)
+    shape = _PARAM_RE.sub('?', shape)
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _IN_LIST_RE.sub('(?...)', shape)
+    return _SPACE_RE.sub(' ', shape).strip()
+
+
+def fingerprint(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+
+def fingerprint_params(params):
+    """Describe parameters by type and a short hash so logs never contain their values"""
+    if params is None:
+        return []
+    if isinstance(params, dict):
+        items = sorted(params.items())
+    else:
+        items = enumerate(params)
+    return [f"{key}:{type(value).__name__}:{fingerprint(repr(value))[:8]}" for key, value in items]
+
+
+class QueryShape:
+    __slots__ = ('shape', 'fingerprint', 'calls', 'total_time', 'max_time', 'slow_calls', 'rows',
+                 'last_explain_at', 'last_plan')
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.fingerprint = fingerprint(shape)
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.slow_calls = 0
+        self.rows = 0
+        self.last_explain_at = 0.0
+        self.last_plan = None
+
+    def as_dict(self):
+        return {
+            'fingerprint': self.fingerprint,
+            'query': self.shape,
+            'calls': self.calls,
+            'total_ms': round(self.total_time * 1000, 3),
+            'mean_ms': round(self.total_time * 1000 / self.calls, 3) if self.calls else 0,
+            'max_ms': round(self.max_time * 1000, 3),
+            'slow_calls': self.slow_calls,
+            'rows': self.rows,
+            'last_plan': self.last_plan,
+        }
+
+
+def _get_shape(shape):
+    entry = _stats.get(shape)
+    if entry is None:
+        if len(_stats) >= MAX_SHAPES:
+            # Drop the cheapest shape so a flood of ad-hoc statements can't grow memory
+            cheapest = min(_stats.values(), key=lambda s: s.total_time)
+            del _stats[cheapest.shape]
+        entry = _stats[shape] = QueryShape(shape)
+    return entry
+
+
+def _explain(cursor, query, params):
+    explain_cursor = cursor.connection.cursor(cursor_factory=psycopg2.extensions.cursor)
+    try:
+        explain_cursor.execute("EXPLAIN (ANALYZE, BUFFERS) " + query, params)
+        return '\n'.join(row[0] for row in explain_cursor.fetchall())
+    finally:
+        explain_cursor.close()
+
+
+def record(cursor, query, params, duration):
+    """Aggregate one execution and log it if it was slow"""
+    shape = normalize(query)
+    slow = duration * 1000 >= SLOW_QUERY_MS
+    now = time.monotonic()
+    with _lock:
+        entry = _get_shape(shape)
+        entry.calls += 1
+        entry.total_time += duration
+        entry.max_time = max(entry.max_time, duration)
+        entry.rows += max(cursor.rowcount, 0)
+        want_plan = False
+        if slow:
+            entry.slow_calls += 1
+            want_plan = EXPLAIN_SLOW and now - entry.last_explain_at >= EXPLAIN_INTERVAL and is_read_only(shape)
+            if want_plan:
+                entry.last_explain_at = now
+
+    if not slow:
+        return
+
+    logger.warning(f"🐢 Slow query {entry.fingerprint} took {duration * 1000:.1f} ms: {shape} "
+                   f"params={fingerprint_params(params)}")
+    if want_plan:
+        try:
+            plan = _explain(cursor, query, params)
+        except Exception as e:
+            logger.warning(f"Could not EXPLAIN query {entry.fingerprint}: {e}")
+            return
+        entry.last_plan = plan
+        logger.warning(f"Plan for query {entry.fingerprint}:\n{plan}")
+
+
+def snapshot(limit=50):
+    """Query shapes ordered by total time spent, most expensive first"""
+    with _lock:
+        shapes = sorted(_stats.values(), key=lambda s: s.total_time, reverse=True)[:limit]
+        return [s.as_dict() for s in shapes]
+
+
+def reset():
+    with _lock:
+        _stats.clear()
@@ -0,0 +1,174 @@
+"""
+Token-bucket rate limiting for login and registration.
+
+Buckets live in a bounded in-process LRU so memory stays constant no matter
+how many IPs or usernames a bot cycles through. When REDIS_URL is set the
+buckets are kept in Redis instead, so every gunicorn worker shares the same
+limits; Redis calls time out after RATE_LIMIT_REDIS_TIMEOUT seconds and,
+after a failure, the in-process buckets are used for RATE_LIMIT_REDIS_RETRY
+seconds, so a Redis outage never stalls logins.
+
+Logins have a tight bucket per username and client IP, which slows down
+password guessing from one address, and a looser bucket per username that
+only failed logins are charged against, which stops credential stuffing
+spread over many addresses. One address cannot fail often enough to drain
+the per-username bucket, so a single attacker cannot lock a patient or
+doctor out of their account.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# scope -> key kind -> (capacity, refill period in seconds)
+LIMITS = {
+    'login': {
+        'ip': (int(os.environ.get('LOGIN_LIMIT_PER_IP', 20)), 60),
+        'username_ip': (int(os.environ.get('LOGIN_LIMIT_PER_USERNAME', 5)), 300),
+    },
+    # Charged only for failed logins; keep it above what one IP may try (LOGIN_LIMIT_PER_USERNAME)
+    'login_failure': {
+        'username': (int(os.environ.get('LOGIN_FAILURE_LIMIT_PER_USERNAME', 100)), 3600),
+    },
+    'register': {
+        'ip': (int(os.environ.get('REGISTER_LIMIT_PER_IP', 5)), 3600),
+    },
+}
+
+MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 50000))
+TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', 1))
+REDIS_TIMEOUT = float(os.environ.get('RATE_LIMIT_REDIS_TIMEOUT', 0.25))
+REDIS_RETRY = float(os.environ.get('RATE_LIMIT_REDIS_RETRY', 30))
+
+
+class MemoryStore:
+    """Token buckets in an LRU-ordered dict; every operation is O(1)"""
+
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, period, now=None, cost=1):
+        """Take cost tokens (0 only checks) from the bucket; return 0 if allowed, else seconds until a token is available"""
+        now = time.monotonic() if now is None else now
+        rate = capacity / float(period)
+        with self._lock:
+            entry = self._buckets.pop(key, None)
+            if entry is None:
+                tokens = float(capacity)
+            else:
+                tokens, last = entry
+                tokens = min(float(capacity), tokens + (now - last) * rate)
+
+            if tokens >= 1:
+                tokens -= cost
+                retry_after = 0
+            else:
+                retry_after = (1 - tokens) / rate
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Refill and take a token atomically inside Redis
+REDIS_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - cost
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(retry_after)
+"""
+
+
+class RedisStore:
+    """Token buckets shared across workers through Redis"""
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url, socket_timeout=REDIS_TIMEOUT,
+                                            socket_connect_timeout=REDIS_TIMEOUT)
+        self._script = self._client.register_script(REDIS_SCRIPT)
+
+    def consume(self, key, capacity, period, now=None, cost=1):
+        now = time.time() if now is None else now
+        rate = capacity / float(period)
+        return float(self._script(keys=['ratelimit:' + key], args=[capacity, rate, now, cost]))
+
+
+def _create_store():
+    redis_url = os.environ.get('REDIS_URL')
+    if redis_url:
+        try:
+            store = RedisStore(redis_url)
+            logger.info("Using Redis rate-limit store")
+            return store
+        except ImportError:
+            logger.warning("REDIS_URL is set but the redis package is not installed; using in-process rate limits")
+    return MemoryStore()
+
+
+_store = None
+_fallback = MemoryStore()
+_store_down_until = 0.0
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = _create_store()
+    return _store
+
+
+def client_ip(req):
+    """Client address, trusting only the X-Forwarded-For hops added by our own proxies"""
+    route = req.access_route
+    if TRUSTED_PROXIES and req.headers.get('X-Forwarded-For') and len(route) >= TRUSTED_PROXIES:
+        return route[-TRUSTED_PROXIES]
+    return req.remote_addr or 'unknown'
+
+
+def check(scope, cost=1, **keys):
+    """Consume cost tokens (0 only checks) for every key of the scope; return seconds to wait, or 0 if allowed"""
+    global _store_down_until
+    store = get_store()
+    if _store_down_until > time.monotonic():
+        store = _fallback
+    retry_after = 0
+    for kind, (capacity, period) in LIMITS[scope].items():
+        value = keys.get(kind)
+        if not value:
+            continue
+        key = f"{scope}:{kind}:{str(value).lower()}"
+        try:
+            wait = store.consume(key, capacity, period, cost=cost)
+        except Exception as e:
+            # A Redis outage must neither lock everybody out nor make every login wait on it
+            logger.warning(f"Rate-limit store error, using in-process buckets for {REDIS_RETRY:g}s: {e}")
+            _store_down_until = time.monotonic() + REDIS_RETRY
+            store = _fallback
+            wait = _fallback.consume(key, capacity, period, cost=cost)
+        retry_after = max(retry_after, wait)
+    return retry_after
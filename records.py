@@ -0,0 +1,249 @@
+"""
+Health record file store.
+
+Uploaded files live outside static/ in HEALTH_RECORDS_DIR, one directory
+per patient, and are only served through authorized routes. Size, content
+type and original name are stored on the health_records row at upload time,
+so listings never touch the disk. Records uploaded before this store were
+saved as bare file names in static/uploads and are still resolved there.
+
+Single files are handed to the server's wsgi.file_wrapper, which gunicorn
+turns into a zero-copy sendfile() (also for Range requests: the file is
+positioned at the range start and Content-Length bounds the transfer).
+A patient's full record is streamed as a ZIP built on the fly, chunk by
+chunk, without temporary files.
+"""
+
+import csv
+import io
+import logging
+import mimetypes
+import os
+import uuid
+import zipfile
+
+from flask import Response, request
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+RECORDS_DIR = os.environ.get('HEALTH_RECORDS_DIR', 'health_records')
+LEGACY_DIR = 'static/uploads'
+ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
+# Types served inline; anything else is sent as an octet-stream download
+INLINE_TYPES = {'application/pdf', 'image/png', 'image/jpeg'}
+CHUNK_SIZE = 64 * 1024
+
+LIST_QUERY = """
+    SELECT h.id, h.patient_id, h.doctor_id, h.record_type, h.description, h.file_path,
+           h.date, h.file_size, h.content_type, h.original_name, u.name AS doctor_name
+    FROM health_records h
+    LEFT JOIN users u ON h.doctor_id = u.id
+    WHERE h.patient_id = %s
+    ORDER BY h.date DESC
+"""
+
+
+def ensure_schema(cursor):
+    """File metadata columns and the per-patient listing index"""
+    cursor.execute("""
+        ALTER TABLE health_records
+            ADD COLUMN IF NOT EXISTS file_size BIGINT,
+            ADD COLUMN IF NOT EXISTS content_type VARCHAR(100),
+            ADD COLUMN IF NOT EXISTS original_name VARCHAR(255)
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_health_records_patient_date ON health_records(patient_id, date DESC)")
+
+
+def allowed(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def content_type(name):
+    """Content type from the (already checked) extension, never from what the client declared"""
+    guessed = mimetypes.guess_type(name)[0]
+    return guessed if guessed in INLINE_TYPES else 'application/octet-stream'
+
+
+def resolve(file_path):
+    """Absolute path of a stored file; new records are '<patient_id>/<name>', legacy ones a bare name"""
+    base = os.path.abspath(RECORDS_DIR if '/' in file_path else LEGACY_DIR)
+    path = os.path.abspath(os.path.join(base, file_path))
+    if os.path.commonpath([base, path]) != base:
+        raise FileNotFoundError(file_path)
+    return path
+
+
+def save_upload(cursor, patient_id, doctor_id, record_type, description, upload):
+    """Store an uploaded file and insert its health_records row; returns the new record id"""
+    original_name = secure_filename(upload.filename) or 'record'
+    file_path = f"{patient_id}/{uuid.uuid4().hex[:12]}_{original_name}"
+    path = resolve(file_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    upload.save(path)
+    cursor.execute("""
+        INSERT INTO health_records (patient_id, doctor_id, record_type, description, file_path,
+                                    file_size, content_type, original_name)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        RETURNING id
+    """, (patient_id, doctor_id, record_type, description, file_path,
+          os.path.getsize(path), content_type(original_name), upload.filename[:255]))
+    return cursor.fetchone()['id']
+
+
+def list_records(cursor, patient_id):
+    cursor.execute(LIST_QUERY, (patient_id,))
+    return cursor.fetchall()
+
+
+def get_record(cursor, record_id):
+    cursor.execute("SELECT * FROM health_records WHERE id = %s", (record_id,))
+    return cursor.fetchone()
+
+
+def can_access(cursor, user_id, role, patient_id):
+    """Patients see their own records; doctors those of patients they have an appointment with"""
+    if role == 'patient':
+        return user_id == patient_id
+    if role == 'doctor':
+        cursor.execute("""
+            SELECT 1 FROM appointments WHERE doctor_id = %s AND patient_id = %s
+            UNION ALL
+            SELECT 1 FROM health_records WHERE doctor_id = %s AND patient_id = %s
+            LIMIT 1
+        """, (user_id, patient_id, user_id, patient_id))
+        return cursor.fetchone() is not None
+    return False
+
+
+def download_name(record):
+    if record.get('original_name'):
+        return secure_filename(record['original_name']) or f"record_{record['id']}"
+    return os.path.basename(record['file_path'])
+
+
+def _read_range(f, length):
+    try:
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def send_record(record, as_attachment=False):
+    """Response streaming a record's file with Range, ETag and sendfile support; None if the file is gone"""
+    try:
+        f = open(resolve(record['file_path']), 'rb')
+    except OSError:
+        return None
+    size = record.get('file_size')
+    if size is None:
+        size = os.fstat(f.fileno()).st_size
+
+    # Stored files are never rewritten, so id and size identify the content
+    etag = f"hr-{record['id']}-{size}"
+    # From the stored name, not the row: older rows hold the type the client declared
+    mimetype = content_type(record['file_path'])
+    disposition = 'attachment' if as_attachment or mimetype not in INLINE_TYPES else 'inline'
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'private, max-age=86400',
+        'Content-Disposition': f'{disposition}; filename="{download_name(record)}"',
+        'X-Content-Type-Options': 'nosniff',
+    }
+
+    if request.if_none_match.contains(etag):
+        f.close()
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    status, start, length = 200, 0, size
+    byte_range = request.range
+    # A stale If-Range means the client's partial copy is of something else: send it all
+    if byte_range and ('If-Range' not in request.headers or request.if_range.etag == etag):
+        bounds = byte_range.range_for_length(size)
+        if bounds is None:
+            f.close()
+            headers['Content-Range'] = f"bytes */{size}"
+            return Response(status=416, headers=headers)
+        start, stop = bounds
+        status, length = 206, stop - start
+        headers['Content-Range'] = f"bytes {start}-{stop - 1}/{size}"
+        f.seek(start)
+
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    if file_wrapper and (status == 200 or request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn')):
+        body = file_wrapper(f, CHUNK_SIZE)
+    else:
+        body = _read_range(f, length)
+    response = Response(body, status=status, headers=headers, mimetype=mimetype, direct_passthrough=True)
+    response.content_length = length
+    response.set_etag(etag)
+    return response
+
+
+class ZipSink:
+    """Unseekable write target; zipfile then writes data descriptors instead of seeking back"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _archive_name(record, used):
+    name = download_name(record)
+    stem, ext = os.path.splitext(name)
+    day = record['date'].strftime('%Y-%m-%d') if record.get('date') else 'undated'
+    candidate = f"{day}_{secure_filename(record['record_type']) or 'record'}_{stem}{ext}"
+    if candidate in used:
+        candidate = f"{day}_{record['id']}_{stem}{ext}"
+    used.add(candidate)
+    return candidate
+
+
+def zip_stream(records):
+    """Yield a ZIP of the given records' files (stored, not deflated) plus an index.csv"""
+    sink = ZipSink()
+    used = set()
+    index = io.StringIO()
+    writer = csv.writer(index)
+    writer.writerow(['file', 'date', 'type', 'description', 'doctor'])
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for record in records:
+            try:
+                src = open(resolve(record['file_path']), 'rb')
+            except OSError:
+                logger.warning(f"Health record {record['id']} file missing: {record['file_path']}")
+                continue
+            name = _archive_name(record, used)
+            info = zipfile.ZipInfo(name, date_time=(record['date'].timetuple()[:6] if record.get('date')
+                                                    else (1980, 1, 1, 0, 0, 0)))
+            info.compress_type = zipfile.ZIP_STORED
+            with src, archive.open(info, 'w', force_zip64=(record.get('file_size') or 0) > 2 ** 31) as dest:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield sink.take()
+            writer.writerow([name, record['date'].isoformat() if record.get('date') else '',
+                             record['record_type'], record.get('description') or '', record.get('doctor_name') or ''])
+            yield sink.take()
+        archive.writestr('index.csv', index.getvalue())
+    yield sink.take()
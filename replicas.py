@@ -0,0 +1,134 @@
+"""
+Read-replica routing.
+
+Route handlers decorated with @read_only take their database connection
+from one of the streaming replicas in DATABASE_REPLICA_URLS (comma
+separated) on GET requests; everything else, including background jobs
+and socket events, uses the primary DATABASE_URL.
+
+Each replica's lag is measured on the connection the request just opened,
+at most once every REPLICA_LAG_CHECK_SECONDS. A replica lagging more than
+REPLICA_MAX_LAG_SECONDS, or one that cannot be reached, is skipped until
+the next check, and the read falls back to the primary.
+
+After a logged-in user's own successful write (any non-GET request), their
+reads stay on the primary for REPLICA_MAX_LAG_SECONDS plus
+REPLICA_LAG_CHECK_SECONDS, the longest a replica we still use can be
+behind, so a patient who just booked sees the booking on the next page.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from functools import wraps
+
+from flask import g, has_request_context, request, session
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', 5))
+STICKY_SECONDS = MAX_LAG + CHECK_INTERVAL
+
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END AS lag
+"""
+
+
+class Replica:
+    __slots__ = ('name', 'url', 'lag', 'checked', 'healthy')
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.lag = None
+        self.checked = 0.0
+        self.healthy = True
+
+
+_replicas = [Replica(f'replica-{i}', url) for i, url in enumerate(REPLICA_URLS)]
+_lock = threading.Lock()
+
+
+def read_only(f):
+    """Mark a route handler as read-only: its GET requests may read from a replica"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if request.method == 'GET':
+            g.db_read_only = True
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def wants_replica():
+    """True when the current request may be served from a replica"""
+    if not _replicas or not has_request_context() or not g.get('db_read_only'):
+        return False
+    return session.get('db_primary_until', 0) <= time.time()
+
+
+def _measure(replica, conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(LAG_QUERY)
+        lag = cursor.fetchone()['lag']
+    finally:
+        cursor.close()
+    replica.lag = float(lag) if lag is not None else None
+    replica.healthy = replica.lag is not None and replica.lag <= MAX_LAG
+    if replica.lag is not None:
+        metrics.DB_REPLICA_LAG.observe((replica.name,), replica.lag)
+    if not replica.healthy:
+        logger.warning(f"⚠️ {replica.name} lagging ({replica.lag if replica.lag is not None else 'unknown'} s), "
+                       f"reading from the primary")
+
+
+def connect(open_connection):
+    """A connection to a healthy replica via open_connection(url), or None to use the primary"""
+    now = time.monotonic()
+    with _lock:
+        candidates = [r for r in _replicas if r.healthy or now - r.checked >= CHECK_INTERVAL]
+    random.shuffle(candidates)
+    for replica in candidates:
+        try:
+            conn = open_connection(replica.url)
+        except Exception as e:
+            with _lock:
+                if replica.healthy:
+                    logger.warning(f"⚠️ {replica.name} unavailable, reading from the primary: {e}")
+                replica.healthy, replica.checked = False, now
+            continue
+        if now - replica.checked < CHECK_INTERVAL and replica.healthy:
+            return conn
+        try:
+            with _lock:
+                replica.checked = now
+            _measure(replica, conn)
+        except Exception as e:
+            logger.warning(f"⚠️ Could not measure {replica.name} lag: {e}")
+            replica.healthy = False
+        if replica.healthy:
+            return conn
+        conn.close()
+    return None
+
+
+def init_app(app):
+    if not _replicas:
+        return
+    logger.info(f"📚 Routing read-only pages to {len(_replicas)} replica(s), max lag {MAX_LAG:g}s")
+
+    @app.after_request
+    def _stick_to_primary(response):
+        # The user's next reads must see what they just wrote
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400 and 'user_id' in session:
+            session['db_primary_until'] = time.time() + STICKY_SECONDS
+        return response
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Export who accessed a patient's data, from the append-only audit_log
+
+    python scripts/audit_log.py --patient 42
+    python scripts/audit_log.py --patient 42 --since 2024-01-01 --until 2024-02-01 --limit 10000 > access.csv
+
+Writes CSV (newest first) to stdout. Chat events are included for every
+room the patient has posted in.
+"""
+
+import argparse
+import csv
+import os
+import sys
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audit
+
+
+def connect():
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        sys.exit("DATABASE_URL environment variable not set")
+    return psycopg2.connect(database_url, sslmode=os.environ.get('DATABASE_SSLMODE', 'require'),
+                            cursor_factory=RealDictCursor)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patient', type=int, required=True, help='patient user id')
+    parser.add_argument('--since', help='ISO date or timestamp (inclusive)')
+    parser.add_argument('--until', help='ISO date or timestamp (exclusive)')
+    parser.add_argument('--limit', type=int, default=1000)
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        cursor = conn.cursor()
+        events = audit.query(cursor, args.patient, args.since, args.until, args.limit)
+    finally:
+        conn.close()
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['at', 'actor_id', 'actor_name', 'actor_role', 'action', 'resource', 'resource_id', 'ip'])
+    for event in events:
+        writer.writerow([event['at'].isoformat(), event['actor_id'], event['actor_name'], event['actor_role'],
+                         event['action'], event['resource'], event['resource_id'], event['ip']])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Bytes-per-message benchmark for the chat protocols
+
+Replays a synthetic consultation (bursty messages, joins and leaves) through
+the legacy per-event encoding and the compact batched encodings, using the
+real Socket.IO packet encoder, and reports WebSocket bytes on the wire per
+chat event. The "+pmd" rows simulate permessage-deflate negotiated by the
+WebSocket server (one compression context per connection).
+
+    python scripts/bench_chat_protocol.py --events 2000 --window-ms 50
+"""
+
+import argparse
+import os
+import random
+import sys
+import zlib
+from datetime import datetime
+
+from socketio import packet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chat_protocol
+
+LINES = ['Hello doctor', 'I have had a fever since yesterday', 'Please take rest and drink fluids',
+         'Should I continue the medicine?', 'Yes, for five more days', 'Thank you', 'ok',
+         'The pain is worse at night, especially after dinner', 'Any allergies?']
+
+
+def ws_frame_size(payload_len):
+    """Server-to-client WebSocket frame: unmasked header plus payload"""
+    if payload_len < 126:
+        return 2 + payload_len
+    if payload_len < 65536:
+        return 4 + payload_len
+    return 10 + payload_len
+
+
+def simulate(events, rng):
+    """A consultation: doctor and patient join, chat in bursts, then leave"""
+    users = ['dr_harpreet_singh', 'patient_gurpreet_kaur']
+    clock = 1_760_860_800_000
+    timeline = [('join', users[0], None, clock), ('join', users[1], None, clock + 2000)]
+    clock += 3000
+    while len(timeline) < events - 2:
+        # A burst of a few quick lines, then a pause while someone types
+        for _ in range(rng.randint(1, 6)):
+            clock += rng.randint(5, 120)
+            timeline.append(('message', rng.choice(users), rng.choice(LINES), clock))
+        clock += rng.randint(2000, 15000)
+    timeline += [('leave', users[1], None, clock + 1000), ('leave', users[0], None, clock + 1500)]
+    return timeline
+
+
+def coalesce(timeline, window_ms):
+    batch = []
+    for event in timeline:
+        if batch and event[3] - batch[0][3] > window_ms:
+            yield batch
+            batch = []
+        batch.append(event)
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure chat bytes per message for each protocol')
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--window-ms', type=int, default=int(chat_protocol.COALESCE_WINDOW * 1000))
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    timeline = simulate(args.events, random.Random(args.seed))
+    totals = {'legacy': 0, 'legacy+pmd': 0, 'compact': 0, 'compact+pmd': 0}
+    frames = dict.fromkeys(totals, 0)
+
+    pmd = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    for kind, username, text, ts in timeline:
+        event, payload = chat_protocol.legacy_payload(kind, username, text, datetime.fromtimestamp(ts / 1000))
+        raw = ('4' + packet.Packet(packet.EVENT, data=[event, payload], namespace='/').encode()).encode('utf-8')
+        totals['legacy'] += ws_frame_size(len(raw))
+        compressed = pmd.compress(raw) + pmd.flush(zlib.Z_SYNC_FLUSH)
+        totals['legacy+pmd'] += ws_frame_size(len(compressed) - 4)
+        frames['legacy'] += 1
+        frames['legacy+pmd'] += 1
+
+    pmd = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    batches = list(coalesce(timeline, args.window_ms))
+    for batch in batches:
+        encoded = chat_protocol.encode_batch(batch)
+        raw = ('4' + packet.Packet(packet.EVENT, data=['batch', encoded], namespace='/').encode()).encode('utf-8')
+        totals['compact'] += ws_frame_size(len(raw))
+        frames['compact'] += 1
+        compressed = pmd.compress(raw) + pmd.flush(zlib.Z_SYNC_FLUSH)
+        totals['compact+pmd'] += ws_frame_size(len(compressed) - 4)
+        frames['compact+pmd'] += 1
+
+    print(f"{len(timeline)} chat events, {len(batches)} batches with a {args.window_ms} ms window\n")
+    print(f"{'protocol':<18} {'frames':>8} {'bytes':>10} {'bytes/event':>12} {'vs legacy':>10}")
+    for name, total in totals.items():
+        print(f"{name:<18} {frames[name]:>8} {total:>10} {total / len(timeline):>12.1f} "
+              f"{(1 - total / totals['legacy']) * 100:>9.1f}%")
+
+
+if __name__ == '__main__':
+    main()
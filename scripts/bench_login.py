@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Login throughput benchmark
+
+Without --url, measures raw hash verification throughput through the
+credential worker pool at increasing concurrency. With --url, drives POST
+/login against a running server from concurrent clients and reports
+throughput and latency percentiles.
+
+    python scripts/bench_login.py --concurrency 1 4 8 16
+    python scripts/bench_login.py --url http://localhost:5000 --username dr_smith --password password123 --role doctor
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import credentials
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def verify_once(stored, password):
+    start = time.perf_counter()
+    credentials.verify_password(stored, password)
+    return time.perf_counter() - start
+
+
+def login_once(url, form):
+    # Don't follow the post-login redirect, we only time the login handler
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    opener = urllib.request.build_opener(NoRedirect)
+    start = time.perf_counter()
+    try:
+        opener.open(url + '/login', data=form, timeout=30).read()
+    except urllib.error.HTTPError:
+        pass
+    return time.perf_counter() - start
+
+
+def run(task, concurrency, requests):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        samples = list(pool.map(lambda _: task(), range(requests)))
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark login throughput')
+    parser.add_argument('--url', help='Base URL of a running server; omit to benchmark the hash pool only')
+    parser.add_argument('--username', default='dr_smith')
+    parser.add_argument('--password', default='password123')
+    parser.add_argument('--role', default='doctor')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    if args.url:
+        form = urllib.parse.urlencode({
+            'username': args.username, 'password': args.password, 'role': args.role,
+        }).encode()
+        task = lambda: login_once(args.url.rstrip('/'), form)
+        print(f"Benchmarking POST {args.url}/login")
+    else:
+        stored = credentials.hash_password(args.password)
+        task = lambda: verify_once(stored, args.password)
+        print(f"Benchmarking {credentials.HASH_METHOD} on {credentials.HASH_WORKERS} hash workers")
+
+    print(f"{'clients':>8} {'req/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    for concurrency in args.concurrency:
+        throughput, samples = run(task, concurrency, args.requests)
+        print(f"{concurrency:>8} {throughput:>10.1f} "
+              f"{statistics.median(samples) * 1000:>10.1f} "
+              f"{percentile(samples, 95) * 1000:>10.1f} "
+              f"{percentile(samples, 99) * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
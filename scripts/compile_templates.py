@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Precompile the Jinja templates into the on-disk bytecode cache
+
+    python scripts/compile_templates.py
+
+Run at build time so freshly started workers load compiled templates
+instead of parsing them on their first requests (see template_cache.py).
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import template_cache
+from app import app
+
+
+def main():
+    start = time.perf_counter()
+    count = template_cache.precompile(app)
+    print(f"{count} templates compiled into {template_cache.BYTECODE_DIR} "
+          f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Compile the UI translation catalogs (translations/<lang>.po -> .mo)
+
+    python scripts/compile_translations.py           # run at build time, before starting the app
+    python scripts/compile_translations.py --check   # also list template strings missing from a catalog
+
+The app loads the compiled .mo files once at startup; see i18n.py.
+"""
+
+import argparse
+import glob
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import i18n
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(i18n.TRANSLATIONS_DIR), 'templates')
+MARKED = re.compile(r"""_\(\s*(['"])(.+?)\1\s*\)""")
+
+
+def template_strings():
+    strings = set()
+    for path in glob.glob(os.path.join(TEMPLATES_DIR, '*.html')):
+        with open(path, encoding='utf-8') as f:
+            strings.update(m.group(2) for m in MARKED.finditer(f.read()))
+    return strings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--check', action='store_true', help='report untranslated template strings')
+    args = parser.parse_args()
+
+    marked = template_strings() if args.check else set()
+    missing_any = False
+    for code in i18n.LANGUAGES:
+        if code == i18n.DEFAULT_LANGUAGE:
+            continue
+        po_path = os.path.join(i18n.TRANSLATIONS_DIR, f'{code}.po')
+        messages = i18n.parse_po(po_path)
+        with open(os.path.join(i18n.TRANSLATIONS_DIR, f'{code}.mo'), 'wb') as f:
+            f.write(i18n.compile_mo(messages))
+        print(f"{code}: {len(messages) - 1} messages compiled")
+        for message in sorted(marked - messages.keys()):
+            missing_any = True
+            print(f"  untranslated: {message!r}")
+    return 1 if missing_any else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Synthetic data generator for scale testing
+
+Bulk-loads millions of realistic rows into every application table with
+COPY. Rows are produced lazily and streamed to Postgres in small chunks, so
+memory stays constant however many rows are requested. Distributions are
+skewed the way production traffic is: a small share of doctors receives
+most appointments and chat rooms see bursts of messages separated by long
+quiet periods.
+
+    export DATABASE_URL=postgresql://localhost/telemedicine DATABASE_SSLMODE=disable
+    python scripts/generate_data.py --patients 1000000 --appointments 5000000 --messages 20000000
+    python scripts/generate_data.py --tables chat_messages notifications --messages 50000000
+
+Generated users are named gen_<role>_<id> and share the password
+'generated123'.
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'generated123'
+TABLES = ['users', 'appointments', 'chat_messages', 'prescriptions', 'notifications',
+          'medicines', 'sos_alerts', 'health_records']
+
+FIRST_NAMES = ['Aarav', 'Simran', 'Gurpreet', 'Harjit', 'Manpreet', 'Rajesh', 'Sunita', 'Amandeep',
+               'Kiran', 'Baldev', 'Jaspreet', 'Neha', 'Ravi', 'Pooja', 'Harpreet', 'Sukhdev']
+LAST_NAMES = ['Singh', 'Kaur', 'Sharma', 'Gill', 'Sidhu', 'Verma', 'Dhillon', 'Bansal', 'Garg', 'Brar']
+SPECIALITIES = ['General Medicine', 'Pediatrics', 'Gynecology', 'Cardiology', 'Dermatology',
+                'Orthopedics', 'Neurology', 'ENT', 'Psychiatry']
+LANGUAGES = ['Punjabi'] * 6 + ['Hindi'] * 3 + ['English']
+SYMPTOMS = ['Fever and cough', 'Headache for three days', 'Stomach pain', 'Joint pain', 'Skin rash',
+            'Breathing difficulty', 'Follow-up visit', 'High blood pressure', 'Diabetes check-up']
+DIAGNOSES = ['Viral fever', 'Migraine', 'Gastritis', 'Arthritis', 'Dermatitis', 'Asthma',
+             'Hypertension', 'Type 2 diabetes', 'Upper respiratory infection']
+MEDICINES = ['Paracetamol 500mg', 'Amoxicillin 250mg', 'Metformin 500mg', 'Amlodipine 5mg',
+             'Cetirizine 10mg', 'Omeprazole 20mg', 'Azithromycin 500mg', 'ORS sachet',
+             'Ibuprofen 400mg', 'Salbutamol inhaler', 'Vitamin D3', 'Iron folic acid']
+CHAT_LINES = ['Hello doctor', 'I have had a fever since yesterday', 'Please take rest and drink fluids',
+              'Should I continue the medicine?', 'Yes, for five more days', 'Thank you',
+              'Can you send a photo of the rash?', 'The pain is worse at night', 'Any allergies?',
+              'Please book a follow-up next week']
+RECORD_TYPES = ['Lab Report', 'X-Ray', 'Prescription', 'Discharge Summary', 'Vaccination', 'Scan']
+NOTIFICATION_TYPES = ['appointment_approved', 'appointment_declined', 'appointment_reminder',
+                      'prescription_ready', 'general']
+APPOINTMENT_STATUSES = ['completed'] * 6 + ['cancelled', 'no_show', 'pending', 'scheduled', 'confirmed']
+
+# Nabha, Punjab
+BASE_LAT, BASE_LON = 30.3747, 76.1522
+
+
+def copy_value(value):
+    """Encode one value in COPY text format"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class RowStream:
+    """File-like object feeding generated rows to COPY a chunk at a time"""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = ''
+        self.count = 0
+
+    def read(self, size=8192):
+        if size is None or size < 0:
+            size = 8192
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        for row in self._rows:
+            line = '\t'.join(copy_value(v) for v in row) + '\n'
+            chunks.append(line)
+            length += len(line)
+            self.count += 1
+            if length >= size:
+                break
+        data = ''.join(chunks)
+        self._buffer = data[size:]
+        return data[:size]
+
+
+class Population:
+    """User id ranges and the skewed doctor-popularity distribution"""
+
+    def __init__(self, rng, doctors, pharmacies, patients):
+        self.rng = rng
+        self.doctors = doctors
+        self.pharmacies = pharmacies
+        self.patients = patients
+        # Zipf-like popularity: the doctor of rank r is chosen with weight 1 / r^0.9
+        self._cumulative = list(itertools.accumulate(1.0 / (rank + 1) ** 0.9 for rank in range(len(doctors))))
+
+    @classmethod
+    def allocate(cls, rng, first_id, doctors, pharmacies, patients):
+        """Lay out consecutive id ranges for users that are about to be generated"""
+        return cls(rng, range(first_id, first_id + doctors),
+                   range(first_id + doctors, first_id + doctors + pharmacies),
+                   range(first_id + doctors + pharmacies, first_id + doctors + pharmacies + patients))
+
+    def doctor(self):
+        pick = self.rng.random() * self._cumulative[-1]
+        return self.doctors.start + bisect.bisect_left(self._cumulative, pick)
+
+    def patient(self):
+        return self.rng.randrange(self.patients.start, self.patients.stop)
+
+    def pharmacy(self):
+        return self.rng.randrange(self.pharmacies.start, self.pharmacies.stop)
+
+
+def random_time(rng, start, end):
+    return start + timedelta(seconds=rng.random() * (end - start).total_seconds())
+
+
+def user_rows(rng, population, password_hash, now, days):
+    roles = [('doctor', population.doctors), ('pharmacy', population.pharmacies), ('patient', population.patients)]
+    for role, ids in roles:
+        for user_id in ids:
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            if role == 'doctor':
+                name = 'Dr. ' + name
+            elif role == 'pharmacy':
+                name = f"{rng.choice(LAST_NAMES)} Medical Store"
+            created = random_time(rng, now - timedelta(days=days), now)
+            yield (
+                user_id, f"gen_{role}_{user_id}", password_hash, role, name,
+                f"gen_{role}_{user_id}@example.com", f"9{rng.randrange(10 ** 9):09d}",
+                (now - timedelta(days=rng.randint(365, 80 * 365))).date() if role == 'patient' else None,
+                rng.choice(['Male', 'Female', 'Other']) if role == 'patient' else None,
+                f"Village {rng.randint(1, 400)}, Nabha", f"147{rng.randint(0, 999):03d}",
+                rng.choice(LANGUAGES),
+                f"{rng.randint(2, 35)} years of experience" if role == 'doctor' else None,
+                rng.choice(SPECIALITIES) if role == 'doctor' else None,
+                created, created,
+            )
+
+
+def appointment_rows(rng, population, count, now, days):
+    for _ in range(count):
+        created = random_time(rng, now - timedelta(days=days), now)
+        day = (created + timedelta(days=rng.randint(0, 14))).date()
+        status = rng.choice(APPOINTMENT_STATUSES) if day < now.date() else rng.choice(['pending', 'scheduled', 'confirmed'])
+        yield (population.patient(), population.doctor(), day,
+               f"{rng.randint(9, 17):02d}:{rng.choice(['00', '15', '30', '45'])}:00",
+               rng.choice(['video', 'video', 'chat', 'in_person']), status,
+               rng.choice(SYMPTOMS), None, created, created)
+
+
+def chat_rows(rng, population, count, rooms, now, days):
+    """Messages arrive in bursts: a consultation exchanges many lines within minutes, then the room goes quiet"""
+    produced = 0
+    while produced < count:
+        patient, doctor = population.patient(), population.doctor()
+        room = f"room_{patient}_{doctor}"
+        clock = random_time(rng, now - timedelta(days=days), now)
+        # Heavy-tailed room sizes, capped so one room can't swallow the whole budget
+        room_size = min(int(rng.paretovariate(1.2) * 5), max(1, count // max(rooms, 1) * 20), count - produced)
+        for n in range(room_size):
+            if rng.random() < 0.1:
+                clock += timedelta(days=rng.expovariate(1 / 7.0))
+            else:
+                clock += timedelta(seconds=rng.expovariate(1 / 20.0))
+            sender = f"gen_patient_{patient}" if rng.random() < 0.55 else f"gen_doctor_{doctor}"
+            media = f"uploads/generated/{rng.randrange(10 ** 9)}.jpg" if rng.random() < 0.03 else None
+            yield (room, sender, rng.choice(CHAT_LINES), media, clock)
+        produced += room_size
+
+
+def prescription_rows(rng, population, count, now, days):
+    for _ in range(count):
+        medicines = [{'name': name, 'dosage': rng.choice(['1-0-1', '1-1-1', '0-0-1']),
+                      'days': rng.choice([3, 5, 7, 14, 30])} for name in rng.sample(MEDICINES, rng.randint(1, 4))]
+        yield (population.patient(), population.doctor(), json.dumps(medicines), 'Take after meals',
+               rng.choice(DIAGNOSES), random_time(rng, now - timedelta(days=days), now),
+               rng.choice(['active', 'completed', 'completed', 'cancelled']))
+
+
+def notification_rows(rng, population, count, now, days):
+    for _ in range(count):
+        created = random_time(rng, now - timedelta(days=days), now)
+        # Old notifications have almost always been read
+        unread_odds = 0.6 if now - created < timedelta(days=7) else 0.02
+        kind = rng.choice(NOTIFICATION_TYPES)
+        yield (population.patient(), kind.replace('_', ' ').title(), 'Your request has been updated',
+               kind, rng.random() >= unread_odds, created)
+
+
+def medicine_rows(rng, population, count, now, days):
+    for _ in range(count):
+        yield (rng.choice(MEDICINES), rng.randint(0, 1000), population.pharmacy(),
+               random_time(rng, now - timedelta(days=days), now))
+
+
+def sos_rows(rng, population, count, now, days):
+    for _ in range(count):
+        created = random_time(rng, now - timedelta(days=days), now)
+        status = rng.choice(['resolved'] * 8 + ['responded', 'active'])
+        responded = created + timedelta(minutes=rng.randint(1, 30)) if status != 'active' else None
+        resolved = responded + timedelta(minutes=rng.randint(5, 240)) if status == 'resolved' else None
+        yield (population.patient(), round(BASE_LAT + rng.gauss(0, 0.2), 8), round(BASE_LON + rng.gauss(0, 0.2), 8),
+               None, status, 'Mozilla/5.0 (Linux; Android 10)', '/patient_dashboard', created, responded, resolved,
+               population.doctor() if responded else None, None)
+
+
+def health_record_rows(rng, population, count, now, days):
+    for _ in range(count):
+        yield (population.patient(), population.doctor() if rng.random() < 0.8 else None,
+               rng.choice(RECORD_TYPES), 'Generated record',
+               f"uploads/generated/{rng.randrange(10 ** 12)}.pdf", random_time(rng, now - timedelta(days=days), now))
+
+
+COLUMNS = {
+    'users': 'id, username, password, role, name, email, mobile, date_of_birth, gender, address, pin_code, '
+             'preferred_language, description, specialist, created_at, updated_at',
+    'appointments': 'patient_id, doctor_id, appointment_date, appointment_time, appointment_type, status, '
+                    'symptoms, notes, created_at, updated_at',
+    'chat_messages': 'room, username, message, media_url, timestamp',
+    'prescriptions': 'patient_id, doctor_id, medicines, instructions, diagnosis, date, status',
+    'notifications': 'user_id, title, message, type, is_read, created_at',
+    'medicines': 'name, quantity, pharmacy_id, added_date',
+    'sos_alerts': 'patient_id, latitude, longitude, location_error, status, user_agent, page_url, created_at, '
+                  'responded_at, resolved_at, responding_doctor_id, notes',
+    'health_records': 'patient_id, doctor_id, record_type, description, file_path, date',
+}
+
+
+def connect():
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        sys.exit("DATABASE_URL environment variable not set")
+    conn = psycopg2.connect(database_url, sslmode=os.environ.get('DATABASE_SSLMODE', 'prefer'))
+    conn.autocommit = True
+    return conn
+
+
+def copy_table(cursor, table, rows):
+    stream = RowStream(rows)
+    start = time.perf_counter()
+    cursor.copy_expert(f"COPY {table} ({COLUMNS[table]}) FROM STDIN", stream, size=65536)
+    elapsed = time.perf_counter() - start
+    print(f"  {table:<16} {stream.count:>12,} rows in {elapsed:7.1f}s ({stream.count / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+def existing_population(cursor, rng):
+    """Reuse previously generated users when only non-user tables are requested"""
+    ranges = {}
+    for role in ('doctor', 'pharmacy', 'patient'):
+        cursor.execute("SELECT MIN(id), MAX(id) FROM users WHERE username LIKE %s", (f"gen\\_{role}\\_%",))
+        low, high = cursor.fetchone()
+        if low is None:
+            sys.exit(f"No generated {role} users found; include 'users' in --tables first")
+        ranges[role] = range(low, high + 1)
+    return Population(rng, ranges['doctor'], ranges['pharmacy'], ranges['patient'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-load synthetic data with COPY')
+    parser.add_argument('--patients', type=int, default=100000)
+    parser.add_argument('--doctors', type=int, default=1000)
+    parser.add_argument('--pharmacies', type=int, default=300)
+    parser.add_argument('--appointments', type=int, default=500000)
+    parser.add_argument('--messages', type=int, default=2000000)
+    parser.add_argument('--rooms', type=int, default=50000, help='Approximate number of chat rooms')
+    parser.add_argument('--prescriptions', type=int, default=300000)
+    parser.add_argument('--notifications', type=int, default=1000000)
+    parser.add_argument('--medicines', type=int, default=100000)
+    parser.add_argument('--sos-alerts', type=int, default=20000)
+    parser.add_argument('--health-records', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=730, help='History window in days')
+    parser.add_argument('--tables', nargs='+', choices=TABLES, default=TABLES)
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for reproducible data')
+    args = parser.parse_args()
+
+    import app
+    import partitions
+    from credentials import hash_password
+
+    if not app.init_database():
+        sys.exit("Could not initialize the database schema")
+
+    rng = random.Random(args.seed)
+    now = datetime.now()
+    conn = connect()
+    cursor = conn.cursor()
+
+    if 'users' in args.tables:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM users")
+        population = Population.allocate(rng, cursor.fetchone()[0], args.doctors, args.pharmacies, args.patients)
+    else:
+        population = existing_population(cursor, rng)
+
+    generators = {
+        'users': lambda: user_rows(rng, population, hash_password(PASSWORD), now, args.days),
+        'appointments': lambda: appointment_rows(rng, population, args.appointments, now, args.days),
+        'chat_messages': lambda: chat_rows(rng, population, args.messages, args.rooms, now, args.days),
+        'prescriptions': lambda: prescription_rows(rng, population, args.prescriptions, now, args.days),
+        'notifications': lambda: notification_rows(rng, population, args.notifications, now, args.days),
+        'medicines': lambda: medicine_rows(rng, population, args.medicines, now, args.days),
+        'sos_alerts': lambda: sos_rows(rng, population, args.sos_alerts, now, args.days),
+        'health_records': lambda: health_record_rows(rng, population, args.health_records, now, args.days),
+    }
+
+    # History older than this month would otherwise all land in the DEFAULT partitions
+    for table in partitions.TABLES:
+        if table in args.tables:
+            created = partitions.ensure_partitions(cursor, table, first_month=now - timedelta(days=args.days))
+            if created:
+                print(f"Monthly partitions for {table}: {created[0]} .. {created[-1]}")
+
+    print("Loading synthetic data...")
+    start = time.perf_counter()
+    for table in TABLES:
+        if table in args.tables:
+            copy_table(cursor, table, generators[table]())
+    if 'users' in args.tables:
+        # Users were copied with explicit ids; move the sequence past them
+        cursor.execute("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT MAX(id) FROM users))")
+
+    print("Analyzing tables...")
+    for table in args.tables:
+        cursor.execute(f"ANALYZE {table}")
+    print(f"Done in {time.perf_counter() - start:.1f}s")
+    cursor.close()
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
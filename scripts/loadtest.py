@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Load test for the telemedicine application
+
+Seeds a Postgres database with realistic volumes of load-test users and
+records, then drives the main HTTP routes and the SocketIO join/message flow
+with concurrent simulated patients and doctors, reporting throughput and
+p50/p95/p99 latency per operation. Save a run with --output and compare a
+later run against it with --compare to catch regressions.
+
+    export DATABASE_URL=postgresql://localhost/telemedicine DATABASE_SSLMODE=disable
+    python scripts/loadtest.py seed --patients 20000 --doctors 200
+    LOGIN_LIMIT_PER_IP=1000000 LOGIN_LIMIT_PER_USERNAME=1000000 python app.py   # in another shell
+    python scripts/loadtest.py run --url http://localhost:5000 --users 50 --output before.json
+    python scripts/loadtest.py run --url http://localhost:5000 --users 50 --compare before.json
+
+All seeded rows belong to users named lt_*, so `seed --reset` removes them
+without touching real data.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import psycopg2
+from psycopg2.extras import execute_values
+import requests
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PREFIX = 'lt_'
+PASSWORD = 'loadtest123'
+STATUSES = ['pending', 'scheduled', 'confirmed', 'completed', 'cancelled']
+SPECIALITIES = ['Cardiology', 'General Medicine', 'Orthopedics', 'Dermatology', 'Neurology', 'Pediatrics']
+MEDICINES = ['Paracetamol 500mg', 'Amoxicillin 250mg', 'Metformin 500mg', 'Amlodipine 5mg',
+             'Cetirizine 10mg', 'Omeprazole 20mg', 'Azithromycin 500mg', 'ORS sachet']
+CHAT_LINES = ['Hello doctor', 'I have had a fever since yesterday', 'Please take rest and drink fluids',
+              'Should I continue the medicine?', 'Yes, for five more days', 'Thank you']
+
+
+def connect():
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        sys.exit("DATABASE_URL environment variable not set")
+    conn = psycopg2.connect(database_url, sslmode=os.environ.get('DATABASE_SSLMODE', 'prefer'))
+    conn.autocommit = True
+    return conn
+
+
+def reset(cursor):
+    print("Removing previous load-test data...")
+    cursor.execute("DELETE FROM chat_messages WHERE room LIKE %s", (PREFIX + '%',))
+    # Appointments, prescriptions, notifications and medicines cascade from users
+    cursor.execute("DELETE FROM users WHERE username LIKE %s", (PREFIX + '%',))
+
+
+def insert_users(cursor, role, count, password_hash, extra):
+    """Insert load-test users; returns their (id, username) pairs in order"""
+    rows = [(f"{PREFIX}{role}_{i:06d}", password_hash, role, f"Load Test {role.title()} {i}",
+             f"{PREFIX}{role}_{i}@example.com", f"9{i:09d}") + extra(i) for i in range(count)]
+    return [(row[0], row[1]) for row in execute_values(cursor, """
+        INSERT INTO users (username, password, role, name, email, mobile, specialist, description)
+        VALUES %s RETURNING id, username
+    """, rows, page_size=1000, fetch=True)]
+
+
+def seed(args):
+    import app
+    from credentials import hash_password
+
+    if not app.init_database():
+        sys.exit("Could not initialize the database schema")
+
+    rng = random.Random(args.seed)
+    conn = connect()
+    cursor = conn.cursor()
+    if args.reset:
+        reset(cursor)
+
+    start = time.perf_counter()
+    # One hash shared by every load-test user keeps seeding fast
+    password_hash = hash_password(PASSWORD)
+    doctors = insert_users(cursor, 'doctor', args.doctors, password_hash,
+                           lambda i: (SPECIALITIES[i % len(SPECIALITIES)], 'Load-test doctor'))
+    pharmacies = insert_users(cursor, 'pharmacy', args.pharmacies, password_hash, lambda i: (None, 'Load-test pharmacy'))
+    patients = insert_users(cursor, 'patient', args.patients, password_hash, lambda i: (None, 'Load-test patient'))
+    print(f"Inserted {len(doctors)} doctors, {len(pharmacies)} pharmacies, {len(patients)} patients")
+    # Chat lines are posted under the real usernames so doctors' searches cover their rooms
+    usernames = dict(doctors + patients)
+    doctors, pharmacies, patients = ([user_id for user_id, _ in users] for users in (doctors, pharmacies, patients))
+
+    # A few popular doctors take most of the appointments
+    weights = [1.0 / (rank + 1) for rank in range(len(doctors))]
+    today = date.today()
+    appointments, prescriptions, notifications, messages = [], [], [], []
+    for patient_id in patients:
+        for doctor_id in rng.choices(doctors, weights, k=rng.randint(0, args.appointments_per_patient * 2)):
+            day = today + timedelta(days=rng.randint(-180, 30))
+            appointments.append((patient_id, doctor_id, day, f"{rng.randint(9, 17):02d}:{rng.choice(['00', '30'])}",
+                                 rng.choice(['video', 'chat', 'in_person']), rng.choice(STATUSES), 'Fever and cough'))
+            if rng.random() < 0.4:
+                prescriptions.append((patient_id, doctor_id, json.dumps(rng.sample(MEDICINES, 2)),
+                                      'Twice a day after meals', 'Viral fever', rng.choice(['active', 'completed'])))
+            if rng.random() < 0.2:
+                room = f"{PREFIX}room_{patient_id}_{doctor_id}"
+                base = datetime.now() - timedelta(days=rng.randint(0, 180))
+                for n in range(rng.randint(2, args.messages_per_room * 2)):
+                    username = usernames[patient_id] if n % 2 == 0 else usernames[doctor_id]
+                    messages.append((room, username, rng.choice(CHAT_LINES), base + timedelta(seconds=30 * n)))
+        for _ in range(rng.randint(0, 4)):
+            notifications.append((patient_id, 'Appointment update', 'Your appointment has been updated',
+                                  'general', rng.random() < 0.7))
+
+    execute_values(cursor, """
+        INSERT INTO appointments (patient_id, doctor_id, appointment_date, appointment_time, appointment_type, status, symptoms)
+        VALUES %s
+    """, appointments, page_size=1000)
+    execute_values(cursor, """
+        INSERT INTO prescriptions (patient_id, doctor_id, medicines, instructions, diagnosis, status)
+        VALUES %s
+    """, prescriptions, page_size=1000)
+    execute_values(cursor, """
+        INSERT INTO notifications (user_id, title, message, type, is_read) VALUES %s
+    """, notifications, page_size=1000)
+    execute_values(cursor, """
+        INSERT INTO chat_messages (room, username, message, timestamp) VALUES %s
+    """, messages, page_size=1000)
+    medicines = [(name, rng.randint(0, 500), pharmacy_id) for pharmacy_id in pharmacies for name in MEDICINES]
+    execute_values(cursor, "INSERT INTO medicines (name, quantity, pharmacy_id) VALUES %s", medicines, page_size=1000)
+    cursor.execute("ANALYZE")
+
+    print(f"Inserted {len(appointments)} appointments, {len(prescriptions)} prescriptions, "
+          f"{len(notifications)} notifications, {len(messages)} chat messages, {len(medicines)} medicines "
+          f"in {time.perf_counter() - start:.1f}s")
+    cursor.close()
+    conn.close()
+
+
+class Recorder:
+    """Thread-safe latency samples and error counts per operation"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def timed(self, op, func):
+        start = time.perf_counter()
+        try:
+            ok = func()
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            if ok:
+                self.samples[op].append(elapsed)
+            else:
+                self.errors[op] += 1
+        return ok
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def login(http, base_url, username, role):
+    response = http.post(base_url + '/login', allow_redirects=False,
+                         data={'username': username, 'password': PASSWORD, 'role': role})
+    return response.status_code == 302 and 'login' not in response.headers.get('Location', '')
+
+
+def get_ok(http, url):
+    response = http.get(url, allow_redirects=False)
+    return response.status_code == 200
+
+
+def chat(http, base_url, room, count, recorder):
+    client = socketio.Client(reconnection=False)
+    pending = {}
+
+    @client.on('message')
+    def on_message(data):
+        event = pending.pop(data.get('message'), None)
+        if event:
+            event.set()
+
+    cookie = '; '.join(f"{name}={value}" for name, value in http.cookies.items())
+    if not recorder.timed('socket connect', lambda: client.connect(base_url, headers={'Cookie': cookie},
+                                                                    wait_timeout=10) or True):
+        return
+    try:
+        recorder.timed('socket join', lambda: client.call('join', {'room': room}, timeout=10) or True)
+        for n in range(count):
+            text = f"load test message {n} {random.random()}"
+            event = pending[text] = threading.Event()
+
+            def send_and_wait():
+                client.emit('message', {'room': room, 'message': text})
+                return event.wait(10)
+            recorder.timed('socket message', send_and_wait)
+        recorder.timed('socket leave', lambda: client.call('leave', {'room': room}, timeout=10) or True)
+    finally:
+        client.disconnect()
+
+
+def patient_session(base_url, username, doctor_ids, args, recorder):
+    http = requests.Session()
+    if not recorder.timed('POST /login', lambda: login(http, base_url, username, 'patient')):
+        return
+    for _ in range(args.iterations):
+        recorder.timed('GET /patient_dashboard', lambda: get_ok(http, base_url + '/patient_dashboard'))
+        recorder.timed('GET /book_appointment', lambda: get_ok(http, base_url + '/book_appointment'))
+        form = {
+            'doctor_id': random.choice(doctor_ids),
+            'appointment_date': (date.today() + timedelta(days=random.randint(1, 30))).isoformat(),
+            'appointment_time': f"{random.randint(9, 17):02d}:00",
+            'appointment_type': 'video',
+            'symptoms': 'Load test booking',
+        }
+        recorder.timed('POST /book_appointment', lambda: http.post(
+            base_url + '/book_appointment', data=form, allow_redirects=False).status_code == 302)
+        recorder.timed('GET /patient_appointments', lambda: get_ok(http, base_url + '/patient_appointments'))
+        if args.messages:
+            chat(http, base_url, f"{PREFIX}room_{username}", args.messages, recorder)
+
+
+def doctor_session(base_url, username, args, recorder):
+    http = requests.Session()
+    if not recorder.timed('POST /login', lambda: login(http, base_url, username, 'doctor')):
+        return
+    for _ in range(args.iterations):
+        recorder.timed('GET /doctor_dashboard', lambda: get_ok(http, base_url + '/doctor_dashboard'))
+        recorder.timed('GET /doctor_appointments', lambda: get_ok(http, base_url + '/doctor_appointments'))
+        recorder.timed('GET /api/patients', lambda: get_ok(http, base_url + '/api/patients?q=lt'))
+        recorder.timed('GET /api/search messages', lambda: get_ok(http, base_url + '/api/search?scope=messages&q=fever'))
+
+
+def report(recorder, elapsed):
+    results = {}
+    print(f"\n{'operation':<28} {'ok':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for op in sorted(set(recorder.samples) | set(recorder.errors)):
+        samples = recorder.samples.get(op, [])
+        row = {
+            'count': len(samples),
+            'errors': recorder.errors.get(op, 0),
+            'rps': len(samples) / elapsed,
+            'p50': statistics.median(samples) * 1000 if samples else None,
+            'p95': percentile(samples, 95) * 1000 if samples else None,
+            'p99': percentile(samples, 99) * 1000 if samples else None,
+        }
+        results[op] = row
+        fmt = lambda v: f"{v:8.1f}" if v is not None else f"{'-':>8}"
+        print(f"{op:<28} {row['count']:>7} {row['errors']:>5} {row['rps']:>8.1f} "
+              f"{fmt(row['p50'])} {fmt(row['p95'])} {fmt(row['p99'])}")
+    total = sum(len(s) for s in recorder.samples.values())
+    print(f"\n{total} operations in {elapsed:.1f}s ({total / elapsed:.1f} ops/s)")
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    """Print p95 changes against a saved run; return True if any operation regressed past the threshold"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['operations']
+    regressed = False
+    print(f"\n{'operation':<28} {'base p95':>9} {'now p95':>9} {'change':>8}")
+    for op, row in results.items():
+        before = baseline.get(op, {}).get('p95')
+        if before is None or row['p95'] is None:
+            continue
+        change = (row['p95'] - before) / before * 100
+        flag = '  REGRESSION' if change > threshold else ''
+        regressed = regressed or bool(flag)
+        print(f"{op:<28} {before:>9.1f} {row['p95']:>9.1f} {change:>+7.1f}%{flag}")
+    return regressed
+
+
+def run(args):
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, username, role FROM users WHERE username LIKE %s", (PREFIX + '%',))
+    users = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    patients = [u[1] for u in users if u[2] == 'patient']
+    doctors = [u for u in users if u[2] == 'doctor']
+    if not patients or not doctors:
+        sys.exit("No load-test users found; run `loadtest.py seed` first")
+
+    base_url = args.url.rstrip('/')
+    doctor_count = max(1, int(args.users * args.doctor_share))
+    recorder = Recorder()
+    print(f"Running {args.users - doctor_count} patients and {doctor_count} doctors "
+          f"for {args.iterations} iterations against {base_url}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        futures = [pool.submit(doctor_session, base_url, doctor[1], args, recorder)
+                   for doctor in random.sample(doctors, min(doctor_count, len(doctors)))]
+        futures += [pool.submit(patient_session, base_url, username, [d[0] for d in doctors], args, recorder)
+                    for username in random.sample(patients, min(args.users - doctor_count, len(patients)))]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    results = report(recorder, elapsed)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'url': base_url, 'users': args.users, 'iterations': args.iterations,
+                       'elapsed': elapsed, 'operations': results}, f, indent=2)
+        print(f"Saved results to {args.output}")
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the telemedicine application')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    seed_parser = commands.add_parser('seed', help='Seed load-test data into DATABASE_URL')
+    seed_parser.add_argument('--patients', type=int, default=20000)
+    seed_parser.add_argument('--doctors', type=int, default=200)
+    seed_parser.add_argument('--pharmacies', type=int, default=50)
+    seed_parser.add_argument('--appointments-per-patient', type=int, default=3)
+    seed_parser.add_argument('--messages-per-room', type=int, default=10)
+    seed_parser.add_argument('--seed', type=int, default=42, help='Random seed for reproducible data')
+    seed_parser.add_argument('--reset', action='store_true', help='Delete previous load-test data first')
+
+    run_parser = commands.add_parser('run', help='Drive concurrent simulated users against a running server')
+    run_parser.add_argument('--url', default='http://localhost:5000')
+    run_parser.add_argument('--users', type=int, default=50, help='Concurrent simulated users')
+    run_parser.add_argument('--doctor-share', type=float, default=0.2, help='Fraction of users that are doctors')
+    run_parser.add_argument('--iterations', type=int, default=5, help='Page-flow iterations per user')
+    run_parser.add_argument('--messages', type=int, default=5, help='Chat messages per patient iteration (0 to skip)')
+    run_parser.add_argument('--output', help='Write results as JSON')
+    run_parser.add_argument('--compare', help='Compare against a previous --output file')
+    run_parser.add_argument('--threshold', type=float, default=20.0, help='p95 regression tolerance in percent')
+
+    args = parser.parse_args()
+    if args.command == 'seed':
+        seed(args)
+    else:
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
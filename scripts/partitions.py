@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Partition management for chat_messages and notifications
+
+    python scripts/partitions.py migrate             # convert existing heap tables to monthly partitions
+    python scripts/partitions.py maintain            # create upcoming partitions (the app also does this daily)
+    python scripts/partitions.py list
+    python scripts/partitions.py archive --keep-months 12 --archive-dir /var/backups/telemedicine
+    python scripts/partitions.py restore /var/backups/telemedicine/chat_messages_y2024m01.csv.gz
+
+archive detaches every partition older than --keep-months, exports it to a
+gzip-compressed CSV in the archive directory, checks the row count and then
+drops it. restore re-attaches an archived month.
+"""
+
+import argparse
+import csv
+import gzip
+import os
+import sys
+from datetime import date
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import partitions
+import search
+import sync
+
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+
+
+def connect():
+    database_url = os.environ.get('DATABASE_URL')
+    if not database_url:
+        sys.exit("DATABASE_URL environment variable not set")
+    return psycopg2.connect(database_url, sslmode=os.environ.get('DATABASE_SSLMODE', 'require'))
+
+
+def columns(cursor, table):
+    cursor.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = %s AND is_generated = 'NEVER' ORDER BY ordinal_position
+    """, (table,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def short_name(name, suffix):
+    # Postgres truncates identifiers at 63 bytes
+    return name[:63 - len(suffix)] + suffix
+
+
+def migrate(conn, table):
+    cursor = conn.cursor()
+    if partitions.is_partitioned(cursor, table):
+        print(f"✓ {table} is already partitioned")
+        return
+
+    old = f"{table}_unpartitioned"
+    column = partitions.TABLES[table]['column']
+    print(f"Migrating {table}...")
+    cursor.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+
+    # Free up the table, index and sequence names for the partitioned table
+    cursor.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s", (old,))
+    for (index,) in cursor.fetchall():
+        cursor.execute(f"ALTER INDEX {index} RENAME TO {short_name(index, '_unpartitioned')}")
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", (old,))
+    sequence = cursor.fetchone()[0]
+    if sequence:
+        cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {short_name(table, '_unpartitioned_id_seq')}")
+
+    partitions.create_table(cursor, table)
+    cursor.execute(f"SELECT MIN({column}), COUNT(*) FROM {old}")
+    first, count = cursor.fetchone()
+    if first:
+        partitions.ensure_partitions(cursor, table, first_month=first.date())
+
+    # The partition key is NOT NULL now; legacy rows may lack a timestamp
+    cols = columns(cursor, old)
+    select = ', '.join(f"COALESCE({c}, CURRENT_TIMESTAMP)" if c == column else c for c in cols)
+    cursor.execute(f"INSERT INTO {table} ({', '.join(cols)}) SELECT {select} FROM {old}")
+    cursor.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)",
+                   (table,))
+    cursor.execute(f"DROP TABLE {old}")
+
+    # Whatever other modules attached to the old table went with it: the search column, its index
+    # and the room-membership trigger on chat_messages, the sync change-log trigger on notifications
+    if table == 'chat_messages':
+        search.ensure_schema(conn.cursor(cursor_factory=RealDictCursor))
+    elif table == 'notifications':
+        sync.create_schema(conn.cursor(cursor_factory=RealDictCursor))
+    conn.commit()
+    print(f"✓ {table}: moved {count} rows into monthly partitions")
+
+
+def list_partitions(conn):
+    cursor = conn.cursor()
+    for table in partitions.TABLES:
+        if not partitions.is_partitioned(cursor, table):
+            print(f"{table}: not partitioned")
+            continue
+        print(f"{table}:")
+        for month, name in partitions.list_partitions(cursor, table):
+            cursor.execute(f"SELECT COUNT(*), pg_total_relation_size(%s) FROM {name}", (name,))
+            rows, size = cursor.fetchone()
+            print(f"  {name:<32} {rows:>12,} rows {size / 1024 / 1024:>10.1f} MB")
+
+
+def archive(conn, keep_months, archive_dir, drop=True):
+    os.makedirs(archive_dir, exist_ok=True)
+    cutoff = partitions.add_months(partitions.month_start(date.today()), -keep_months)
+    cursor = conn.cursor()
+    for table in partitions.TABLES:
+        if not partitions.is_partitioned(cursor, table):
+            continue
+        for month, name in partitions.list_partitions(cursor, table):
+            if month >= cutoff:
+                continue
+            path = os.path.join(archive_dir, f"{name}.csv.gz")
+            if os.path.exists(path):
+                print(f"⚠️ {path} already exists, skipping {name}")
+                continue
+
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            conn.commit()
+            cursor.execute(f"SELECT COUNT(*) FROM {name}")
+            expected = cursor.fetchone()[0]
+
+            tmp_path = path + '.tmp'
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as f:
+                cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            fd = os.open(tmp_path, os.O_RDONLY)
+            os.fsync(fd)
+            os.close(fd)
+
+            # Read the archive back before dropping anything
+            with gzip.open(tmp_path, 'rt', encoding='utf-8', newline='') as f:
+                exported = sum(1 for _ in csv.reader(f)) - 1
+            if exported != expected:
+                os.remove(tmp_path)
+                sys.exit(f"❌ {name}: exported {exported} rows but expected {expected}; partition left detached")
+            os.rename(tmp_path, path)
+
+            if drop:
+                cursor.execute(f"DROP TABLE {name}")
+            conn.commit()
+            print(f"✓ Archived {name} ({expected:,} rows) to {path}")
+
+
+def restore(conn, path):
+    name = os.path.basename(path).split('.', 1)[0]
+    for table in partitions.TABLES:
+        month = partitions.parse_partition_name(table, name)
+        if month:
+            break
+    else:
+        sys.exit(f"Cannot tell which table {path} belongs to")
+
+    cursor = conn.cursor()
+    partitions.create_partition(cursor, table, month)
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        cursor.copy_expert(f"COPY {table} FROM STDIN WITH (FORMAT csv, HEADER)", f)
+    conn.commit()
+    print(f"✓ Restored {cursor.rowcount} rows into {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage chat_messages/notifications partitions')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('migrate', help='Convert existing tables to partitioned tables')
+    commands.add_parser('maintain', help='Create upcoming monthly partitions')
+    commands.add_parser('list', help='Show partitions with row counts and sizes')
+    archive_parser = commands.add_parser('archive', help='Detach, export and drop old partitions')
+    archive_parser.add_argument('--keep-months', type=int, default=12, help='Months of history to keep attached')
+    archive_parser.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    archive_parser.add_argument('--keep-tables', action='store_true', help='Leave exported partitions detached instead of dropping them')
+    restore_parser = commands.add_parser('restore', help='Re-attach an archived partition')
+    restore_parser.add_argument('path')
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        if args.command == 'migrate':
+            for table in partitions.TABLES:
+                migrate(conn, table)
+        elif args.command == 'maintain':
+            conn.autocommit = True
+            partitions.run_maintenance(conn)
+            print("✓ Upcoming partitions created")
+        elif args.command == 'list':
+            list_partitions(conn)
+        elif args.command == 'archive':
+            archive(conn, args.keep_months, args.archive_dir, drop=not args.keep_tables)
+        else:
+            restore(conn, args.path)
+    except psycopg2.Error as e:
+        conn.rollback()
+        sys.exit(f"❌ Database error: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Measure how long a fresh worker takes to become useful
+
+    python scripts/startup_time.py                     # median of 5 runs, exit 1 over the budget
+    python scripts/startup_time.py --runs 10 --top 15 --budget-ms 800
+
+Each run starts a new interpreter, imports app.py and serves a first
+/healthz request, and reports both times. --top lists the imports with
+the largest cumulative cost (from python -X importtime) in the last run.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/healthz')
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'first_request_ms': (served - imported) * 1000}))
+"""
+
+
+def run_once():
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    imports = []
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                imports.append((int(cumulative) / 1000, name.rstrip()))
+    return timings, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=0, help='list the N most expensive imports')
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('STARTUP_BUDGET_MS', 1000)),
+                        help='fail when median import + first request exceeds this (default 1000)')
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    import_ms = statistics.median(t['import_ms'] for t, _ in runs)
+    first_ms = statistics.median(t['first_request_ms'] for t, _ in runs)
+    total = import_ms + first_ms
+    print(f"import app: {import_ms:.0f} ms, first request: {first_ms:.0f} ms, "
+          f"total: {total:.0f} ms (budget {args.budget_ms:.0f} ms, median of {args.runs})")
+
+    if args.top:
+        print("\nSlowest imports (cumulative ms, last run):")
+        for cumulative, name in sorted(runs[-1][1], reverse=True)[:args.top]:
+            print(f"  {cumulative:8.1f}  {name.strip()}")
+
+    if total > args.budget_ms:
+        print(f"Over budget by {total - args.budget_ms:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Full-text search for doctors over their patients, prescriptions and chat history.
+
+users, prescriptions and chat_messages get a stored generated tsvector
+column (so Postgres maintains it on every write) with a GIN index.
+chat_room_members, filled by a trigger on chat_messages, records who has
+posted in which room, so a doctor's chat search only looks at rooms the
+doctor took part in.
+
+Queries use websearch syntax ("exact phrase", -exclude, or). Ranking is
+done on at most SEARCH_CANDIDATES matches, newest first, and snippets are
+only built for the returned page, which keeps common words fast on large
+chat histories. SEARCH_CONFIG (default 'simple', i.e. no stemming) suits
+mixed-language and transliterated text; set it to 'english' for stemming.
+"""
+
+import html
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+CONFIG = os.environ.get('SEARCH_CONFIG', 'simple')
+if not re.fullmatch(r'\w+', CONFIG):
+    raise ValueError(f"Invalid SEARCH_CONFIG: {CONFIG!r}")
+CANDIDATES = int(os.environ.get('SEARCH_CANDIDATES', 2000))
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+VECTORS = {
+    'users': f"to_tsvector('{CONFIG}', coalesce(name, '') || ' ' || coalesce(username, ''))",
+    'prescriptions': (f"setweight(to_tsvector('{CONFIG}', coalesce(diagnosis, '')), 'A') || "
+                      f"setweight(to_tsvector('{CONFIG}', coalesce(medicines, '')), 'B') || "
+                      f"setweight(to_tsvector('{CONFIG}', coalesce(instructions, '')), 'C')"),
+    'chat_messages': f"to_tsvector('{CONFIG}', message)",
+}
+
+# Snippets are HTML-escaped in Python, then these markers become <mark> tags
+HEADLINE_OPTIONS = 'MaxFragments=2, MaxWords=18, MinWords=6, StartSel=⟦, StopSel=⟧'
+
+
+def ensure_schema(cursor):
+    """Search columns, GIN indexes and the chat room membership table (idempotent)"""
+    for table, expression in VECTORS.items():
+        # Adding a stored column rewrites the table once; run during a quiet period on big installs
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                       f"GENERATED ALWAYS AS ({expression}) STORED")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_search ON {table} USING GIN (search_vector)")
+
+    cursor.execute("SELECT to_regclass('chat_room_members') IS NOT NULL AS present")
+    exists = cursor.fetchone()['present']
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS chat_room_members (
+            username VARCHAR(50) NOT NULL,
+            room VARCHAR(100) NOT NULL,
+            PRIMARY KEY (username, room)
+        );
+        CREATE OR REPLACE FUNCTION track_chat_room_member() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO chat_room_members (username, room) VALUES (NEW.username, NEW.room)
+            ON CONFLICT DO NOTHING;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        DROP TRIGGER IF EXISTS chat_messages_room_member ON chat_messages;
+        CREATE TRIGGER chat_messages_room_member
+        AFTER INSERT ON chat_messages
+        FOR EACH ROW EXECUTE PROCEDURE track_chat_room_member();
+    """)
+    if not exists:
+        cursor.execute("""
+            INSERT INTO chat_room_members (username, room)
+            SELECT DISTINCT username, room FROM chat_messages
+            ON CONFLICT DO NOTHING
+        """)
+        logger.info(f"🔎 Backfilled {cursor.rowcount} chat room memberships")
+
+
+def prefix_query(text):
+    """tsquery matching every word of text, the last one as a prefix (for typeahead); None if empty"""
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    return ' & '.join(f"'{w}'" for w in words[:-1]) + (' & ' if len(words) > 1 else '') + f"'{words[-1]}':*"
+
+
+def page_bounds(page, page_size):
+    page_size = min(max(int(page_size or PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    page = max(int(page or 1), 1)
+    return page, page_size, (page - 1) * page_size
+
+
+def _paginate(rows, page, page_size):
+    results = []
+    for row in rows[:page_size]:
+        row = dict(row)
+        if row.get('snippet') is not None:
+            row['snippet'] = html.escape(row['snippet']).replace('⟦', '<mark>').replace('⟧', '</mark>')
+        results.append(row)
+    return {'results': results, 'page': page, 'has_more': len(rows) > page_size}
+
+
+def search_patients(cursor, doctor_id, text='', page=1, page_size=PAGE_SIZE):
+    """The doctor's patients (anyone with an appointment with them), optionally filtered by name/username"""
+    page, page_size, offset = page_bounds(page, page_size)
+    query = prefix_query(text or '')
+    if query is None:
+        cursor.execute("""
+            SELECT u.id, u.name, u.username
+            FROM users u
+            WHERE u.role = 'patient'
+              AND EXISTS (SELECT 1 FROM appointments a WHERE a.patient_id = u.id AND a.doctor_id = %s)
+            ORDER BY u.name, u.id
+            LIMIT %s OFFSET %s
+        """, (doctor_id, page_size + 1, offset))
+    else:
+        cursor.execute(f"""
+            SELECT u.id, u.name, u.username
+            FROM users u, to_tsquery('{CONFIG}', %s) q
+            WHERE u.search_vector @@ q AND u.role = 'patient'
+              AND EXISTS (SELECT 1 FROM appointments a WHERE a.patient_id = u.id AND a.doctor_id = %s)
+            ORDER BY ts_rank(u.search_vector, q) DESC, u.name, u.id
+            LIMIT %s OFFSET %s
+        """, (query, doctor_id, page_size + 1, offset))
+    return _paginate(cursor.fetchall(), page, page_size)
+
+
+def search_prescriptions(cursor, doctor_id, text, patient_id=None, page=1, page_size=PAGE_SIZE):
+    """Prescriptions written by the doctor whose diagnosis, medicines or instructions match"""
+    page, page_size, offset = page_bounds(page, page_size)
+    cursor.execute(f"""
+        WITH q AS (SELECT websearch_to_tsquery('{CONFIG}', %s) AS q),
+        hits AS (
+            SELECT p.id, p.patient_id, p.diagnosis, p.medicines, p.instructions, p.date, p.status,
+                   ts_rank(p.search_vector, q.q) AS rank
+            FROM prescriptions p, q
+            WHERE p.search_vector @@ q.q AND p.doctor_id = %s
+              AND (%s::INTEGER IS NULL OR p.patient_id = %s::INTEGER)
+            ORDER BY p.date DESC
+            LIMIT %s
+        ),
+        page AS (
+            SELECT * FROM hits ORDER BY rank DESC, date DESC LIMIT %s OFFSET %s
+        )
+        SELECT page.id, page.patient_id, u.name AS patient_name, page.date, page.status, page.rank,
+               ts_headline('{CONFIG}', concat_ws(' — ', page.diagnosis, page.medicines, page.instructions),
+                           q.q, '{HEADLINE_OPTIONS}') AS snippet
+        FROM page
+        JOIN users u ON u.id = page.patient_id, q
+        ORDER BY page.rank DESC, page.date DESC
+    """, (text, doctor_id, patient_id, patient_id, CANDIDATES, page_size + 1, offset))
+    return _paginate(cursor.fetchall(), page, page_size)
+
+
+def search_messages(cursor, doctor_username, text, patient_username=None, page=1, page_size=PAGE_SIZE):
+    """Chat messages matching text in rooms the doctor posted in (and, if given, the patient too)"""
+    page, page_size, offset = page_bounds(page, page_size)
+    cursor.execute(f"""
+        WITH q AS (SELECT websearch_to_tsquery('{CONFIG}', %s) AS q),
+        rooms AS (
+            SELECT d.room FROM chat_room_members d
+            WHERE d.username = %s
+              AND (%s::TEXT IS NULL OR EXISTS (
+                  SELECT 1 FROM chat_room_members p WHERE p.room = d.room AND p.username = %s::TEXT))
+        ),
+        hits AS (
+            SELECT m.id, m.room, m.username, m.message, m.timestamp,
+                   ts_rank(m.search_vector, q.q) AS rank
+            FROM chat_messages m, q
+            WHERE m.search_vector @@ q.q AND m.room IN (SELECT room FROM rooms)
+            ORDER BY m.timestamp DESC
+            LIMIT %s
+        ),
+        page AS (
+            SELECT * FROM hits ORDER BY rank DESC, timestamp DESC LIMIT %s OFFSET %s
+        )
+        SELECT page.id, page.room, page.username, page.timestamp, page.rank,
+               ts_headline('{CONFIG}', page.message, q.q, '{HEADLINE_OPTIONS}') AS snippet
+        FROM page, q
+        ORDER BY page.rank DESC, page.timestamp DESC
+    """, (text, doctor_username, patient_username, patient_username, CANDIDATES, page_size + 1, offset))
+    return _paginate(cursor.fetchall(), page, page_size)
@@ -0,0 +1,211 @@
+"""
+WebRTC signaling relay for video calls in chat rooms.
+
+Offers, answers, ICE candidates, hang-ups and declines are relayed only to
+the other participant of the call instead of being broadcast to the room.
+Each room has at most one call, held in a small slotted object that expires
+if nobody answers within CALL_RING_TIMEOUT seconds. ICE candidates are
+buffered until the call is answered (the callee has no peer connection
+before that, so early candidates used to be dropped) and afterwards
+coalesced over ICE_BATCH_WINDOW_MS into one 'ice_candidates' event.
+
+ice_servers() builds the RTCPeerConnection configuration, including
+short-lived credentials for a self-hosted TURN server (coturn's
+use-auth-secret scheme) so NATed rural clients can fall back to relaying.
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+
+import call_quality
+import chat_protocol
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RING_TIMEOUT = float(os.environ.get('CALL_RING_TIMEOUT', 45))
+ICE_BATCH_WINDOW = float(os.environ.get('ICE_BATCH_WINDOW_MS', 50)) / 1000.0
+
+STUN_URLS = [u for u in os.environ.get('STUN_URLS', 'stun:stun.l.google.com:19302,stun:stun1.l.google.com:19302').split(',') if u]
+TURN_URLS = [u for u in os.environ.get('TURN_URLS', '').split(',') if u]
+TURN_SECRET = os.environ.get('TURN_SECRET')
+TURN_USERNAME = os.environ.get('TURN_USERNAME')
+TURN_PASSWORD = os.environ.get('TURN_PASSWORD')
+TURN_TTL = int(os.environ.get('TURN_TTL', 3600))
+
+RINGING = 0
+ANSWERED = 1
+
+
+class Call:
+    __slots__ = ('room', 'caller', 'caller_sid', 'callee_sid', 'state', 'started', 'answered',
+                 'candidates', 'flush_scheduled')
+
+    def __init__(self, room, caller, caller_sid):
+        self.room = room
+        self.caller = caller
+        self.caller_sid = caller_sid
+        self.callee_sid = None
+        self.state = RINGING
+        self.started = time.monotonic()
+        self.answered = None
+        # target sid -> (origin sid, candidate) pairs waiting to be delivered
+        self.candidates = {}
+        self.flush_scheduled = False
+
+    def peer_of(self, sid):
+        return self.callee_sid if sid == self.caller_sid else self.caller_sid
+
+
+_socketio = None
+_calls = {}
+_lock = threading.Lock()
+
+
+def init_app(socketio):
+    global _socketio
+    _socketio = socketio
+
+
+def ice_servers(username):
+    """RTCPeerConnection iceServers for a user, with ephemeral TURN credentials when configured"""
+    servers = [{'urls': STUN_URLS}] if STUN_URLS else []
+    if TURN_URLS:
+        if TURN_SECRET:
+            turn_username = f"{int(time.time()) + TURN_TTL}:{username}"
+            digest = hmac.new(TURN_SECRET.encode(), turn_username.encode(), hashlib.sha1).digest()
+            servers.append({'urls': TURN_URLS, 'username': turn_username,
+                            'credential': base64.b64encode(digest).decode()})
+        elif TURN_USERNAME:
+            servers.append({'urls': TURN_URLS, 'username': TURN_USERNAME, 'credential': TURN_PASSWORD or ''})
+    return servers
+
+
+def _others(room, sid):
+    return chat_protocol.participants(room) - {sid}
+
+
+def _send(event, data, sids):
+    for sid in sids:
+        _socketio.emit(event, data, to=sid)
+
+
+def _finish(call, outcome):
+    metrics.CALL_SETUP_TIME.observe((outcome,), (call.answered or time.monotonic()) - call.started)
+
+
+def _ring_out(call):
+    """End the call after RING_TIMEOUT unless it was answered, ended or replaced meanwhile"""
+    _socketio.sleep(RING_TIMEOUT)
+    with _lock:
+        if _calls.get(call.room) is not call or call.state != RINGING:
+            return
+        del _calls[call.room]
+    _finish(call, 'timeout')
+    _send('end_call', {'room': call.room, 'from': None, 'reason': 'timeout'},
+          chat_protocol.participants(call.room))
+
+
+def offer(room, username, sid, data):
+    with _lock:
+        call = _calls.get(room)
+        if call and call.caller_sid != sid:
+            busy = True
+        else:
+            busy = False
+            call = _calls[room] = Call(room, username, sid)
+    if busy:
+        _socketio.emit('call_busy', {'room': room}, to=sid)
+        return
+    _socketio.start_background_task(_ring_out, call)
+    # Nobody has answered yet, so every other participant may pick up
+    _send('video_call_offer', data, _others(room, sid))
+
+
+def answer(room, username, sid, data):
+    with _lock:
+        call = _calls.get(room)
+        if not call or call.state != RINGING or call.caller_sid == sid:
+            return
+        call.callee_sid = sid
+        call.state = ANSWERED
+        call.answered = time.monotonic()
+        others = _others(room, sid) - {call.caller_sid}
+    _finish(call, 'answered')
+    _socketio.emit('video_call_answer', data, to=call.caller_sid)
+    call_quality.start(room, call.caller_sid, sid)
+    # Dismiss the ringing prompt on anybody else in the room
+    _send('end_call', {'room': room, 'from': username, 'reason': 'answered_elsewhere'}, others)
+    flush_candidates(room)
+
+
+def candidate(room, username, sid, data):
+    with _lock:
+        call = _calls.get(room)
+        if not call or (call.state == ANSWERED and sid not in (call.caller_sid, call.callee_sid)):
+            return
+        if sid == call.caller_sid:
+            # While ringing, hold the caller's candidates until someone answers
+            target = call.callee_sid or 'callee'
+        else:
+            # The answerer's candidates can race ahead of its answer
+            target = call.caller_sid
+        call.candidates.setdefault(target, []).append((sid, {'candidate': data.get('candidate'), 'from': username}))
+        schedule = call.state == ANSWERED and not call.flush_scheduled
+        if schedule:
+            call.flush_scheduled = True
+    if schedule:
+        _socketio.start_background_task(_flush_later, room)
+
+
+def _flush_later(room):
+    _socketio.sleep(ICE_BATCH_WINDOW)
+    flush_candidates(room)
+
+
+def flush_candidates(room):
+    with _lock:
+        call = _calls.get(room)
+        if not call or call.state != ANSWERED:
+            return
+        pending, call.candidates = call.candidates, {}
+        call.flush_scheduled = False
+    for target, candidates in pending.items():
+        sid = call.callee_sid if target == 'callee' else target
+        # Drop candidates from anyone who rang in the room but did not end up in the call
+        candidates = [c for origin, c in candidates if origin in (call.caller_sid, call.callee_sid)]
+        if candidates:
+            _socketio.emit('ice_candidates', {'room': room, 'candidates': candidates}, to=sid)
+
+
+def hang_up(room, username, sid, data, declined=False):
+    with _lock:
+        call = _calls.get(room)
+        # While ringing anyone in the room may decline; afterwards only the two peers count
+        if not call or (call.state == ANSWERED and sid not in (call.caller_sid, call.callee_sid)):
+            return
+        del _calls[room]
+    call_quality.end(room)
+    if declined:
+        _finish(call, 'declined')
+        _socketio.emit('call_declined', data, to=call.caller_sid)
+        _send('end_call', {'room': room, 'from': username, 'reason': 'declined'},
+              _others(room, sid) - {call.caller_sid})
+    else:
+        if call.state == RINGING:
+            _finish(call, 'cancelled')
+        targets = {call.peer_of(sid)} if call.state == ANSWERED else _others(room, sid)
+        _send('end_call', data, targets)
+
+
+def disconnected(sid):
+    """End every call a disconnecting client was part of"""
+    with _lock:
+        rooms = [room for room, call in _calls.items() if sid in (call.caller_sid, call.callee_sid)]
+    for room in rooms:
+        hang_up(room, None, sid, {'room': room, 'from': None, 'reason': 'disconnected'})
@@ -0,0 +1,98 @@
+// Bandwidth adaptation client for video calls (see call_quality.py on the server).
+//
+//   CallQuality.attach(socket, room, () => peerConnection, {
+//       profile: (p) => console.log('Now sending', p.profile),
+//   });
+//
+// Reports getStats() figures every few seconds while connected and applies the
+// 'bandwidth_profile' the server recommends to the local senders.
+(function (global) {
+    const REPORT_INTERVAL_MS = 4000;
+
+    // Capture at the top profile's resolution; lower profiles scale down in the encoder
+    const mediaConstraints = {
+        video: { width: { ideal: 640 }, height: { ideal: 360 }, frameRate: { ideal: 30, max: 30 } },
+        audio: { echoCancellation: true, noiseSuppression: true },
+    };
+
+    async function collect(pc, last) {
+        const stats = await pc.getStats();
+        const report = { available_kbps: null, loss: null, rtt: null };
+        let bytesSent = 0;
+        stats.forEach((s) => {
+            if (s.type === 'outbound-rtp') {
+                bytesSent += s.bytesSent || 0;
+            } else if (s.type === 'candidate-pair' && s.nominated && s.state === 'succeeded') {
+                if (s.availableOutgoingBitrate) report.available_kbps = s.availableOutgoingBitrate / 1000;
+                if (s.currentRoundTripTime != null) report.rtt = s.currentRoundTripTime;
+            } else if (s.type === 'remote-inbound-rtp') {
+                if (s.fractionLost != null) report.loss = Math.max(report.loss || 0, s.fractionLost);
+                if (report.rtt == null && s.roundTripTime != null) report.rtt = s.roundTripTime;
+            }
+        });
+        const now = performance.now();
+        if (last.time) report.sent_kbps = ((bytesSent - last.bytes) * 8) / (now - last.time);
+        last.time = now;
+        last.bytes = bytesSent;
+        return report;
+    }
+
+    async function apply(pc, profile) {
+        for (const sender of pc.getSenders()) {
+            if (!sender.track) continue;
+            const params = sender.getParameters();
+            if (!params.encodings || !params.encodings.length) params.encodings = [{}];
+            const encoding = params.encodings[0];
+            if (sender.track.kind === 'audio') {
+                encoding.maxBitrate = profile.maxAudioBitrate;
+            } else {
+                // Audio-only stops sending video without renegotiating
+                encoding.active = !profile.audioOnly;
+                if (!profile.audioOnly) {
+                    const height = sender.track.getSettings().height || profile.height;
+                    encoding.maxBitrate = profile.maxVideoBitrate;
+                    encoding.maxFramerate = profile.frameRate;
+                    encoding.scaleResolutionDownBy = Math.max(1, height / profile.height);
+                }
+            }
+            try {
+                await sender.setParameters(params);
+            } catch (error) {
+                console.error('Error applying bandwidth profile:', error);
+            }
+        }
+    }
+
+    function attach(socket, room, getPeerConnection, handlers = {}) {
+        const last = { time: 0, bytes: 0 };
+        let current = null;
+
+        setInterval(async () => {
+            const pc = getPeerConnection();
+            if (!pc || pc.connectionState !== 'connected') {
+                last.time = 0;
+                return;
+            }
+            const report = await collect(pc, last);
+            socket.emit('call_stats', Object.assign({ room }, report));
+        }, REPORT_INTERVAL_MS);
+
+        socket.on('bandwidth_profile', async (profile) => {
+            current = profile;
+            const pc = getPeerConnection();
+            if (pc) await apply(pc, profile);
+            if (handlers.profile) handlers.profile(profile);
+        });
+
+        return {
+            mediaConstraints,
+            // Re-apply after tracks are added to a new peer connection
+            reapply() {
+                const pc = getPeerConnection();
+                if (pc && current) return apply(pc, current);
+            },
+        };
+    }
+
+    global.CallQuality = { attach, mediaConstraints };
+})(window);
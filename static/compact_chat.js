@@ -0,0 +1,31 @@
+// Compact chat protocol client (see chat_protocol.py on the server).
+//
+//   const chat = CompactChat.attach(socket, {
+//       message: (m) => displayMessage(m.username, m.message, m.timestamp, ...),
+//       status: (s) => console.log(s.username, s.joined ? 'joined' : 'left'),
+//   });
+//   socket.on('connect', () => socket.emit('join', chat.joinPayload(room)));
+(function (global) {
+    function dispatch(batch, handlers) {
+        for (const event of batch.e) {
+            const username = batch.u[event[1]];
+            const timestamp = new Date(batch.t + event[2]);
+            if (event[0] === 'm') {
+                if (handlers.message) handlers.message({ username, message: event[3], timestamp });
+            } else if (handlers.status) {
+                handlers.status({ username, joined: event[0] === 'j', timestamp });
+            }
+        }
+    }
+
+    function attach(socket, handlers) {
+        socket.on('batch', (batch) => dispatch(batch, handlers));
+        return {
+            joinPayload(room) {
+                return { room, protocol: { compact: true } };
+            },
+        };
+    }
+
+    global.CompactChat = { attach };
+})(window);
@@ -0,0 +1,118 @@
+// Offline patient app client (see sync.py on the server).
+//
+//   <script src="/static/offline_sync.js"></script>
+//   OfflineSync.records('appointments').then((rows) => ...);
+//
+// Registers the service worker, keeps an IndexedDB copy of the patient's
+// appointments, prescriptions, health records and notifications, and pulls
+// only what changed since the last sync (on load and whenever the device
+// comes back online). Shows a banner while offline.
+(function (global) {
+    const DB_NAME = 'telemedicine-offline';
+    const ENTITIES = ['appointments', 'prescriptions', 'health_records', 'notifications'];
+
+    function open() {
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(DB_NAME, 1);
+            request.onupgradeneeded = () => {
+                const db = request.result;
+                for (const entity of ENTITIES) db.createObjectStore(entity, { keyPath: 'id' });
+                db.createObjectStore('meta');
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    function done(tx) {
+        return new Promise((resolve, reject) => {
+            tx.oncomplete = resolve;
+            tx.onerror = () => reject(tx.error);
+            tx.onabort = () => reject(tx.error);
+        });
+    }
+
+    function get(store, key) {
+        return new Promise((resolve, reject) => {
+            const request = store.get(key);
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async function meta(key) {
+        const db = await open();
+        return get(db.transaction('meta').objectStore('meta'), key);
+    }
+
+    async function apply(delta) {
+        const db = await open();
+        const tx = db.transaction(ENTITIES.concat('meta'), 'readwrite');
+        for (const entity of ENTITIES) {
+            const store = tx.objectStore(entity);
+            if (delta.reset) store.clear();
+            for (const row of (delta.changes[entity] || [])) store.put(row);
+            for (const id of (delta.deleted[entity] || [])) store.delete(id);
+        }
+        tx.objectStore('meta').put(delta.version, 'version');
+        tx.objectStore('meta').put(new Date().toISOString(), 'syncedAt');
+        return done(tx);
+    }
+
+    let syncing = null;
+
+    function sync() {
+        // One sync at a time; 'online' and page load can fire together
+        if (!syncing) {
+            syncing = (async () => {
+                const since = await meta('version');
+                const response = await fetch('/api/sync' + (since ? '?since=' + encodeURIComponent(since) : ''),
+                                             { credentials: 'same-origin' });
+                if (!response.ok) throw new Error('Sync failed: ' + response.status);
+                const delta = await response.json();
+                await apply(delta);
+                return delta;
+            })().finally(() => { syncing = null; });
+        }
+        return syncing;
+    }
+
+    async function records(entity) {
+        const db = await open();
+        return new Promise((resolve, reject) => {
+            const request = db.transaction(entity).objectStore(entity).getAll();
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async function showBanner() {
+        let banner = document.getElementById('offline-banner');
+        if (navigator.onLine) {
+            if (banner) banner.remove();
+            return;
+        }
+        if (!banner) {
+            banner = document.createElement('div');
+            banner.id = 'offline-banner';
+            banner.style.cssText = 'position:fixed;bottom:0;left:0;right:0;z-index:9999;padding:8px;' +
+                'background:#92400e;color:#fff;text-align:center;font:14px sans-serif';
+            document.body.appendChild(banner);
+        }
+        const syncedAt = await meta('syncedAt').catch(() => null);
+        banner.textContent = 'You are offline. Showing saved information' +
+            (syncedAt ? ' from ' + new Date(syncedAt).toLocaleString() : '') + '.';
+    }
+
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').catch((error) => console.error('Service worker:', error));
+    }
+    global.addEventListener('online', () => { showBanner(); sync().catch(console.error); });
+    global.addEventListener('offline', showBanner);
+    global.addEventListener('load', () => {
+        showBanner();
+        if (navigator.onLine) sync().catch(console.error);
+    });
+
+    global.OfflineSync = { sync, records, meta };
+})(window);
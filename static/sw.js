@@ -0,0 +1,81 @@
+// Offline service worker for the patient app (served as /sw.js, see static/offline_sync.js).
+//
+// Patient pages are network-first with a short timeout and fall back to the
+// last copy that loaded; static assets are served from cache and refreshed in
+// the background. /api/sync and everything else always goes to the network.
+// Logging out sends Clear-Site-Data, which wipes these caches.
+const PAGE_CACHE = 'patient-pages-v1';
+const ASSET_CACHE = 'patient-assets-v1';
+const OFFLINE_PAGES = ['/patient_dashboard', '/patient_appointments'];
+const NETWORK_TIMEOUT_MS = 4000;
+const ASSET_HOSTS = ['cdn.tailwindcss.com', 'cdn.socket.io', 'cdnjs.cloudflare.com'];
+
+self.addEventListener('install', () => self.skipWaiting());
+
+self.addEventListener('activate', (event) => {
+    event.waitUntil((async () => {
+        const keep = [PAGE_CACHE, ASSET_CACHE];
+        for (const key of await caches.keys()) {
+            if (!keep.includes(key)) await caches.delete(key);
+        }
+        await self.clients.claim();
+    })());
+});
+
+function offlinePage() {
+    return new Response(
+        '<!doctype html><meta name="viewport" content="width=device-width">' +
+        '<title>Offline</title><p style="font-family:sans-serif;padding:2em">' +
+        'You are offline and this page has not been saved yet. It will be available offline after you open it once with a connection.</p>',
+        { status: 503, headers: { 'Content-Type': 'text/html; charset=utf-8' } });
+}
+
+async function networkFirst(request) {
+    const cache = await caches.open(PAGE_CACHE);
+    const network = fetch(request).then((response) => {
+        // Never store the login redirect in place of the page
+        if (response.ok && !response.redirected) cache.put(request, response.clone());
+        return response;
+    });
+    const timeout = new Promise((resolve) => setTimeout(resolve, NETWORK_TIMEOUT_MS));
+    try {
+        const response = await Promise.race([network, timeout]);
+        if (response) return response;
+    } catch (error) {
+        // Offline: fall through to the cache
+    }
+    const cached = await cache.match(request);
+    if (cached) return cached;
+    try {
+        return await network;
+    } catch (error) {
+        return offlinePage();
+    }
+}
+
+async function staleWhileRevalidate(event) {
+    const cache = await caches.open(ASSET_CACHE);
+    const cached = await cache.match(event.request);
+    const refresh = fetch(event.request).then((response) => {
+        if (response.ok || response.type === 'opaque') cache.put(event.request, response.clone());
+        return response;
+    });
+    if (cached) {
+        event.waitUntil(refresh.catch(() => {}));
+        return cached;
+    }
+    return refresh;
+}
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') return;
+    const url = new URL(request.url);
+
+    if (request.mode === 'navigate' && url.origin === self.location.origin && OFFLINE_PAGES.includes(url.pathname)) {
+        event.respondWith(networkFirst(request));
+    } else if ((url.origin === self.location.origin && url.pathname.startsWith('/static/')) ||
+               ASSET_HOSTS.includes(url.hostname)) {
+        event.respondWith(staleWhileRevalidate(event));
+    }
+});
@@ -0,0 +1,188 @@
+"""
+Delta sync for the offline patient app.
+
+Triggers on appointments, prescriptions, health_records and notifications
+append (user, entity, id, transaction id) rows to sync_changes. A client
+sends back the version token from its previous sync and gets only the rows
+changed since then, plus the ids of rows that were deleted (or reassigned
+away from it). The token is the oldest transaction still running when the
+previous sync read the log, so changes that committed late are never
+skipped; a few rows may be sent twice, which clients handle by upserting
+by id. Tokens older than SYNC_RETENTION_DAYS (the change log is pruned
+after that) get a full snapshot with "reset": true.
+"""
+
+import logging
+import os
+import time
+from datetime import date, datetime, time as time_of_day
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.environ.get('SYNC_RETENTION_DAYS', 30))
+FULL_SYNC_LIMIT = int(os.environ.get('SYNC_FULL_LIMIT', 500))
+PRUNE_INTERVAL = 24 * 3600
+
+# entity -> owner column, and the query returning the client's rows (%s = user id)
+ENTITIES = {
+    'appointments': ('patient_id', """
+        SELECT a.*, u.name AS doctor_name, u.specialist
+        FROM appointments a
+        JOIN users u ON a.doctor_id = u.id
+        WHERE a.patient_id = %s
+    """, 'a'),
+    'prescriptions': ('patient_id', """
+        SELECT p.id, p.patient_id, p.doctor_id, p.medicines, p.instructions, p.diagnosis, p.date, p.status,
+               u.name AS doctor_name
+        FROM prescriptions p
+        JOIN users u ON p.doctor_id = u.id
+        WHERE p.patient_id = %s
+    """, 'p'),
+    'health_records': ('patient_id', """
+        SELECT h.id, h.patient_id, h.doctor_id, h.record_type, h.description, h.date
+        FROM health_records h
+        WHERE h.patient_id = %s
+    """, 'h'),
+    'notifications': ('user_id', """
+        SELECT n.*
+        FROM notifications n
+        WHERE n.user_id = %s
+    """, 'n'),
+}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sync_changes (
+        id BIGSERIAL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        entity VARCHAR(30) NOT NULL,
+        entity_id INTEGER NOT NULL,
+        txid BIGINT NOT NULL DEFAULT txid_current(),
+        changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_sync_changes_user_txid ON sync_changes(user_id, txid);
+    CREATE INDEX IF NOT EXISTS idx_sync_changes_changed_at ON sync_changes(changed_at);
+
+    -- TG_ARGV: owner column, entity name (TG_TABLE_NAME would be the partition's name)
+    CREATE OR REPLACE FUNCTION log_sync_change() RETURNS trigger AS $$
+    DECLARE
+        old_owner TEXT;
+        new_owner TEXT;
+    BEGIN
+        IF TG_OP <> 'INSERT' THEN
+            old_owner := to_jsonb(OLD) ->> TG_ARGV[0];
+            INSERT INTO sync_changes (user_id, entity, entity_id)
+            VALUES (old_owner::INTEGER, TG_ARGV[1], (to_jsonb(OLD) ->> 'id')::INTEGER);
+        END IF;
+        IF TG_OP <> 'DELETE' THEN
+            new_owner := to_jsonb(NEW) ->> TG_ARGV[0];
+            IF new_owner IS DISTINCT FROM old_owner THEN
+                INSERT INTO sync_changes (user_id, entity, entity_id)
+                VALUES (new_owner::INTEGER, TG_ARGV[1], (to_jsonb(NEW) ->> 'id')::INTEGER);
+            END IF;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+"""
+
+
+def create_schema(cursor):
+    """Create the change log and attach its triggers (idempotent)"""
+    cursor.execute(SCHEMA)
+    for entity, (owner, _, _) in ENTITIES.items():
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS present", (entity,))
+        if not cursor.fetchone()['present']:
+            logger.warning(f"⚠️ {entity} does not exist yet; its changes will not be synced")
+            continue
+        cursor.execute(f"DROP TRIGGER IF EXISTS {entity}_sync_change ON {entity}")
+        cursor.execute(f"""
+            CREATE TRIGGER {entity}_sync_change
+            AFTER INSERT OR UPDATE OR DELETE ON {entity}
+            FOR EACH ROW EXECUTE PROCEDURE log_sync_change('{owner}', '{entity}')
+        """)
+
+
+def make_token(xmin):
+    return f"{xmin}.{int(time.time())}"
+
+
+def parse_token(token):
+    """Transaction id from a client token, or None if it is missing, malformed or too old"""
+    try:
+        xmin, issued = (int(part) for part in token.split('.'))
+    except (AttributeError, ValueError):
+        return None
+    if time.time() - issued > RETENTION_DAYS * 86400:
+        return None
+    return xmin
+
+
+def _jsonable(row):
+    out = {}
+    for key, value in row.items():
+        if isinstance(value, (datetime, date, time_of_day)):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = float(value)
+        out[key] = value
+    return out
+
+
+def changes(cursor, user_id, token=None, entities=None):
+    """Rows changed for a user since token: {'version', 'reset', 'changes', 'deleted'}"""
+    entities = [e for e in (entities or ENTITIES) if e in ENTITIES]
+    since = parse_token(token)
+
+    # Read the horizon first: anything committing after this is picked up next time
+    cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()) AS xmin")
+    version = make_token(cursor.fetchone()['xmin'])
+
+    result = {'version': version, 'reset': since is None, 'changes': {}, 'deleted': {}}
+    for entity in entities:
+        _, query, alias = ENTITIES[entity]
+        if since is None:
+            cursor.execute(f"{query} ORDER BY {alias}.id DESC LIMIT %s", (user_id, FULL_SYNC_LIMIT))
+            result['changes'][entity] = [_jsonable(row) for row in cursor.fetchall()]
+            continue
+
+        cursor.execute("""
+            SELECT DISTINCT entity_id FROM sync_changes
+            WHERE user_id = %s AND entity = %s AND txid >= %s
+        """, (user_id, entity, since))
+        ids = [row['entity_id'] for row in cursor.fetchall()]
+        if not ids:
+            continue
+        cursor.execute(f"{query} AND {alias}.id = ANY(%s)", (user_id, ids))
+        rows = [_jsonable(row) for row in cursor.fetchall()]
+        present = {row['id'] for row in rows}
+        if rows:
+            result['changes'][entity] = rows
+        gone = [i for i in ids if i not in present]
+        if gone:
+            result['deleted'][entity] = gone
+    return result
+
+
+def prune(cursor):
+    cursor.execute("DELETE FROM sync_changes WHERE changed_at < CURRENT_TIMESTAMP - make_interval(days => %s)",
+                   (RETENTION_DAYS,))
+    return cursor.rowcount
+
+
+def prune_loop(get_connection, sleep=time.sleep):
+    """Background task: drop change-log rows no valid token can ask for any more"""
+    while True:
+        conn = get_connection()
+        if conn:
+            try:
+                cursor = conn.cursor()
+                removed = prune(cursor)
+                cursor.close()
+                if removed:
+                    logger.info(f"🧹 Pruned {removed} sync change-log rows")
+            except Exception as e:
+                logger.warning(f"Sync change-log pruning failed: {e}")
+            finally:
+                conn.close()
+        sleep(PRUNE_INTERVAL)
@@ -0,0 +1,139 @@
+"""
+Template rendering caches and render-time metrics.
+
+- Compiled templates are stored as bytecode in TEMPLATE_BYTECODE_DIR, so a
+  fresh worker loads them without parsing the large page templates again;
+  scripts/compile_templates.py fills the directory at build time. Jinja
+  keys each entry by a checksum of the template source, so edited
+  templates are recompiled automatically.
+- {% cache 'name' %}...{% endcache %} keeps the rendered HTML of a section
+  that only depends on the language (extra key values can follow the name).
+- render_page() serves whole pages with no per-user content from memory
+  and answers repeat visits with 304 Not Modified.
+
+Cache keys include DEPLOY_VERSION (the deployed commit, or a fingerprint
+of the templates), so a deploy never serves HTML from the previous one,
+in memory or in the browser. Nothing is cached while Flask auto-reloads
+templates (debug mode).
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, make_response, render_template, request
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+import i18n
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BYTECODE_DIR = os.environ.get('TEMPLATE_BYTECODE_DIR',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), '.template_cache'))
+FRAGMENT_CACHE_SIZE = int(os.environ.get('TEMPLATE_FRAGMENT_CACHE_SIZE', 500))
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+def _templates_fingerprint():
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(TEMPLATES_DIR)):
+        stat = os.stat(os.path.join(TEMPLATES_DIR, name))
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+DEPLOY_VERSION = (os.environ.get('RENDER_GIT_COMMIT') or os.environ.get('APP_VERSION')
+                  or _templates_fingerprint())[:12]
+
+_pages = {}
+_fragments = OrderedDict()
+_lock = threading.Lock()
+
+
+def _caching(environment):
+    return not environment.auto_reload
+
+
+class FragmentCacheExtension(Extension):
+    """{% cache 'name' [, key...] %} ... {% endcache %}: rendered once per language, name and key"""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        call = self.call_method('_render_fragment', [nodes.Const(parser.name), nodes.List(key)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render_fragment(self, template_name, key, caller):
+        if not _caching(self.environment):
+            return caller()
+        cache_key = (template_name, tuple(str(k) for k in key), i18n.get_language(), DEPLOY_VERSION)
+        with _lock:
+            html = _fragments.get(cache_key)
+            if html is not None:
+                _fragments.move_to_end(cache_key)
+                return html
+        html = caller()
+        with _lock:
+            _fragments[cache_key] = html
+            while len(_fragments) > FRAGMENT_CACHE_SIZE:
+                _fragments.popitem(last=False)
+        return html
+
+
+def render_page(template_name):
+    """Response for a page whose HTML depends only on the language; rendered once per (page, language)"""
+    language = i18n.get_language()
+    if not _caching(current_app.jinja_env):
+        return render_template(template_name)
+    key = (template_name, language)
+    page = _pages.get(key)
+    if page is None:
+        html = render_template(template_name)
+        etag = hashlib.sha1(f"{DEPLOY_VERSION}:{template_name}:{language}".encode()).hexdigest()[:20]
+        page = _pages[key] = (html, etag)
+    response = make_response(page[0])
+    response.set_etag(page[1])
+    # Browsers revalidate on every visit; the ETag changes with each deploy
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+class _TimedTemplate:
+    """Mixin for the environment's template class: records each top-level render in metrics"""
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            metrics.TEMPLATE_RENDER_TIME.observe((self.name or '<string>',), time.perf_counter() - start)
+
+
+def precompile(app):
+    """Compile every template into the bytecode cache; returns the number of templates"""
+    names = app.jinja_env.list_templates(extensions=('html',))
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+
+def init_app(app):
+    env = app.jinja_env
+    env.add_extension(FragmentCacheExtension)
+    env.template_class = type('TimedTemplate', (_TimedTemplate, env.template_class), {})
+    try:
+        os.makedirs(BYTECODE_DIR, exist_ok=True)
+        env.bytecode_cache = FileSystemBytecodeCache(BYTECODE_DIR)
+    except OSError as e:
+        logger.warning(f"⚠️ Template bytecode cache disabled ({BYTECODE_DIR}): {e}")
+    logger.info(f"🧩 Template caches ready (deploy {DEPLOY_VERSION})")